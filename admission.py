@@ -0,0 +1,175 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+from metrics import ADMISSION_REJECTED, STAGE_SECONDS
+
+# 優先權：數字越小越優先
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BACKGROUND = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_NORMAL: "normal",
+    PRIORITY_BACKGROUND: "background",
+}
+
+
+class AdmissionRejected(Exception):
+    """LLM 閘道忙碌，請求未被接受"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"LLM 請求被拒絕: {reason}")
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "future", "cancelled")
+
+    def __init__(self, priority: int, seq: int, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.future = future
+        self.cancelled = False
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AdmissionController:
+    """限制同時送往 LLM 閘道的請求數，並以有上限的優先權佇列等待"""
+
+    def __init__(self, max_concurrency: int, max_queue: int, max_wait: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._active = 0
+        self._waiters: List[_Waiter] = []
+        self._queued = 0
+        self._seq = itertools.count()
+        # 以 slot() 執行中的名額開始時間，用來估計各名額還要多久才會空出
+        self._running: Dict[int, float] = {}
+        # 每個請求佔用時間的移動平均，用來估計排隊時間
+        self._avg_service_time: Optional[float] = None
+        self.stats: Dict[str, int] = {"admitted": 0, "queued": 0, "rejected": 0}
+
+    def snapshot(self) -> Dict:
+        return {
+            **self.stats,
+            "active": self._active,
+            "waiting": self._queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "avg_service_time": round(self._avg_service_time, 2) if self._avg_service_time else None,
+        }
+
+    def estimated_wait(self, position: int) -> float:
+        """排在第 position 位（0 起算）時的預估等待秒數：依執行中名額的剩餘時間依序分配"""
+        if not self._avg_service_time:
+            return 0.0
+        now = time.monotonic()
+        # 各名額預估空出的時間；未經 slot() 記錄開始時間的名額視為剛開始
+        free_at = [max(self._avg_service_time - (now - start), 0.0) for start in self._running.values()]
+        free_at += [self._avg_service_time] * (self._active - len(free_at))
+        free_at += [0.0] * (self.max_concurrency - len(free_at))
+        heapq.heapify(free_at)
+        for _ in range(position):
+            heapq.heappush(free_at, heapq.heappop(free_at) + self._avg_service_time)
+        return free_at[0]
+
+    def _reject(self, reason: str, priority: int):
+        self.stats["rejected"] += 1
+        ADMISSION_REJECTED.inc(reason=reason, priority=PRIORITY_NAMES.get(priority, priority))
+        print(f"🚦 LLM 請求被拒絕 ({reason}, 優先權 {PRIORITY_NAMES.get(priority, priority)})")
+        raise AdmissionRejected(reason)
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL, deadline: Optional[float] = None):
+        """取得一個執行名額；deadline 為 time.monotonic() 的絕對時間"""
+        if self._active < self.max_concurrency and self._queued == 0:
+            self._active += 1
+            self.stats["admitted"] += 1
+            return
+
+        now = time.monotonic()
+        limit = now + self.max_wait
+        if deadline is not None:
+            limit = min(limit, deadline)
+        remaining = limit - now
+
+        # 預估等待時間超過期限就直接拒絕，不佔用佇列
+        position = sum(1 for w in self._waiters if not w.cancelled and w.priority <= priority)
+        if remaining <= 0 or self.estimated_wait(position) > remaining:
+            self._reject("deadline", priority)
+
+        if self._queued >= self.max_queue:
+            # 佇列已滿：擠掉優先權更低的等待者，否則拒絕自己
+            victim = max((w for w in self._waiters if not w.cancelled), default=None)
+            if victim is None or victim.priority <= priority:
+                self._reject("queue_full", priority)
+            victim.cancelled = True
+            self._queued -= 1
+            self.stats["rejected"] += 1
+            ADMISSION_REJECTED.inc(reason="preempted", priority=PRIORITY_NAMES.get(victim.priority, victim.priority))
+            victim.future.set_exception(AdmissionRejected("preempted"))
+
+        waiter = _Waiter(priority, next(self._seq), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._waiters, waiter)
+        self._queued += 1
+        self.stats["queued"] += 1
+
+        try:
+            await asyncio.wait({waiter.future}, timeout=remaining)
+        except BaseException:
+            # 呼叫端被取消：已取得名額就還回去，否則退出佇列
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                self.release()
+            elif not waiter.cancelled:
+                waiter.cancelled = True
+                self._queued -= 1
+            raise
+        finally:
+            STAGE_SECONDS.observe(time.monotonic() - now, stage="llm_queue_wait")
+
+        if not waiter.future.done():
+            waiter.cancelled = True
+            self._queued -= 1
+            waiter.future.cancel()
+            self._reject("deadline", priority)
+
+        # 被擠出佇列時拋出 AdmissionRejected
+        waiter.future.result()
+        self.stats["admitted"] += 1
+
+    def release(self, service_time: Optional[float] = None):
+        """歸還名額，並交給佇列中優先權最高的等待者"""
+        if service_time is not None:
+            if self._avg_service_time is None:
+                self._avg_service_time = service_time
+            else:
+                self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * service_time
+
+        while self._waiters:
+            waiter = heapq.heappop(self._waiters)
+            if waiter.cancelled:
+                continue
+            # 名額直接轉交，_active 不變
+            self._queued -= 1
+            waiter.future.set_result(None)
+            return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_NORMAL, deadline: Optional[float] = None):
+        await self.acquire(priority, deadline)
+        start = time.monotonic()
+        token = next(self._seq)
+        self._running[token] = start
+        try:
+            yield
+        finally:
+            del self._running[token]
+            self.release(time.monotonic() - start)
@@ -1,17 +1,59 @@
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends
+from fastapi import Request as HTTPRequest
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
-import requests
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
 
-from schemas import Request
+from schemas import BatchRequest, Request
+from payloads import PayloadCache
 from recommender import Recommender
-from config import LAB_MODEL,GOOGLE_MAPS_API_KEY,LAB_OLLAMA_API
+from warmup import QueryLog, Warmup
+from admission import PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BACKGROUND
+from resilience import Deadline
+from cache import CACHE_MAINTENANCE_INTERVAL, cache_partition, normalize_location
+from db import write_queue
+from metrics import REQUEST_SECONDS, STARTUP_SECONDS, registry
+from config import LAB_MODEL,GOOGLE_MAPS_API_KEY,LAB_OLLAMA_API,REFRESH_RETRY_DELAY,REQUEST_DEADLINE,STARTUP_READY_WAIT
+from config import STARTUP_INIT_ATTEMPTS,STARTUP_RETRY_BACKOFF
+
+# 量測啟動時間的起點
+MODULE_LOADED_AT = time.monotonic()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """啟動時只排入背景初始化，埠號可立即開始接受連線；關閉時寫回快取並關閉連線池"""
+    app.state.init_task = asyncio.create_task(_initialize())
+    startup_stats["accepting_after_seconds"] = round(time.monotonic() - MODULE_LOADED_AT, 3)
+    STARTUP_SECONDS.observe(startup_stats["accepting_after_seconds"], phase="accepting")
+    yield
+    
+    if not app.state.init_task.done():
+        # 初始化在執行緒中進行，無法中斷，等它完成再關閉
+        await asyncio.wait({app.state.init_task})
+    for name in ("maintenance_task", "warmup_task", "health_task"):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
+    if recommender is not None:
+        recommender.cache.flush_access()
+        await run_in_threadpool(write_queue.flush)
+        await recommender.aclose()
+
 
 app = FastAPI(
-    title="附近吃吃推薦"
+    title="附近吃吃推薦",
+    lifespan=lifespan
 )
 
 # CORS 設定
@@ -24,8 +66,206 @@ app.add_middleware(
 )
 
 
-# 初始化
-recommender = Recommender()
+
+@app.middleware("http")
+async def record_latency(request: HTTPRequest, call_next):
+    """記錄端點的完整耗時（串流回應計算到最後一個位元組送出為止）"""
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    endpoint = getattr(route, "path", "unmatched")
+    body_iterator = response.body_iterator
+    
+    async def timed_body():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, status=response.status_code)
+    
+    response.body_iterator = timed_body()
+    return response
+
+
+# 延遲初始化的元件：由 lifespan 在背景建立，完成前請求由 wait_until_ready 等待
+recommender: Optional[Recommender] = None
+query_log: Optional[QueryLog] = None
+warmup: Optional[Warmup] = None
+startup_stats: Dict[str, Any] = {}
+# 快取命中時的回應位元組
+payloads = PayloadCache()
+
+
+def _build_components():
+    """建立推薦器與 SQLite 相關元件（在執行緒中執行，不阻塞事件迴圈）"""
+    global recommender, query_log, warmup
+    # 全部建立成功才公開，失敗重試時不會留下一半的元件
+    new_recommender = Recommender()
+    new_query_log = QueryLog()
+    recommender, query_log, warmup = new_recommender, new_query_log, Warmup(new_recommender, new_query_log)
+
+
+async def _initialize():
+    """初始化失敗時以指數退避重試；全部失敗則結束行程，交由 process supervisor 重新啟動"""
+    start = time.monotonic()
+    for attempt in range(1, STARTUP_INIT_ATTEMPTS + 1):
+        startup_stats["init_attempts"] = attempt
+        try:
+            await run_in_threadpool(_build_components)
+            break
+        except Exception as e:
+            startup_stats["last_init_error"] = f"{type(e).__name__}: {e}"
+            if attempt == STARTUP_INIT_ATTEMPTS:
+                print(f"❌ 初始化失敗 {attempt} 次，結束行程: {e}", flush=True)
+                # 以非零狀態碼結束，supervisor 才會視為失敗並重新啟動（元件尚未建立，沒有需要清理的狀態）
+                os._exit(1)
+            delay = STARTUP_RETRY_BACKOFF * 2 ** (attempt - 1)
+            print(f"❌ 初始化失敗 (第 {attempt} 次): {e}，{delay:.0f} 秒後重試")
+            await asyncio.sleep(delay)
+    startup_stats["init_seconds"] = round(time.monotonic() - start, 3)
+    startup_stats["ready_after_seconds"] = round(time.monotonic() - MODULE_LOADED_AT, 3)
+    STARTUP_SECONDS.observe(startup_stats["ready_after_seconds"], phase="ready")
+    print(f"✅ 初始化完成 (耗時 {startup_stats['init_seconds']} 秒)")
+    
+    app.state.maintenance_task = asyncio.create_task(cache_maintenance_loop())
+    app.state.warmup_task = asyncio.create_task(warmup.loop())
+    # 上游狀態由背景探測與實際請求結果維護，只供參考，不影響啟動與就緒
+    app.state.health_task = asyncio.create_task(recommender.health_monitor.run())
+
+
+async def wait_until_ready():
+    """元件初始化完成前最多等待 STARTUP_READY_WAIT 秒，逾時或初始化失敗回傳 503"""
+    task = app.state.init_task
+    if not task.done():
+        try:
+            await asyncio.wait_for(asyncio.shield(task), STARTUP_READY_WAIT)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="服務啟動中，請稍後再試")
+        except Exception:
+            pass
+    if task.cancelled() or task.exception() is not None:
+        raise HTTPException(status_code=503, detail="服務初始化失敗")
+
+# WebUI 內容不足時附加的補充說明
+WEBUI_EXTRA_CONTENT = """
+
+## 🔍 詳細補充分析
+
+### 📊 綜合評估指標
+1. **評分可靠性**：4.5星以上為優質選擇
+2. **評價數量**：100+評價較有參考價值
+3. **近期評論**：查看最近30天評價
+4. **照片真實性**：用戶上傳照片 vs 官方照片
+
+### 🎯 選擇策略
+- **追求品質**：優先選擇評分4.5+餐廳
+- **預算考量**：根據價格等級選擇
+- **時間安排**：避開用餐高峰時段
+- **特殊需求**：確認餐廳是否滿足特殊需求
+
+### 💡 實用小技巧
+1. **預約確認**：熱門時段建議提前1-2天預約
+2. **交通規劃**：使用Google Maps規劃最佳路線
+3. **備選方案**：準備1-2家備選餐廳
+4. **評價驗證**：查看多個平台的評價
+
+### ⚠️ 注意事項
+1. **營業時間**：部分餐廳可能有臨時店休
+2. **價格變動**：菜單價格可能調整
+3. **服務變化**：服務品質可能因時段而異
+4. **環境因素**：週末可能較為擁擠
+
+祝您用餐愉快！ 🍽️✨"""
+
+
+def _cache_mode(request: Request) -> str:
+    """請求對應的快取分區：片段模式、簡短回答與完整分析分開，快速模式可直接使用完整分析的快取"""
+    return cache_partition(request.mode, request.detail)
+
+
+def _wants_full(request: Request) -> bool:
+    """要求完整 AI 分析的請求，快取內容過短時重新產生"""
+    return request.mode == "llm" and request.detail == "full"
+
+
+def _padded(result: Dict) -> bool:
+    """內容過短時是否附加補充說明：brief / standard 本來就是簡短回答"""
+    return (result.get('metadata', {}).get('detail') or "full") == "full"
+
+
+# 背景重新產生中的任務（保留參照避免被回收，並避免同條件重複啟動）
+refresh_tasks: Dict[Tuple, asyncio.Task] = {}
+# 背景更新失敗的條件 -> 可再次嘗試的時間（monotonic）
+refresh_retry_at: Dict[Tuple, float] = {}
+
+
+def _refresh_in_background(search_keyword: str, request: Request, lat: float, lng: float):
+    """為過期快取啟動一次背景重新產生；同條件已在產生中或剛失敗則略過"""
+    # 快速模式讀到的是完整分析的快取，以完整分析更新
+    mode, detail = ("llm", "full") if request.mode == "fast" else (request.mode, request.detail)
+    key = recommender.shared_key(search_keyword, request.location, request.radius, request.max_results, mode, detail)
+    if key in refresh_tasks or recommender.inflight.in_flight(key):
+        return
+    if refresh_retry_at.get(key, 0) > time.monotonic():
+        return
+    
+    async def refresh():
+        succeeded = False
+        try:
+            print(f"♻️ 背景更新過期快取: {search_keyword} @ {request.location}")
+            result, shared = await recommender.get_recommendation_shared(
+                search_keyword, request.location, request.radius, request.max_results,
+                priority=PRIORITY_BACKGROUND, mode=mode,
+                keywords=recommender._extract_keywords(request.question), detail=detail
+            )
+            # 降級或失敗的結果不覆蓋原本過期但完整的內容
+            succeeded = recommender.cacheable(result)
+            if not shared and succeeded:
+                recommender.cache.set(
+                    search_keyword, request.location, lat, lng,
+                    request.radius, request.max_results, result,
+                    question=request.question
+                )
+        except Exception as e:
+            print(f"❌ 背景更新失敗: {e}")
+        if succeeded:
+            refresh_retry_at.pop(key, None)
+        else:
+            print(f"⚠️ 保留過期快取，{REFRESH_RETRY_DELAY:.0f} 秒後再嘗試更新: {search_keyword} @ {request.location}")
+            refresh_retry_at[key] = time.monotonic() + REFRESH_RETRY_DELAY
+    
+    refresh_tasks[key] = asyncio.create_task(refresh())
+    refresh_tasks[key].add_done_callback(lambda _: refresh_tasks.pop(key, None))
+
+
+# 背景更新營業狀態的任務
+place_refresh_tasks: Set[asyncio.Task] = set()
+
+
+def _refresh_places_in_background(place_ids: Tuple[str, ...]):
+    """快取命中但部分餐廳的營業狀態已過期：只更新這些欄位，不重新產生 AI 內容"""
+    async def refresh():
+        try:
+            await recommender.refresh_places(place_ids)
+        except Exception as e:
+            print(f"❌ 營業狀態更新失敗: {e}")
+    
+    task = asyncio.create_task(refresh())
+    place_refresh_tasks.add(task)
+    task.add_done_callback(place_refresh_tasks.discard)
+
+
+async def cache_maintenance_loop():
+    """定期清除過期快取並控制 cache.db 大小"""
+    interval = CACHE_MAINTENANCE_INTERVAL.total_seconds()
+    while True:
+        try:
+            await run_in_threadpool(recommender.cache.maintenance)
+            await run_in_threadpool(recommender.geocode_cache.purge_expired)
+            await run_in_threadpool(query_log.purge_expired)
+        except Exception as e:
+            print(f"❌ 快取維護失敗: {e}")
+        await asyncio.sleep(interval)
 
 
 # API 端點
@@ -41,24 +281,38 @@ async def root():
             "GET /": "API 資訊",
             "POST /api/recommend": "取得推薦",
             "POST /api/recommend_full": "取得完整推薦（WebUI專用）",
+            "POST /api/recommend_stream": "串流取得完整推薦（NDJSON）",
+            "POST /api/recommend_batch": "批次取得多個推薦，依完成順序串流（NDJSON）",
             "GET /api/health": "健康檢查",
+            "GET /api/live": "存活檢查（不依賴上游）",
+            "GET /api/ready": "就緒檢查（初始化完成後回傳 200）",
+            "GET /metrics": "Prometheus 監控指標",
             "GET /api/test_ai": "測試 AI 連接"
         }
     }
 
-@app.post("/api/recommend")
-async def get_recommendation(request: Request, background_tasks: BackgroundTasks):
+@app.post("/api/recommend", dependencies=[Depends(wait_until_ready)])
+async def get_recommendation(request: Request, background_tasks: BackgroundTasks, http_request: HTTPRequest):
     """取得推薦"""
     
     keywords = recommender._extract_keywords(request.question)
     search_keyword = keywords[0] if keywords else "餐廳"
     
-    # 檢查快取
-    cached_result = recommender.cache.get(search_keyword, request.location)
+    # 整個請求共用一個期限，各階段逾時都不超過剩餘時間
+    deadline = Deadline(REQUEST_DEADLINE)
+    
+    # 檢查快取（以座標格子、半徑級距與數量為鍵）
+    lat, lng = await recommender.locate(request.location, deadline)
+    query_log.record(search_keyword, request.location, request.question, lat, lng, request.radius, request.max_results)
+    cache_hit = recommender.cache.lookup(
+        search_keyword, lat, lng, request.radius, request.max_results,
+        question=request.question, mode=_cache_mode(request)
+    )
+    cached_result = cache_hit.data if cache_hit else None
     if cached_result:
         print(f"📦 使用快取結果")
-        # 檢查快取內容是否足夠詳細
-        if 'recommendation' in cached_result and len(cached_result['recommendation']) < 600:
+        # 檢查快取內容是否足夠詳細（快速模式直接使用）
+        if _wants_full(request) and 'recommendation' in cached_result and len(cached_result['recommendation']) < 600:
             print(f"⚠️ 快取內容較短，重新取得")
             cached_result = None
     
@@ -68,21 +322,32 @@ async def get_recommendation(request: Request, background_tasks: BackgroundTasks
             print(f"📍 位置: {request.location}")
             print(f"📏 範圍: {request.radius}m, 數量: {request.max_results}")
             
-            # 取得推薦
-            result = await recommender.get_recommendation(
+            # 取得推薦（相同條件的並行請求共用同一次生成）
+            result, shared = await recommender.get_recommendation_shared(
                 search_keyword,
                 request.location,
                 request.radius,
-                request.max_results
+                request.max_results,
+                priority=PRIORITY_NORMAL,
+                mode=request.mode,
+                deadline=deadline,
+                keywords=keywords,
+                detail=request.detail
             )
             
-            # 儲存到快取
-            background_tasks.add_task(
-                recommender.cache.set,
-                search_keyword,
-                request.location,
-                result
-            )
+            # 儲存到快取（只由實際執行的請求寫入，快速推薦不快取）
+            if not shared and recommender.cacheable(result):
+                background_tasks.add_task(
+                    recommender.cache.set,
+                    search_keyword,
+                    request.location,
+                    lat,
+                    lng,
+                    request.radius,
+                    request.max_results,
+                    result,
+                    question=request.question
+                )
             
             return {
                 "source": "fresh",
@@ -95,14 +360,26 @@ async def get_recommendation(request: Request, background_tasks: BackgroundTasks
             print(f"❌ 推薦錯誤: {e}")
             raise HTTPException(status_code=500, detail=f"推薦服務錯誤: {str(e)}")
     
-    return {
-        "source": "cache",
-        "cached_at": cached_result.get("timestamp"),
-        **cached_result
-    }
+    # 過期內容先回傳，同時在背景重新產生
+    if cache_hit.stale:
+        _refresh_in_background(search_keyword, request, lat, lng)
+    if cache_hit.stale_places:
+        _refresh_places_in_background(cache_hit.stale_places)
+    
+    # 相同內容只編碼、壓縮一次，之後直接送出位元組
+    return payloads.respond(
+        payloads.key("recommend", cache_hit.query_hash, cache_hit.stale, cached_result),
+        lambda: {
+            "source": "cache",
+            "cached_at": cached_result.get("timestamp"),
+            "stale": cache_hit.stale,
+            **cached_result
+        },
+        http_request.headers.get("accept-encoding", "")
+    )
 
-@app.post("/api/recommend_full")
-async def get_recommendation_full(request: Request, background_tasks: BackgroundTasks):
+@app.post("/api/recommend_full", dependencies=[Depends(wait_until_ready)])
+async def get_recommendation_full(request: Request, background_tasks: BackgroundTasks, http_request: HTTPRequest):
     """取得完整推薦 - 專為 WebUI 設計，確保顯示完整內容"""
     
     print(f"\n" + "="*60)
@@ -112,8 +389,17 @@ async def get_recommendation_full(request: Request, background_tasks: Background
     keywords = recommender._extract_keywords(request.question)
     search_keyword = keywords[0] if keywords else "餐廳"
     
-    # 檢查快取
-    cached_result = recommender.cache.get(search_keyword, request.location)
+    # 整個請求共用一個期限，各階段逾時都不超過剩餘時間
+    deadline = Deadline(REQUEST_DEADLINE)
+    
+    # 檢查快取（以座標格子、半徑級距與數量為鍵）
+    lat, lng = await recommender.locate(request.location, deadline)
+    query_log.record(search_keyword, request.location, request.question, lat, lng, request.radius, request.max_results)
+    cache_hit = recommender.cache.lookup(
+        search_keyword, lat, lng, request.radius, request.max_results,
+        question=request.question, mode=_cache_mode(request)
+    )
+    cached_result = cache_hit.data if cache_hit else None
     
     # 強制重新取得，確保內容完整
     if cached_result:
@@ -121,8 +407,8 @@ async def get_recommendation_full(request: Request, background_tasks: Background
         rec_length = cached_result.get('recommendation_length', 0) if 'recommendation_length' in cached_result else len(cached_result.get('recommendation', ''))
         print(f"📦 快取內容長度: {rec_length}")
         
-        # 如果內容不夠詳細，重新取得
-        if rec_length < 1000:
+        # 如果內容不夠詳細，重新取得（快速模式直接使用）
+        if _wants_full(request) and rec_length < 1000:
             print(f"⚠️ 快取內容可能不夠詳細，重新取得")
             cached_result = None
         else:
@@ -132,114 +418,335 @@ async def get_recommendation_full(request: Request, background_tasks: Background
         try:
             print(f"🔄 處理新請求")
             
-            # 取得推薦
-            result = await recommender.get_recommendation(
+            # 取得推薦（相同條件的並行請求共用同一次生成）
+            result, shared = await recommender.get_recommendation_shared(
                 search_keyword,
                 request.location,
                 request.radius,
-                request.max_results
+                request.max_results,
+                priority=PRIORITY_INTERACTIVE,
+                mode=request.mode,
+                deadline=deadline,
+                keywords=keywords,
+                detail=request.detail
             )
             
-            # 儲存到快取
-            background_tasks.add_task(
-                recommender.cache.set,
-                search_keyword,
-                request.location,
-                result
-            )
+            # 儲存到快取（只由實際執行的請求寫入，快速推薦不快取）
+            if not shared and recommender.cacheable(result):
+                background_tasks.add_task(
+                    recommender.cache.set,
+                    search_keyword,
+                    request.location,
+                    lat,
+                    lng,
+                    request.radius,
+                    request.max_results,
+                    result,
+                    question=request.question
+                )
             
             response_data = {
                 "source": "fresh",
                 **result
             }
             
+        except HTTPException:
+            raise
         except Exception as e:
             print(f"❌ 推薦錯誤: {e}")
             raise HTTPException(status_code=500, detail=f"推薦服務錯誤: {str(e)}")
     else:
-        response_data = {
-            "source": "cache",
-            "cached_at": cached_result.get("timestamp"),
-            **cached_result
-        }
+        # 過期內容先回傳，同時在背景重新產生
+        if cache_hit.stale:
+            _refresh_in_background(search_keyword, request, lat, lng)
+        if cache_hit.stale_places:
+            _refresh_places_in_background(cache_hit.stale_places)
+        
+        print(f"📤 返回快取的完整推薦內容")
+        return payloads.respond(
+            payloads.key("recommend_full", cache_hit.query_hash, cache_hit.stale, cached_result),
+            lambda: _webui_response({
+                "source": "cache",
+                "cached_at": cached_result.get("timestamp"),
+                "stale": cache_hit.stale,
+                **cached_result
+            }),
+            http_request.headers.get("accept-encoding", "")
+        )
+    
+    response_data = _webui_response(response_data)
+    print(f"\n📤 返回完整推薦內容")
+    print(f"   - 總長度: {len(response_data.get('recommendation', ''))} 字元")
+    print(f"   - 餐廳數量: {len(response_data.get('restaurants', []))}")
+    print(f"="*60)
     
-    # 為 WebUI 優化 - 確保結構正確
+    return response_data
+
+
+def _webui_response(response_data: Dict) -> Dict:
+    """為 WebUI 優化 - 確保結構正確"""
     recommendation = response_data.get('recommendation', '')
     
-    # 如果內容不足，添加更多詳細建議
-    if len(recommendation) < 500:
+    # 如果內容不足，添加更多詳細建議（簡短回答不補充）
+    if _padded(response_data) and len(recommendation) < 500:
         print(f"⚠️ 內容可能不夠詳細 ({len(recommendation)} 字)，添加補充")
         
-        extra_content = """
-
-## 🔍 詳細補充分析
-
-### 📊 綜合評估指標
-1. **評分可靠性**：4.5星以上為優質選擇
-2. **評價數量**：100+評價較有參考價值
-3. **近期評論**：查看最近30天評價
-4. **照片真實性**：用戶上傳照片 vs 官方照片
+        extra_content = WEBUI_EXTRA_CONTENT
+        
+        response_data['recommendation'] = recommendation + extra_content
+        # 複製 metadata，避免修改到合併請求間共享的結果
+        response_data['metadata'] = {
+            **response_data['metadata'],
+            'recommendation_length': len(response_data['recommendation'])
+        }
+        print(f"📝 補充後總長度: {len(response_data['recommendation'])} 字元")
+    
+    return response_data
 
-### 🎯 選擇策略
-- **追求品質**：優先選擇評分4.5+餐廳
-- **預算考量**：根據價格等級選擇
-- **時間安排**：避開用餐高峰時段
-- **特殊需求**：確認餐廳是否滿足特殊需求
+@app.post("/api/recommend_stream", dependencies=[Depends(wait_until_ready)])
+async def get_recommendation_stream(request: Request):
+    """串流取得完整推薦 - 搜尋完成即送出餐廳列表，再逐段轉送 AI 內容（NDJSON）"""
+    
+    keywords = recommender._extract_keywords(request.question)
+    search_keyword = keywords[0] if keywords else "餐廳"
+    
+    deadline = Deadline(REQUEST_DEADLINE)
+    lat, lng = await recommender.locate(request.location, deadline)
+    query_log.record(search_keyword, request.location, request.question, lat, lng, request.radius, request.max_results)
+    cache_hit = recommender.cache.lookup(
+        search_keyword, lat, lng, request.radius, request.max_results,
+        question=request.question, mode=_cache_mode(request)
+    )
+    cached_result = cache_hit.data if cache_hit else None
+    if cached_result and _wants_full(request) and len(cached_result.get('recommendation', '')) < 1000:
+        print(f"⚠️ 快取內容可能不夠詳細，重新取得")
+        cached_result = None
+    
+    if cached_result:
+        print(f"📦 串流回傳快取內容")
+        if cache_hit.stale:
+            _refresh_in_background(search_keyword, request, lat, lng)
+        if cache_hit.stale_places:
+            _refresh_places_in_background(cache_hit.stale_places)
+        return StreamingResponse(
+            _ndjson(_cached_events(cached_result, cache_hit.stale)),
+            media_type="application/x-ndjson"
+        )
+    
+    print(f"🔄 處理新串流請求: {request.question}")
+    events = recommender.stream_recommendation(
+        search_keyword,
+        request.location,
+        request.radius,
+        request.max_results,
+        priority=PRIORITY_INTERACTIVE,
+        mode=request.mode,
+        deadline=deadline,
+        keywords=keywords,
+        detail=request.detail
+    )
+    
+    # 先完成 Maps 搜尋，讓找不到地點/餐廳的錯誤仍以 HTTP 狀態碼回傳
+    try:
+        first_event = await events.__anext__()
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ 推薦錯誤: {e}")
+        raise HTTPException(status_code=500, detail=f"推薦服務錯誤: {str(e)}")
+    
+    async def fresh_events():
+        yield first_event
+        async for event in events:
+            if event["type"] == "done":
+                result = event["result"]
+                recommendation = result.get('recommendation', '')
+                if _padded(result) and len(recommendation) < 500:
+                    yield {"type": "token", "text": WEBUI_EXTRA_CONTENT}
+                    result['recommendation'] = recommendation + WEBUI_EXTRA_CONTENT
+                    result['metadata']['recommendation_length'] = len(result['recommendation'])
+                
+                # 完整結果組合完成後寫入快取（快速推薦不快取）
+                if recommender.cacheable(result):
+                    recommender.cache.set(
+                        search_keyword, request.location, lat, lng,
+                        request.radius, request.max_results, result,
+                        question=request.question
+                    )
+                yield {"type": "done", "source": "fresh", **result}
+            else:
+                yield event
+    
+    return StreamingResponse(_ndjson(fresh_events()), media_type="application/x-ndjson")
 
-### 💡 實用小技巧
-1. **預約確認**：熱門時段建議提前1-2天預約
-2. **交通規劃**：使用Google Maps規劃最佳路線
-3. **備選方案**：準備1-2家備選餐廳
-4. **評價驗證**：查看多個平台的評價
 
-### ⚠️ 注意事項
-1. **營業時間**：部分餐廳可能有臨時店休
-2. **價格變動**：菜單價格可能調整
-3. **服務變化**：服務品質可能因時段而異
-4. **環境因素**：週末可能較為擁擠
-
-祝您用餐愉快！ 🍽️✨"""
+@app.post("/api/recommend_batch", dependencies=[Depends(wait_until_ready)])
+async def get_recommendation_batch(batch: BatchRequest, background_tasks: BackgroundTasks):
+    """批次取得推薦：相同地點與搜尋只執行一次，快取命中立即送出，其餘並行產生並依完成順序串流（NDJSON）"""
+    start = time.time()
+    deadline = Deadline(REQUEST_DEADLINE)
+    items = batch.items
+    print(f"📚 批次請求: {len(items)} 項")
+    
+    # 相同地點（以正規化後的字串判斷）只查詢一次座標
+    locations = {}
+    for item in items:
+        locations.setdefault(normalize_location(item.location), item.location)
+    located = await asyncio.gather(
+        *(recommender.locate(location, deadline) for location in locations.values()), return_exceptions=True
+    )
+    coordinates = dict(zip(locations, located))
+    
+    async def generate(index: int, request: Request, keywords, search_keyword: str, lat: float, lng: float) -> Dict:
+        try:
+            result, shared = await recommender.get_recommendation_shared(
+                search_keyword, request.location, request.radius, request.max_results,
+                priority=PRIORITY_NORMAL, mode=request.mode, deadline=deadline, keywords=keywords,
+                detail=request.detail
+            )
+        except HTTPException as e:
+            return {"type": "item", "index": index, "status": e.status_code, "detail": e.detail}
+        except Exception as e:
+            print(f"❌ 批次項目 {index} 錯誤: {e}")
+            return {"type": "item", "index": index, "status": 500, "detail": f"推薦服務錯誤: {str(e)}"}
         
-        response_data['recommendation'] = recommendation + extra_content
-        response_data['metadata']['recommendation_length'] = len(response_data['recommendation'])
-        print(f"📝 補充後總長度: {len(response_data['recommendation'])} 字元")
+        if not shared and recommender.cacheable(result):
+            background_tasks.add_task(
+                recommender.cache.set, search_keyword, request.location, lat, lng,
+                request.radius, request.max_results, result, question=request.question
+            )
+        return {"type": "item", "index": index, "status": 200, "source": "fresh", **result}
     
-    print(f"\n📤 返回完整推薦內容")
-    print(f"   - 總長度: {len(response_data.get('recommendation', ''))} 字元")
-    print(f"   - 餐廳數量: {len(response_data.get('restaurants', []))}")
-    print(f"="*60)
+    async def events() -> AsyncIterator[Dict]:
+        pending = []
+        cached = 0
+        for index, request in enumerate(items):
+            location = coordinates[normalize_location(request.location)]
+            if isinstance(location, HTTPException):
+                yield {"type": "item", "index": index, "status": location.status_code, "detail": location.detail}
+                continue
+            if isinstance(location, BaseException):
+                yield {"type": "item", "index": index, "status": 500, "detail": f"推薦服務錯誤: {str(location)}"}
+                continue
+            
+            lat, lng = location
+            keywords = recommender._extract_keywords(request.question)
+            search_keyword = keywords[0] if keywords else "餐廳"
+            query_log.record(search_keyword, request.location, request.question, lat, lng, request.radius, request.max_results)
+            cache_hit = recommender.cache.lookup(
+                search_keyword, lat, lng, request.radius, request.max_results,
+                question=request.question, mode=_cache_mode(request)
+            )
+            cached_result = cache_hit.data if cache_hit else None
+            if cached_result and _wants_full(request) and len(cached_result.get('recommendation', '')) < 600:
+                cached_result = None
+            
+            if cached_result:
+                cached += 1
+                if cache_hit.stale:
+                    _refresh_in_background(search_keyword, request, lat, lng)
+                if cache_hit.stale_places:
+                    _refresh_places_in_background(cache_hit.stale_places)
+                yield {
+                    "type": "item", "index": index, "status": 200, "source": "cache",
+                    "cached_at": cached_result.get("timestamp"), "stale": cache_hit.stale,
+                    **cached_result
+                }
+            else:
+                # 未命中的項目並行產生，LLM 並行數由 admission control 限制
+                pending.append(asyncio.create_task(generate(index, request, keywords, search_keyword, lat, lng)))
+        
+        try:
+            for next_done in asyncio.as_completed(pending):
+                yield await next_done
+        finally:
+            # 用戶端中途斷線時不再等待其餘項目
+            for task in pending:
+                task.cancel()
+        
+        print(f"📚 批次完成: {len(items)} 項（快取 {cached} 項），耗時 {time.time() - start:.1f} 秒")
+        yield {"type": "done", "count": len(items), "cached": cached, "total_time": round(time.time() - start, 2)}
     
-    return response_data
+    return StreamingResponse(_ndjson(events()), media_type="application/x-ndjson", background=background_tasks)
+
+async def _cached_events(cached_result: Dict, stale: bool = False) -> AsyncIterator[Dict]:
+    """將快取結果轉成與串流相同的事件序列"""
+    yield {
+        "type": "restaurants",
+        "question": cached_result.get("question"),
+        "location": cached_result.get("location"),
+        "restaurants_count": cached_result.get("restaurants_count"),
+        "high_rated_count": cached_result.get("high_rated_count"),
+        "restaurants": cached_result.get("restaurants", []),
+        "search_time": 0
+    }
+    yield {"type": "token", "text": cached_result.get("recommendation", "")}
+    yield {
+        "type": "done",
+        "source": "cache",
+        "cached_at": cached_result.get("timestamp"),
+        "stale": stale,
+        **cached_result
+    }
+
+
+async def _ndjson(events: AsyncIterator[Dict]) -> AsyncIterator[bytes]:
+    """每個事件編碼成一行 JSON"""
+    async for event in events:
+        yield (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+
+@app.get("/api/live")
+async def liveness():
+    """存活檢查：只要事件迴圈能回應即為存活"""
+    return {"status": "alive", "uptime_seconds": round(time.monotonic() - MODULE_LOADED_AT, 1)}
+
+@app.get("/api/ready")
+async def readiness():
+    """就緒檢查：元件初始化完成才回傳 200；上游狀態僅供參考"""
+    task = app.state.init_task
+    if not task.done():
+        status, code = "starting", 503
+    elif task.cancelled() or task.exception() is not None:
+        status, code = "failed", 503
+    else:
+        status, code = "ready", 200
+    return JSONResponse(
+        status_code=code,
+        content={
+            "status": status,
+            "startup": startup_stats,
+            "upstreams": recommender.health_monitor.snapshot() if code == 200 else {}
+        }
+    )
 
 @app.get("/api/health")
 async def health_check():
-    """健康檢查"""
-    try:
-        test_url = "https://maps.googleapis.com/maps/api/geocode/json"
-        params = {"address": "台北", "key": GOOGLE_MAPS_API_KEY}
-        response = requests.get(test_url, params=params, timeout=5)
-        google_status = "healthy" if response.status_code == 200 else "unhealthy"
-    except:
-        google_status = "unreachable"
-    
-    ai_status = "healthy" if recommender.chat_handler.test_connection() else "unreachable"
+    """健康檢查：由背景探測與實際請求的統計回答，不呼叫上游"""
+    if recommender is None:
+        return {"status": "starting", "timestamp": datetime.now().isoformat()}
     
+    upstreams = recommender.health_monitor.snapshot()
     return {
         "status": "running",
         "timestamp": datetime.now().isoformat(),
         "services": {
-            "google_maps": google_status,
-            "ai_api": ai_status,
+            "google_maps": upstreams["google_maps"]["status"],
+            "ai_api": upstreams["ai_api"]["status"],
             "cache_db": "healthy"
         },
+        "upstreams": upstreams,
+        "circuit_breakers": {
+            "google_maps": recommender.maps_searcher.breaker.state,
+            "ai_api": recommender.chat_handler.breaker.state
+        },
         "version": "6.2.0",
         "features": ["完整推薦內容", "詳細分析", "WebUI 專用端點"]
     }
 
-@app.get("/api/test_ai")
+@app.get("/api/test_ai", dependencies=[Depends(wait_until_ready)])
 async def test_ai_connection():
     """測試 AI API 連接"""
-    if recommender.chat_handler.test_connection():
+    if await recommender.chat_handler.test_connection():
         return {
             "status": "success",
             "message": "實驗室 Ollama API 連接正常",
@@ -252,24 +759,21 @@ async def test_ai_connection():
             detail=f"無法連接到實驗室 Ollama API"
         )
 
-@app.get("/api/debug")
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 格式的各階段延遲、快取命中與錯誤統計"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/debug", dependencies=[Depends(wait_until_ready)])
 async def debug_info():
     """除錯資訊"""
-    cursor = recommender.cache.conn.cursor()
-    
-    # 取得快取統計
-    cursor.execute("SELECT COUNT(*) FROM cache")
-    total_entries = cursor.fetchone()[0]
-    
-    cursor.execute(
-        "SELECT COUNT(*) FROM cache WHERE expires_at > ?", 
-        (datetime.now().isoformat(),)
-    )
-    valid_entries = cursor.fetchone()[0]
+    # 取得快取統計（由定期維護更新，避免每次請求全表掃描）
+    maintenance_stats = recommender.cache.maintenance_stats
     
     # 取得最近一筆快取
+    cursor = recommender.cache.conn.cursor()
     cursor.execute(
-        "SELECT question, location, LENGTH(response) as resp_len FROM cache ORDER BY created_at DESC LIMIT 1"
+        "SELECT keyword, location, LENGTH(response) as resp_len FROM cache ORDER BY rowid DESC LIMIT 1"
     )
     latest_cache = cursor.fetchone()
     
@@ -284,9 +788,40 @@ async def debug_info():
     return {
         "current_time": datetime.now().isoformat(),
         "cache_stats": {
-            "total_entries": total_entries,
-            "valid_entries": valid_entries,
-            "latest_cache": latest_info
+            "total_entries": maintenance_stats.get("total_entries"),
+            "valid_entries": maintenance_stats.get("fresh_entries"),
+            "latest_cache": latest_info,
+            "maintenance": maintenance_stats
+        },
+        "cache_tier_stats": {
+            **recommender.cache.stats,
+            "memory_entries": len(recommender.cache.memory),
+            "memory_bytes": recommender.cache.memory.total_bytes
+        },
+        "write_behind_stats": {
+            **write_queue.stats,
+            "pending": write_queue.pending()
+        },
+        "singleflight_stats": recommender.inflight.stats,
+        "spatial_index_stats": recommender.spatial_index.snapshot(),
+        "fragment_cache_stats": recommender.cache.fragments.stats,
+        "warmup_last_run": warmup.last_run,
+        "warmup_leader": warmup.is_leader,
+        "payload_cache_stats": {
+            **payloads.stats,
+            "entries": len(payloads.memory),
+            "bytes": payloads.memory.total_bytes
+        },
+        "startup": startup_stats,
+        "circuit_breakers": {
+            "maps": recommender.maps_searcher.breaker.snapshot(),
+            "llm": recommender.chat_handler.breaker.snapshot()
+        },
+        "admission_stats": recommender.admission.snapshot(),
+        "place_store_stats": recommender.cache.places.stats,
+        "geocode_cache_stats": {
+            **recommender.geocode_cache.stats,
+            "hit_ratio": recommender.geocode_cache.hit_ratio()
         },
         "config": {
             "ai_api_url": LAB_OLLAMA_API,
@@ -0,0 +1,215 @@
+"""
+推薦服務壓力測試：對 /api/recommend 與 /api/recommend_full 送出混合請求，
+回報吞吐量、延遲與 TTFB 的 p50/p95/p99。
+
+使用方式：
+    python bench/loadgen.py --target http://127.0.0.1:5525 --concurrency 16 --requests 400 \
+        --hit-ratio 0.7 --mix recommend=0.5,recommend_full=0.5 --json baseline.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+import httpx
+
+QUESTIONS = [
+    "我想找咖啡廳", "推薦附近的早午餐", "想吃燒肉", "有沒有平價小吃", "適合約會的餐廳",
+    "安靜可以看書的咖啡廳", "宵夜吃什麼", "想吃甜點", "健康輕食推薦", "適合聚餐的燒烤",
+]
+
+LOCATIONS = [
+    "台南車站", "台北車站", "高雄車站", "台中車站", "成大光復校區",
+    "台北101", "西門町", "逢甲夜市", "駁二藝術特區", "安平老街",
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "p50": round(percentile(values, 50) * 1000, 1),
+        "p95": round(percentile(values, 95) * 1000, 1),
+        "p99": round(percentile(values, 99) * 1000, 1),
+        "max": round(max(values) * 1000, 1) if values else 0.0,
+    }
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for item in mix.split(","):
+        name, weight = item.split("=")
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+class LoadGenerator:
+    def __init__(self, args):
+        self.args = args
+        self.mix = parse_mix(args.mix)
+        self.rng = random.Random(args.seed)
+        # 熱門組合：預熱後重複使用以產生快取命中
+        self.hot_pairs = [
+            (self.rng.choice(QUESTIONS), self.rng.choice(LOCATIONS))
+            for _ in range(args.hot_keys)
+        ]
+        self.results = defaultdict(lambda: {"latency": [], "ttfb": [], "status": Counter(), "source": Counter()})
+
+    def next_request(self) -> Dict:
+        if self.rng.random() < self.args.hit_ratio:
+            question, location = self.rng.choice(self.hot_pairs)
+        else:
+            # 唯一的地點字串，模擬上游會把它雜湊到不同座標，確保是冷請求
+            question = self.rng.choice(QUESTIONS)
+            location = f"{self.rng.choice(LOCATIONS)} 測試點 {uuid.uuid4().hex[:8]}"
+        return {
+            "question": question,
+            "location": location,
+            "radius": self.rng.choice(self.args.radii),
+            "max_results": self.args.max_results,
+        }
+
+    def next_endpoint(self) -> str:
+        names = list(self.mix)
+        return self.rng.choices(names, weights=[self.mix[n] for n in names])[0]
+
+    async def send(self, client: httpx.AsyncClient, endpoint: str, body: Dict):
+        record = self.results[endpoint]
+        start = time.perf_counter()
+        ttfb = None
+        status = "error"
+        content = b""
+        try:
+            async with client.stream("POST", f"/api/{endpoint}", json=body) as response:
+                status = response.status_code
+                async for chunk in response.aiter_raw():
+                    if ttfb is None:
+                        ttfb = time.perf_counter() - start
+                    content += chunk
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+
+        latency = time.perf_counter() - start
+        record["latency"].append(latency)
+        record["ttfb"].append(ttfb if ttfb is not None else latency)
+        record["status"][str(status)] += 1
+
+        if status == 200:
+            record["source"][self._source(content)] += 1
+
+    @staticmethod
+    def _source(content: bytes) -> str:
+        try:
+            # 串流端點以最後一行為完整結果
+            last_line = content.decode("utf-8").strip().splitlines()[-1]
+            return json.loads(last_line).get("source", "unknown")
+        except (ValueError, IndexError):
+            return "unknown"
+
+    async def warmup(self, client: httpx.AsyncClient):
+        print(f"🔥 預熱 {len(self.hot_pairs)} 組熱門請求...")
+        for question, location in self.hot_pairs:
+            body = {"question": question, "location": location,
+                    "radius": self.args.radii[0], "max_results": self.args.max_results}
+            for radius in self.args.radii:
+                body["radius"] = radius
+                try:
+                    await client.post("/api/recommend", json=body)
+                except httpx.HTTPError as e:
+                    print(f"⚠️ 預熱失敗: {e}")
+
+    async def run(self):
+        timeout = httpx.Timeout(self.args.timeout)
+        limits = httpx.Limits(max_connections=self.args.concurrency * 2)
+        async with httpx.AsyncClient(base_url=self.args.target, timeout=timeout, limits=limits) as client:
+            if self.args.hit_ratio > 0 and not self.args.no_warmup:
+                await self.warmup(client)
+
+            queue: asyncio.Queue = asyncio.Queue()
+            for _ in range(self.args.requests):
+                queue.put_nowait((self.next_endpoint(), self.next_request()))
+
+            async def worker():
+                while True:
+                    try:
+                        endpoint, body = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    await self.send(client, endpoint, body)
+
+            print(f"🚀 送出 {self.args.requests} 個請求，並行數 {self.args.concurrency}...")
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(self.args.concurrency)))
+            elapsed = time.perf_counter() - start
+
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> Dict:
+        all_latency = [v for r in self.results.values() for v in r["latency"]]
+        all_ttfb = [v for r in self.results.values() for v in r["ttfb"]]
+        report = {
+            "config": {k: v for k, v in vars(self.args).items() if k != "json"},
+            "elapsed": round(elapsed, 2),
+            "requests": len(all_latency),
+            "throughput_rps": round(len(all_latency) / elapsed, 2) if elapsed else 0,
+            "latency_ms": summarize(all_latency),
+            "ttfb_ms": summarize(all_ttfb),
+            "endpoints": {
+                name: {
+                    "requests": len(r["latency"]),
+                    "latency_ms": summarize(r["latency"]),
+                    "ttfb_ms": summarize(r["ttfb"]),
+                    "status": dict(r["status"]),
+                    "source": dict(r["source"]),
+                }
+                for name, r in self.results.items()
+            },
+        }
+
+        print("\n" + "=" * 60)
+        print(f"📊 {report['requests']} 個請求，耗時 {report['elapsed']} 秒，吞吐量 {report['throughput_rps']} req/s")
+        print(f"⏱️  延遲 (ms): {report['latency_ms']}")
+        print(f"⚡ TTFB (ms): {report['ttfb_ms']}")
+        for name, r in report["endpoints"].items():
+            print(f"  - {name}: {r['requests']} 次, 延遲 {r['latency_ms']}, TTFB {r['ttfb_ms']}")
+            print(f"    狀態 {r['status']}, 來源 {r['source']}")
+        print("=" * 60)
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="附近吃吃推薦壓力測試")
+    parser.add_argument("--target", default="http://127.0.0.1:5525")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--hit-ratio", type=float, default=0.5, help="使用熱門組合（預期命中快取）的比例")
+    parser.add_argument("--hot-keys", type=int, default=10, help="熱門組合數量")
+    parser.add_argument("--mix", default="recommend=0.5,recommend_full=0.5",
+                        help="端點比例，例如 recommend=0.4,recommend_full=0.4,recommend_stream=0.2")
+    parser.add_argument("--radii", type=int, nargs="+", default=[1000])
+    parser.add_argument("--max-results", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-warmup", action="store_true")
+    parser.add_argument("--json", help="將結果寫入 JSON 檔，作為版本比較基準")
+    args = parser.parse_args()
+
+    report = asyncio.run(LoadGenerator(args).run())
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 結果已寫入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
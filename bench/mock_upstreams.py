@@ -0,0 +1,207 @@
+"""
+本機模擬上游：Google Geocoding / Nearby Search / Place Details 與實驗室 Ollama /api/generate（串流）
+
+使用方式：
+    python bench/mock_upstreams.py --port 5600 --ttft 0.8 --token-rate 40
+
+並以環境變數讓服務改連到模擬上游：
+    GOOGLE_MAPS_API_BASE=http://127.0.0.1:5600/maps/api
+    LAB_OLLAMA_API=http://127.0.0.1:5600/api/generate
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="nearby-eats mock upstreams")
+
+# 預設參數，啟動時由命令列覆寫
+settings = {
+    "geocode_latency": 0.08,
+    "search_latency": 0.25,
+    "ttft": 0.8,
+    "token_rate": 40.0,
+    "tokens": 600,
+    "maps_error_rate": 0.0,
+    "llm_error_rate": 0.0,
+    "jitter": 0.2,
+    "places": 60,
+}
+
+stats = {"geocode": 0, "nearbysearch": 0, "details": 0, "generate": 0, "errors": 0}
+
+# 產生內容用的片段
+TOKEN_POOL = ["推薦", "這家", "餐廳", "評價", "很高", "，", "環境", "舒適", "適合", "聚餐", "。",
+              "價格", "實惠", "，", "交通", "方便", "步行", "約", "五分鐘", "。\n", "### ", "特色", "\n- "]
+
+# 台灣本島範圍，未知地點依字串雜湊分散在此範圍內
+TAIWAN_BOUNDS = (21.9, 25.3, 120.0, 122.0)
+
+
+def _sleep_time(base: float) -> float:
+    jitter = settings["jitter"]
+    return max(0.0, base * random.uniform(1 - jitter, 1 + jitter))
+
+
+def _should_fail(rate: float) -> bool:
+    if rate and random.random() < rate:
+        stats["errors"] += 1
+        return True
+    return False
+
+
+def _coordinates(address: str):
+    digest = hashlib.md5(address.encode("utf-8")).digest()
+    south, north, west, east = TAIWAN_BOUNDS
+    lat = south + (north - south) * int.from_bytes(digest[:4], "big") / 2 ** 32
+    lng = west + (east - west) * int.from_bytes(digest[4:8], "big") / 2 ** 32
+    return round(lat, 6), round(lng, 6)
+
+
+def _places(lat: float, lng: float, keyword: str, count: int):
+    """依座標與關鍵字產生固定的假餐廳資料"""
+    seed = int(hashlib.md5(f"{lat:.3f},{lng:.3f}|{keyword}".encode("utf-8")).hexdigest()[:8], 16)
+    rng = random.Random(seed)
+    places = []
+    for i in range(count):
+        place_id = f"mock-{seed:x}-{i}"
+        places.append({
+            "place_id": place_id,
+            "name": f"{keyword or '餐廳'} {i + 1} 號店",
+            "vicinity": f"模擬路 {rng.randint(1, 300)} 號",
+            "rating": round(rng.uniform(3.2, 5.0), 1),
+            "user_ratings_total": rng.randint(5, 3000),
+            "price_level": rng.randint(1, 4),
+            "types": ["restaurant", "food", "point_of_interest"],
+            "opening_hours": {"open_now": rng.random() > 0.3},
+            "geometry": {"location": {
+                "lat": lat + rng.uniform(-0.008, 0.008),
+                "lng": lng + rng.uniform(-0.008, 0.008)
+            }}
+        })
+    return places
+
+
+@app.get("/maps/api/geocode/json")
+async def geocode(address: str = "", key: str = "", language: str = ""):
+    stats["geocode"] += 1
+    await asyncio.sleep(_sleep_time(settings["geocode_latency"]))
+    if _should_fail(settings["maps_error_rate"]):
+        return JSONResponse({"status": "UNKNOWN_ERROR", "results": []})
+    if not address or "不存在" in address:
+        return JSONResponse({"status": "ZERO_RESULTS", "results": []})
+    lat, lng = _coordinates(address)
+    return {"status": "OK", "results": [{"geometry": {"location": {"lat": lat, "lng": lng}}}]}
+
+
+@app.get("/maps/api/place/nearbysearch/json")
+async def nearby_search(location: str = "", keyword: str = "", radius: int = 1000,
+                        pagetoken: str = "", key: str = "", type: str = "", language: str = ""):
+    stats["nearbysearch"] += 1
+    await asyncio.sleep(_sleep_time(settings["search_latency"]))
+    if _should_fail(settings["maps_error_rate"]):
+        return JSONResponse({"status": "UNKNOWN_ERROR", "results": []})
+
+    # 分頁：token 內容為 "位置|關鍵字|頁碼"
+    page = 0
+    if pagetoken:
+        location, keyword, page_str = pagetoken.split("|")
+        page = int(page_str)
+
+    lat, lng = (float(v) for v in location.split(","))
+    places = _places(lat, lng, keyword, settings["places"])
+    results = places[page * 20:(page + 1) * 20]
+    body = {"status": "OK" if results else "ZERO_RESULTS", "results": results}
+    if (page + 1) * 20 < len(places):
+        body["next_page_token"] = f"{location}|{keyword}|{page + 1}"
+    return body
+
+
+@app.get("/maps/api/place/details/json")
+async def place_details(place_id: str = "", fields: str = "", key: str = "", language: str = ""):
+    stats["details"] += 1
+    await asyncio.sleep(_sleep_time(settings["geocode_latency"]))
+    if _should_fail(settings["maps_error_rate"]):
+        return JSONResponse({"status": "UNKNOWN_ERROR"})
+    if not place_id.startswith("mock-"):
+        return JSONResponse({"status": "NOT_FOUND"})
+    # 營業狀態隨機變動，模擬真實店家的開關店
+    rng = random.Random(f"{place_id}|{random.random()}")
+    return {"status": "OK", "result": {
+        "opening_hours": {"open_now": rng.random() > 0.3},
+        "rating": round(rng.uniform(3.2, 5.0), 1),
+        "user_ratings_total": rng.randint(5, 3000)
+    }}
+
+
+@app.post("/api/generate")
+async def generate(request: Request):
+    stats["generate"] += 1
+    payload = await request.json()
+
+    if _should_fail(settings["llm_error_rate"]):
+        return JSONResponse({"error": "mock upstream failure"}, status_code=500)
+
+    tokens = min(settings["tokens"], int(payload.get("max_tokens") or settings["tokens"]))
+    prompt_tokens = len(payload.get("prompt", "")) // 2
+
+    if not payload.get("stream"):
+        await asyncio.sleep(_sleep_time(settings["ttft"]))
+        return {"model": payload.get("model"), "response": "OK", "done": True}
+
+    async def stream():
+        await asyncio.sleep(_sleep_time(settings["ttft"]))
+        interval = 1 / settings["token_rate"] if settings["token_rate"] > 0 else 0
+        for i in range(tokens):
+            yield json.dumps({
+                "model": payload.get("model"),
+                "response": TOKEN_POOL[i % len(TOKEN_POOL)],
+                "done": False
+            }, ensure_ascii=False) + "\n"
+            if interval:
+                await asyncio.sleep(interval)
+        yield json.dumps({
+            "model": payload.get("model"),
+            "response": "",
+            "done": True,
+            "prompt_eval_count": prompt_tokens,
+            "eval_count": tokens
+        }) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.get("/stats")
+async def get_stats():
+    return {"settings": settings, "calls": stats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本機模擬 Google Maps 與 Ollama 上游")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5600)
+    parser.add_argument("--geocode-latency", type=float, default=settings["geocode_latency"], help="Geocoding 延遲（秒）")
+    parser.add_argument("--search-latency", type=float, default=settings["search_latency"], help="Nearby Search 延遲（秒）")
+    parser.add_argument("--ttft", type=float, default=settings["ttft"], help="LLM 第一個 token 前的延遲（秒）")
+    parser.add_argument("--token-rate", type=float, default=settings["token_rate"], help="每秒產生 token 數")
+    parser.add_argument("--tokens", type=int, default=settings["tokens"], help="每次生成的 token 數上限")
+    parser.add_argument("--maps-error-rate", type=float, default=settings["maps_error_rate"])
+    parser.add_argument("--llm-error-rate", type=float, default=settings["llm_error_rate"])
+    parser.add_argument("--jitter", type=float, default=settings["jitter"], help="延遲隨機浮動比例")
+    parser.add_argument("--places", type=int, default=settings["places"], help="每個位置可搜尋到的餐廳數")
+    args = parser.parse_args()
+
+    for name in settings:
+        settings[name] = getattr(args, name)
+
+    print(f"🧪 模擬上游啟動: http://{args.host}:{args.port}  {settings}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
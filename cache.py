@@ -1,20 +1,156 @@
 import hashlib
+import re
 import sqlite3
 import json
+import threading
+import time
+import unicodedata
 from datetime import datetime, timedelta
-from typing import Optional, Dict
-from pathlib import Path
+from collections import OrderedDict
+from typing import Any, NamedTuple, Optional, Dict, List, Tuple
+
+from db import BUSY_TIMEOUT_MS, get_connection, write_queue
+from geo import geohash_neighbors, haversine, precision_for_distance, radius_bucket, snap_point
+from metrics import CACHE_REQUESTS, GEOCODE_CACHE_REQUESTS, STAGE_SECONDS
+from fragments import FragmentCache
+from places import PlaceStore
+from semantic_cache import SemanticIndex
+
+# 超過 soft TTL 仍可立即回傳（標記 stale 並背景重新產生），超過 hard TTL 才視為未命中
+CACHE_SOFT_TTL = timedelta(hours=24)
+CACHE_HARD_TTL = timedelta(hours=72)
+# 相鄰位置可共用快取的距離（半徑級距的比例）
+CACHE_REUSE_FRACTION = 0.25
+
+# 舊版資料表缺少時會自動補上的欄位
+EXTRA_COLUMNS = {
+    "cell": "TEXT",
+    "lat": "REAL",
+    "lng": "REAL",
+    "radius_bucket": "INTEGER",
+    "max_results": "INTEGER",
+    "soft_expires_at": "TIMESTAMP",
+    "last_accessed_at": "TIMESTAMP",
+    "hit_count": "INTEGER DEFAULT 0",
+    # 快取分區（見 cache_partition）：llm（完整分析）、llm:brief / llm:standard、fragments 各自分開快取
+    "mode": "TEXT DEFAULT 'llm'"
+}
+
+# 快取資料庫上限與維護週期
+CACHE_MAX_ROWS = 50000
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+CACHE_EVICT_BATCH = 0.05
+CACHE_MAINTENANCE_INTERVAL = timedelta(minutes=15)
+
+MEMORY_CACHE_MAX_ENTRIES = 256
+MEMORY_CACHE_MAX_BYTES = 32 * 1024 * 1024
+MEMORY_CACHE_TTL = timedelta(minutes=30)
+
+GEOCODE_TTL = timedelta(days=30)
+GEOCODE_NEGATIVE_TTL = timedelta(hours=6)
+GEOCODE_MEMORY_MAX = 10000
+
+def cache_partition(mode: str, detail: str = "full") -> str:
+    """結果所屬的快取分區；快速模式讀取完整分析的快取"""
+    if mode == "fragments":
+        return "fragments"
+    if mode == "llm" and detail != "full":
+        return f"llm:{detail}"
+    return "llm"
+
+
+class CacheHit(NamedTuple):
+    """快取命中結果"""
+    data: Dict
+    # 實際提供內容的那筆快取的 key（鄰近格子或其他方格的命中與請求算出的 key 不同）
+    query_hash: str
+    stale: bool
+    tier: str
+    # 營業狀態或評分已過期、需要背景更新的 place_id
+    stale_places: Tuple[str, ...] = ()
+
+
+class MemoryLRU:
+    """行程內 LRU 快取，同時限制筆數與位元組數，並支援 TTL"""
+    
+    def __init__(self, max_entries: int, max_bytes: int, ttl: timedelta):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl.total_seconds()
+        self.total_bytes = 0
+        self._entries: "OrderedDict[str, Tuple[Any, int, float]]" = OrderedDict()
+        # 快取寫入會在背景執行緒進行，需與事件迴圈上的讀取互斥
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] <= time.time():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+    
+    def put(self, key: str, value: Any, size: int, expires_at: Optional[float] = None):
+        """放入項目；expires_at 為項目本身的到期時間，實際 TTL 取兩者較早者"""
+        expires = time.time() + self.ttl
+        if expires_at is not None:
+            expires = min(expires, expires_at)
+        
+        with self._lock:
+            self._pop(key)
+            if size > self.max_bytes:
+                return
+            
+            self._entries[key] = (value, size, expires)
+            self.total_bytes += size
+            
+            while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, (_, old_size, _) = self._entries.popitem(last=False)
+                self.total_bytes -= old_size
+    
+    def pop(self, key: str):
+        with self._lock:
+            self._pop(key)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+    
+    def _pop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
 
-BASE_DIR = Path(__file__).parent
-CACHE_DB = BASE_DIR / "cache.db"
 
 class QueryCache:
+    """推薦結果快取：記憶體 LRU（第一層）+ SQLite（第二層）"""
+    
     def __init__(self):
-        self.conn = sqlite3.connect(CACHE_DB, check_same_thread=False)
+        self.memory = MemoryLRU(MEMORY_CACHE_MAX_ENTRIES, MEMORY_CACHE_MAX_BYTES, MEMORY_CACHE_TTL)
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "semantic_hits": 0, "stale_hits": 0, "misses": 0}
+        # 命中紀錄先累積在記憶體，維護時再批次寫回 (query_hash -> [次數, 最後存取時間])
+        self._pending_access: Dict[str, List] = {}
+        self.maintenance_stats: Dict[str, Any] = {}
         self._init_db()
+        self.semantic = SemanticIndex()
+        self.places = PlaceStore()
+        self.fragments = FragmentCache()
+    
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """目前執行緒的 SQLite 連線"""
+        return get_connection()
     
     def _init_db(self):
         cursor = self.conn.cursor()
+        
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS cache (
                 query_hash TEXT PRIMARY KEY,
@@ -25,38 +161,431 @@ class QueryCache:
                 expires_at TIMESTAMP
             )
         ''')
+        
+        # 舊版資料表補上新欄位
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(cache)")}
+        for column, column_type in EXTRA_COLUMNS.items():
+            if column not in columns:
+                try:
+                    cursor.execute(f"ALTER TABLE cache ADD COLUMN {column} {column_type}")
+                except sqlite3.OperationalError as e:
+                    # 其他 worker 可能已同時補上欄位
+                    if "duplicate column" not in str(e):
+                        raise
+        
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cache_lookup ON cache (keyword, radius_bucket, max_results, cell)"
+        )
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache (expires_at)")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cache_access ON cache (COALESCE(last_accessed_at, created_at))"
+        )
         self.conn.commit()
     
-    def _generate_hash(self, keyword: str, location: str) -> str:
-        return hashlib.md5(f"{keyword}|{location}".encode()).hexdigest()
+    @staticmethod
+    def cache_key(keyword: str, lat: float, lng: float, radius: int, max_results: int,
+                  mode: str = "llm") -> Tuple[str, List[str], int]:
+        """以量化後的座標產生快取鍵，回傳 (query_hash, [所在格子, 相鄰格子...], 半徑級距)
+        
+        格子可能比可重用距離大數倍，鍵另外加上對齊到可重用距離的座標，同格內相距較遠的地點才不會互相覆蓋
+        """
+        bucket = radius_bucket(radius)
+        max_distance = bucket * CACHE_REUSE_FRACTION
+        precision = precision_for_distance(lat, max_distance)
+        cells = geohash_neighbors(lat, lng, precision)
+        point = snap_point(lat, lng, max_distance)
+        key = f"{keyword}|{cells[0]}|{point[0]},{point[1]}|{bucket}|{max_results}"
+        if mode != "llm":
+            key += f"|{mode}"
+        query_hash = hashlib.md5(key.encode()).hexdigest()
+        return query_hash, cells, bucket
+    
+    def lookup(self, keyword: str, lat: float, lng: float, radius: int, max_results: int, question: Optional[str] = None,
+               mode: str = "llm") -> Optional[CacheHit]:
+        """查詢快取（mode 為 cache_partition 的分區）；餐廳欄位以 place store 的最新資料還原"""
+        with STAGE_SECONDS.time(stage="cache_get"):
+            hit = self._lookup_spatial(keyword, lat, lng, radius, max_results, mode)
+            if hit is None and question:
+                hit = self._lookup_semantic(question, keyword, lat, lng, radius, max_results, mode)
+            if hit is not None:
+                data, stale_places = self.places.hydrate(hit.data)
+                hit = hit._replace(data=data, stale_places=stale_places)
+        
+        if hit is None:
+            self.stats["misses"] += 1
+            CACHE_REQUESTS.inc(tier="miss")
+        else:
+            self._record_access(hit.query_hash)
+            self.stats[f"{hit.tier}_hits"] += 1
+            CACHE_REQUESTS.inc(tier=hit.tier)
+            if hit.stale:
+                self.stats["stale_hits"] += 1
+                CACHE_REQUESTS.inc(tier="stale")
+        return hit
+    
+    def _record_access(self, query_hash: str):
+        access = self._pending_access.setdefault(query_hash, [0, None])
+        access[0] += 1
+        access[1] = datetime.now().isoformat()
     
-    def get(self, keyword: str, location: str) -> Optional[Dict]:
-        query_hash = self._generate_hash(keyword, location)
+    def _from_memory(self, query_hash: str, lat: float, lng: float, max_distance: float,
+                     tier: str = "memory") -> Optional[CacheHit]:
+        """讀取記憶體層；與磁碟層相同，只接受可重用距離內的內容"""
+        entry = self.memory.get(query_hash)
+        if entry is None:
+            return None
+        data, soft_expires, entry_lat, entry_lng = entry
+        if entry_lat is None or haversine(lat, lng, entry_lat, entry_lng) > max_distance:
+            return None
+        return CacheHit(data, query_hash, soft_expires <= time.time(), tier)
+    
+    def _from_row(self, query_hash: str, row: Tuple, tier: str) -> Optional[CacheHit]:
+        """row: (response, expires_at, soft_expires_at, lat, lng)；解析後放入記憶體層"""
+        try:
+            data = json.loads(row[0])
+        except json.JSONDecodeError:
+            return None
+        soft_expires = datetime.fromisoformat(row[2] or row[1]).timestamp()
+        self.memory.put(
+            query_hash, (data, soft_expires, row[3], row[4]), len(row[0]), datetime.fromisoformat(row[1]).timestamp()
+        )
+        return CacheHit(data, query_hash, soft_expires <= time.time(), tier)
+    
+    def _lookup_semantic(self, question: str, keyword: str, lat: float, lng: float, radius: int, max_results: int,
+                         mode: str) -> Optional[CacheHit]:
+        """以問句相似度找出附近、搜尋關鍵字相同的歷史問句並讀取其快取"""
+        _, cells, bucket = self.cache_key(keyword, lat, lng, radius, max_results, mode)
+        match = self.semantic.find(
+            question, keyword, lat, lng,
+            [SemanticIndex.scope_key(cell, bucket, max_results, mode) for cell in cells],
+            bucket * CACHE_REUSE_FRACTION
+        )
+        if match is None:
+            return None
+        
+        query_hash, score = match
+        hit = self._from_memory(query_hash, lat, lng, bucket * CACHE_REUSE_FRACTION, "semantic")
+        if hit is None:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                'SELECT response, expires_at, soft_expires_at, lat, lng FROM cache WHERE query_hash = ? AND expires_at > ?',
+                (query_hash, datetime.now().isoformat())
+            )
+            row = cursor.fetchone()
+            hit = self._from_row(query_hash, row, "semantic") if row else None
+        
+        if hit:
+            print(f"🧠 語意快取命中 (相似度 {score:.2f})")
+        return hit
+    
+    def _lookup_spatial(self, keyword: str, lat: float, lng: float, radius: int, max_results: int,
+                        mode: str) -> Optional[CacheHit]:
+        """讀取同格或相鄰格內距離夠近、產生方式相同的快取"""
+        query_hash, cells, bucket = self.cache_key(keyword, lat, lng, radius, max_results, mode)
+        max_distance = bucket * CACHE_REUSE_FRACTION
+        
+        hit = self._from_memory(query_hash, lat, lng, max_distance)
+        if hit is not None:
+            return hit
+        
         cursor = self.conn.cursor()
         cursor.execute(
-            'SELECT response FROM cache WHERE query_hash = ? AND expires_at > ?',
-            (query_hash, datetime.now().isoformat())
+            f'''
+            SELECT query_hash, response, expires_at, soft_expires_at, lat, lng FROM cache
+            WHERE keyword = ? AND radius_bucket = ? AND max_results = ? AND COALESCE(mode, 'llm') = ?
+              AND cell IN ({",".join("?" * len(cells))}) AND expires_at > ?
+            ''',
+            (keyword, bucket, max_results, mode, *cells, datetime.now().isoformat())
         )
-        result = cursor.fetchone()
-        if result:
-            try:
-                cached_data = json.loads(result[0])
-                print(f"📦 讀取快取成功 - recommendation長度: {len(cached_data.get('recommendation', '')) if 'recommendation' in cached_data else 0}")
-                return cached_data
-            except json.JSONDecodeError:
-                return None
-        return None
+        
+        # 在候選中挑選最近且在可重用距離內的一筆
+        best = None
+        for row in cursor.fetchall():
+            distance = haversine(lat, lng, row[4], row[5])
+            if distance <= max_distance and (best is None or distance < best[0]):
+                best = (distance, row)
+        
+        if best is None:
+            return None
+        
+        # 命中與存取紀錄都以該筆自己的 key 為準，LRU 淘汰才會保留常被鄰近請求重用的內容
+        distance, (row_hash, *row) = best
+        hit = self._from_memory(row_hash, lat, lng, max_distance)
+        if hit is not None:
+            return hit
+        hit = self._from_row(row_hash, row, "disk")
+        if hit:
+            print(f"📦 讀取快取成功 (距離 {distance:.0f}m{', 已過期' if hit.stale else ''}) - recommendation長度: {len(hit.data.get('recommendation', ''))}")
+        return hit
+    
+    def soft_expiry(self, keyword: str, lat: float, lng: float, radius: int, max_results: int) -> Optional[float]:
+        """快取鍵目前內容的 soft TTL 到期時間（epoch 秒），不存在時回傳 None；不計入命中統計"""
+        query_hash, _, _ = self.cache_key(keyword, lat, lng, radius, max_results)
+        entry = self.memory.get(query_hash)
+        if entry is not None:
+            return entry[1]
+        row = self.conn.execute(
+            'SELECT soft_expires_at, expires_at FROM cache WHERE query_hash = ? AND expires_at > ?',
+            (query_hash, datetime.now().isoformat())
+        ).fetchone()
+        return datetime.fromisoformat(row[0] or row[1]).timestamp() if row else None
+    
+    def set(self, keyword: str, location: str, lat: float, lng: float, radius: int, max_results: int, response: Dict, question: Optional[str] = None):
+        with STAGE_SECONDS.time(stage="cache_set"):
+            self._set(keyword, location, lat, lng, radius, max_results, response, question)
     
-    def set(self, keyword: str, location: str, response: Dict):
-        query_hash = self._generate_hash(keyword, location)
-        expires_at = datetime.now() + timedelta(hours=24)
+    def _set(self, keyword: str, location: str, lat: float, lng: float, radius: int, max_results: int, response: Dict, question: Optional[str]):
+        # 依產生方式與詳細程度分開保存，片段組合或簡短回答不會回傳給要求完整分析的請求
+        metadata = response.get("metadata", {})
+        mode = cache_partition(metadata.get("mode") or "llm", metadata.get("detail") or "full")
+        query_hash, cells, bucket = self.cache_key(keyword, lat, lng, radius, max_results, mode)
+        now = datetime.now()
+        soft_expires_at = now + CACHE_SOFT_TTL
+        expires_at = now + CACHE_HARD_TTL
         print(f"💾 儲存快取 - recommendation存在: {'recommendation' in response}")
         if 'recommendation' in response:
             print(f"   recommendation長度: {len(response['recommendation'])}")
+        # 餐廳只保存 place_id 參照，營業狀態等欄位讀取時再從 place store 還原
+        stored = self.places.dehydrate(response)
+        blob = json.dumps(stored)
+        self.memory.put(query_hash, (stored, soft_expires_at.timestamp(), lat, lng), len(blob), expires_at.timestamp())
+        # 交由背景佇列批次寫入，不阻塞呼叫端；created_at 與 last_accessed_at 使用同一個時鐘與格式，
+        # 更新既有項目時保留存取紀錄，淘汰順序才是最久未使用
+        write_queue.submit('''
+            INSERT INTO cache
+            (query_hash, keyword, location, response, created_at, expires_at, soft_expires_at, cell, lat, lng, radius_bucket, max_results, mode)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(query_hash) DO UPDATE SET
+                keyword = excluded.keyword, location = excluded.location, response = excluded.response,
+                created_at = excluded.created_at, expires_at = excluded.expires_at,
+                soft_expires_at = excluded.soft_expires_at, cell = excluded.cell, lat = excluded.lat,
+                lng = excluded.lng, radius_bucket = excluded.radius_bucket, max_results = excluded.max_results,
+                mode = excluded.mode
+        ''', (query_hash, keyword, location, blob, now.isoformat(), expires_at.isoformat(), soft_expires_at.isoformat(),
+              cells[0], lat, lng, bucket, max_results, mode))
+        
+        if question:
+            self.semantic.add(
+                question, keyword, query_hash, lat, lng,
+                SemanticIndex.scope_key(cells[0], bucket, max_results, mode),
+                expires_at
+            )
+    
+    def flush_access(self) -> int:
+        """將累積的命中次數與最後存取時間批次寫回"""
+        pending, self._pending_access = self._pending_access, {}
+        if pending:
+            write_queue.submit(
+                'UPDATE cache SET hit_count = COALESCE(hit_count, 0) + ?, last_accessed_at = ? WHERE query_hash = ?',
+                [(count, accessed_at, query_hash) for query_hash, (count, accessed_at) in pending.items()],
+                many=True
+            )
+        return len(pending)
+    
+    def purge_expired(self) -> int:
+        """刪除超過 hard TTL 的快取與語意索引"""
+        now = datetime.now().isoformat()
+        cursor = self.conn.cursor()
+        cursor.execute('DELETE FROM cache WHERE expires_at <= ?', (now,))
+        purged = cursor.rowcount
+        cursor.execute('DELETE FROM question_index WHERE expires_at <= ?', (now,))
+        self.conn.commit()
+        return purged
+    
+    def _data_bytes(self) -> int:
+        cursor = self.conn.cursor()
+        page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+        page_count = cursor.execute("PRAGMA page_count").fetchone()[0]
+        freelist = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        return (page_count - freelist) * page_size
+    
+    def evict(self, max_rows: int = CACHE_MAX_ROWS, max_bytes: int = CACHE_MAX_BYTES) -> int:
+        """超過筆數或容量上限時，依最後存取時間淘汰最久未使用的快取"""
+        cursor = self.conn.cursor()
+        # 舊版的 created_at 是 SQLite CURRENT_TIMESTAMP（UTC、空白分隔），轉成與 last_accessed_at 相同的本地 ISO 格式
+        cursor.execute(
+            "UPDATE cache SET created_at = strftime('%Y-%m-%dT%H:%M:%S', created_at, 'localtime') "
+            "WHERE created_at NOT LIKE '%T%'"
+        )
+        self.conn.commit()
+        rows = cursor.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        evicted = 0
+        
+        while rows > 0 and (rows > max_rows or self._data_bytes() > max_bytes):
+            batch = max(rows - max_rows, int(rows * CACHE_EVICT_BATCH), 1)
+            cursor.execute('''
+                DELETE FROM cache WHERE query_hash IN (
+                    SELECT query_hash FROM cache
+                    ORDER BY COALESCE(last_accessed_at, created_at) LIMIT ?
+                )
+            ''', (batch,))
+            self.conn.commit()
+            evicted += cursor.rowcount
+            rows -= cursor.rowcount
+            if cursor.rowcount <= 0:
+                break
+        
+        if evicted:
+            cursor.execute(
+                "DELETE FROM question_index WHERE query_hash NOT IN (SELECT query_hash FROM cache)"
+            )
+            self.conn.commit()
+        return evicted
+    
+    def enable_incremental_vacuum(self) -> bool:
+        """啟用增量 vacuum；舊資料庫需要一次完整 VACUUM 才會生效
+        
+        轉換在維護時進行而非啟動時；資料庫忙碌（其他 worker 正在寫入或轉換）時略過，下次維護再試
+        """
+        conn = self.conn
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return True
+        print("🧹 啟用 cache.db 增量 vacuum")
+        conn.execute("PRAGMA busy_timeout = 0")
+        try:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            return True
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ 資料庫忙碌，下次維護再轉換增量 vacuum: {e}")
+            return False
+        finally:
+            conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    
+    def maintenance(self) -> Dict[str, Any]:
+        """定期維護：寫回存取紀錄、清除過期資料、容量淘汰、增量 vacuum，並更新統計"""
+        start = time.time()
+        flushed = self.flush_access()
+        write_queue.flush()
+        purged = self.purge_expired()
+        purged_places = self.places.purge_expired()
+        purged_fragments = self.fragments.purge_expired()
+        evicted = self.evict()
+        if evicted:
+            # 淘汰的項目不應再由記憶體層回傳
+            self.memory.clear()
+        
+        incremental_vacuum = self.enable_incremental_vacuum()
+        cursor = self.conn.cursor()
+        if incremental_vacuum:
+            cursor.execute("PRAGMA incremental_vacuum")
+            cursor.fetchall()
+        
+        total_entries = cursor.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        fresh_entries = cursor.execute(
+            "SELECT COUNT(*) FROM cache WHERE COALESCE(soft_expires_at, expires_at) > ?",
+            (datetime.now().isoformat(),)
+        ).fetchone()[0]
+        
+        self.maintenance_stats = {
+            "last_run": datetime.now().isoformat(),
+            "duration": round(time.time() - start, 3),
+            "flushed_access": flushed,
+            "purged": purged,
+            "purged_places": purged_places,
+            "purged_fragments": purged_fragments,
+            "evicted": evicted,
+            "incremental_vacuum": incremental_vacuum,
+            "total_entries": total_entries,
+            "fresh_entries": fresh_entries,
+            "places": self.places.count(),
+            "fragments": self.fragments.count(),
+            "db_bytes": self._data_bytes()
+        }
+        print(f"🧹 快取維護完成: 清除 {purged} 筆過期、淘汰 {evicted} 筆，剩餘 {total_entries} 筆")
+        return self.maintenance_stats
+
+def normalize_location(location: str) -> str:
+    """正規化地點字串：全形轉半形、移除空白、臺→台、英文小寫"""
+    text = unicodedata.normalize("NFKC", location)
+    text = re.sub(r"\s+", "", text)
+    text = text.replace("臺", "台")
+    return text.lower()
+
+
+class GeocodeCache:
+    """地點座標快取（記憶體 + SQLite），同時快取查無結果的地點"""
+    
+    def __init__(self):
+        self._memory: Dict[str, Tuple[Optional[float], Optional[float], float]] = {}
+        self.stats = {"hits": 0, "negative_hits": 0, "misses": 0}
+        self._init_db()
+    
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """目前執行緒的 SQLite 連線"""
+        return get_connection()
+    
+    def _init_db(self):
         cursor = self.conn.cursor()
         cursor.execute('''
-            INSERT OR REPLACE INTO cache 
-            (query_hash, keyword, location, response, expires_at)
+            CREATE TABLE IF NOT EXISTS geocode (
+                location_key TEXT PRIMARY KEY,
+                location TEXT,
+                lat REAL,
+                lng REAL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                expires_at TIMESTAMP
+            )
+        ''')
+        self.conn.commit()
+    
+    def get(self, location: str) -> Optional[Tuple[Optional[float], Optional[float]]]:
+        """回傳 (lat, lng)；查無結果的快取回傳 (None, None)；未命中回傳 None"""
+        key = normalize_location(location)
+        entry = self._memory.get(key)
+        
+        if entry is None:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                'SELECT lat, lng, expires_at FROM geocode WHERE location_key = ?',
+                (key,)
+            )
+            row = cursor.fetchone()
+            if row:
+                entry = (row[0], row[1], datetime.fromisoformat(row[2]).timestamp())
+                self._remember(key, entry)
+        
+        if entry is None or entry[2] <= time.time():
+            self.stats["misses"] += 1
+            GEOCODE_CACHE_REQUESTS.inc(result="miss")
+            return None
+        
+        if entry[0] is None:
+            self.stats["negative_hits"] += 1
+            GEOCODE_CACHE_REQUESTS.inc(result="negative_hit")
+        else:
+            self.stats["hits"] += 1
+            GEOCODE_CACHE_REQUESTS.inc(result="hit")
+        return entry[0], entry[1]
+    
+    def set(self, location: str, lat: Optional[float], lng: Optional[float]):
+        """儲存座標；lat/lng 為 None 代表地點查無結果"""
+        key = normalize_location(location)
+        ttl = GEOCODE_TTL if lat is not None else GEOCODE_NEGATIVE_TTL
+        expires_at = datetime.now() + ttl
+        self._remember(key, (lat, lng, expires_at.timestamp()))
+        
+        write_queue.submit('''
+            INSERT OR REPLACE INTO geocode
+            (location_key, location, lat, lng, expires_at)
             VALUES (?, ?, ?, ?, ?)
-        ''', (query_hash, keyword, location, json.dumps(response), expires_at.isoformat()))
+        ''', (key, location, lat, lng, expires_at.isoformat()))
+    
+    def purge_expired(self) -> int:
+        """刪除過期的座標快取"""
+        cursor = self.conn.cursor()
+        cursor.execute('DELETE FROM geocode WHERE expires_at <= ?', (datetime.now().isoformat(),))
         self.conn.commit()
+        return cursor.rowcount
+    
+    def _remember(self, key: str, entry: Tuple[Optional[float], Optional[float], float]):
+        self._memory.pop(key, None)
+        self._memory[key] = entry
+        if len(self._memory) > GEOCODE_MEMORY_MAX:
+            # 移除最早放入的項目
+            del self._memory[next(iter(self._memory))]
+    
+    def hit_ratio(self) -> float:
+        total = self.stats["hits"] + self.stats["negative_hits"] + self.stats["misses"]
+        return round((self.stats["hits"] + self.stats["negative_hits"]) / total, 4) if total else 0.0
@@ -1,84 +1,34 @@
 import time
-import requests
+import httpx
 import json
+from typing import AsyncIterator, Dict, List, Optional
 
-from config import LAB_API_TOKEN, LAB_MODEL,LAB_OLLAMA_API
+from config import BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT, LAB_API_TOKEN, LAB_MODEL,LAB_OLLAMA_API
+from metrics import LLM_TOKENS_PER_SECOND, STAGE_SECONDS, UPSTREAM_ERRORS
+from health import UpstreamHealth
+from resilience import CircuitBreaker, Deadline, DeadlineExceeded, stage_timeout
 
-# 實驗室 Ollama
-class ChatAPIHandler:
-    """實驗室 Ollama API 處理器"""
+# 生成與連線測試的逾時上限（秒），實際逾時不超過請求剩餘時間
+GENERATE_TIMEOUT = 180.0
+TEST_TIMEOUT = 10.0
+
+
+class LLMStatusError(Exception):
+    """實驗室 API 回傳非 200 狀態碼"""
     
-    @staticmethod
-    def call_chat_api(prompt: str) -> str:
-        """呼叫實驗室 Ollama API"""
-        
-        try:
-            print(f"🤖 呼叫實驗室 Ollama API...")
-            
-            headers = {
-                "Authorization": f"Bearer {LAB_API_TOKEN}",
-                "Content-Type": "application/json"
-            }
-            
-            # 增加 max_tokens 確保有足夠內容
-            payload = {
-                "model": LAB_MODEL,
-                "prompt": prompt,
-                "stream": True,
-                "temperature": 0.7,
-                "max_tokens": 3500,  # 增加到 3500 tokens
-                "top_p": 0.9,
-                "stop": ["\n\n##", "### END", "====="]
-            }
-            
-            start_time = time.time()
-            response = requests.post(
-                LAB_OLLAMA_API,
-                headers=headers,
-                json=payload,
-                stream=True,
-                timeout=180,  # 增加超時時間
-                verify=False
-            )
-            
-            print(f"📡 回應狀態碼: {response.status_code}")
-            
-            if response.status_code == 200:
-                full_response = ""
-                chunk_count = 0
-                
-                for line in response.iter_lines():
-                    if line:
-                        chunk_count += 1
-                        try:
-                            line_str = line.decode('utf-8')
-                            
-                            if line_str.startswith("data: "):
-                                line_str = line_str[6:]
-                            
-                            data = json.loads(line_str)
-                            
-                            if "response" in data:
-                                full_response += data["response"]
-                            
-                            if data.get("done", False):
-                                break
-                                
-                        except:
-                            continue
-                
-                elapsed = time.time() - start_time
-                print(f"✅ 收到完整回應 (耗時: {elapsed:.1f}秒, 區塊數: {chunk_count})")
-                print(f"回應原始長度: {len(full_response)} 字元")
-                
-                if full_response:
-                    # 直接返回原始回應
-                    print(f"返回長度: {len(full_response)} 字元")
-                    
-                    # 檢查回應是否足夠詳細
-                    if len(full_response) < 600:
-                        print(f"⚠️ AI回應可能不夠詳細，添加補充說明")
-                        full_response += "\n\n" + """
+    def __init__(self, status_code: int):
+        super().__init__(f"LLM API 錯誤碼: {status_code}")
+        self.status_code = status_code
+
+class LLMEmptyResponse(Exception):
+    """實驗室 API 完成回應但沒有任何內容"""
+    
+    def __init__(self):
+        super().__init__("LLM API 回傳空內容")
+
+
+# 完整分析內容過短時附加的補充說明
+SHORT_RESPONSE_SUPPLEMENT = """
 ## 🔍 補充建議：
 
 由於AI回應較為簡短，這裡提供一些額外建議：
@@ -106,78 +56,210 @@ class ChatAPIHandler:
 - 💰💰💰💰 (4/4)：高價，600元以上
 
 祝您用餐愉快！ 🍽️"""
-                    
-                    return full_response
-                else:
-                    print("⚠️ 收到空回應")
-                    return ChatAPIHandler._fallback_response(prompt)
-            
-            else:
-                print(f"❌ API 錯誤: {response.status_code}")
-                return ChatAPIHandler._fallback_response(prompt, error_code=response.status_code)
+
+# 實驗室 Ollama
+class ChatAPIHandler:
+    """實驗室 Ollama API 處理器（非同步、共用連線池）"""
+    
+    def __init__(self):
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(180.0, connect=10.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            verify=False
+        )
+        self.breaker = CircuitBreaker("llm", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+        # 實際請求以第一個 token 的時間作為延遲樣本
+        self.health = UpstreamHealth("ai_api")
+    
+    async def aclose(self):
+        """關閉連線池"""
+        await self.client.aclose()
+    
+    async def _stream_tokens(self, prompt: str, deadline: Optional[Deadline] = None,
+                             max_tokens: int = 3500, usage: Optional[Dict] = None) -> AsyncIterator[str]:
+        """串流呼叫實驗室 Ollama API，逐段產出生成的文字；熔斷中拋出 CircuitOpenError
+        
+        傳入 usage 時，完成後累加 prompt_tokens / output_tokens（上游未回報時以字數、區塊數估計）
+        """
+        headers = {
+            "Authorization": f"Bearer {LAB_API_TOKEN}",
+            "Content-Type": "application/json"
+        }
+        
+        # 增加 max_tokens 確保有足夠內容
+        payload = {
+            "model": LAB_MODEL,
+            "prompt": prompt,
+            "stream": True,
+            "temperature": 0.7,
+            "max_tokens": max_tokens,
+            # Ollama 原生 API 以 num_predict 限制生成長度
+            "options": {"num_predict": max_tokens},
+            "top_p": 0.9,
+            "stop": ["\n\n##", "### END", "====="]
+        }
+        
+        timeout = stage_timeout(deadline, GENERATE_TIMEOUT)
+        self.breaker.allow()
+        
+        start_time = time.time()
+        first_token_time = None
+        chunk_count = 0
+        eval_count = None
+        prompt_eval_count = None
+        try:
+            async with self.client.stream(
+                "POST",
+                LAB_OLLAMA_API,
+                headers=headers,
+                json=payload,
+                timeout=timeout
+            ) as response:
+                print(f"📡 回應狀態碼: {response.status_code}")
                 
-        except requests.exceptions.Timeout:
-            print("⏰ 實驗室 API 回應超時")
-            return ChatAPIHandler._fallback_response(prompt, timeout=True)
-        except Exception as e:
-            print(f"❌ 未預期錯誤: {e}")
-            return ChatAPIHandler._fallback_response(prompt)
+                if response.status_code != 200:
+                    UPSTREAM_ERRORS.inc(upstream="llm", kind=str(response.status_code))
+                    raise LLMStatusError(response.status_code)
+                
+                async for line_str in response.aiter_lines():
+                    if deadline is not None and deadline.expired():
+                        raise DeadlineExceeded("AI 生成超過請求期限")
+                    if not line_str:
+                        continue
+                    chunk_count += 1
+                    
+                    if line_str.startswith("data: "):
+                        line_str = line_str[6:]
+                    
+                    try:
+                        data = json.loads(line_str)
+                    except json.JSONDecodeError:
+                        continue
+                    
+                    if data.get("response"):
+                        if first_token_time is None:
+                            first_token_time = time.time()
+                            STAGE_SECONDS.observe(first_token_time - start_time, stage="llm_ttft")
+                            # 開始產生內容即視為上游正常
+                            self.breaker.record_success()
+                            self.health.record(True, first_token_time - start_time)
+                        yield data["response"]
+                    
+                    if data.get("done", False):
+                        eval_count = data.get("eval_count")
+                        prompt_eval_count = data.get("prompt_eval_count")
+                        break
+        except LLMStatusError as e:
+            self.breaker.record_failure()
+            self.health.record(False, time.time() - start_time, error=str(e.status_code))
+            raise
+        except httpx.TimeoutException as e:
+            if timeout < GENERATE_TIMEOUT:
+                # 被請求期限截斷，不算上游故障
+                raise DeadlineExceeded("AI 生成超過請求期限") from e
+            self.breaker.record_failure()
+            self.health.record(False, time.time() - start_time, error="timeout")
+            raise
+        except httpx.HTTPError as e:
+            self.breaker.record_failure()
+            self.health.record(False, time.time() - start_time, error=type(e).__name__)
+            raise
+        
+        if first_token_time is None:
+            # 空回應：上游可連線，但沒有內容
+            self.breaker.record_success()
+            self.health.record(True, time.time() - start_time)
+        
+        elapsed = time.time() - start_time
+        STAGE_SECONDS.observe(elapsed, stage="llm_total")
+        if first_token_time is not None and elapsed > first_token_time - start_time:
+            # 未回報 eval_count 時以串流區塊數估計 token 數
+            tokens = eval_count or chunk_count
+            LLM_TOKENS_PER_SECOND.observe(tokens / (elapsed - (first_token_time - start_time)))
+        if usage is not None:
+            # 繁體中文約一字一 token；串流每個區塊約一個 token
+            usage["prompt_tokens"] = usage.get("prompt_tokens", 0) + (prompt_eval_count or len(prompt))
+            usage["output_tokens"] = usage.get("output_tokens", 0) + (eval_count or chunk_count)
+            usage["estimated"] = usage.get("estimated", False) or not (prompt_eval_count and eval_count)
+        print(f"✅ 收到完整回應 (耗時: {elapsed:.1f}秒, 區塊數: {chunk_count})")
     
-    @staticmethod
-    def _fallback_response(prompt: str, **kwargs) -> str:
-        """改進的備用回應"""
-        if kwargs.get('timeout'):
-            return """## ⏰ 回應超時
-
-很抱歉，AI分析服務回應時間過長。
-
-### 暫時建議：
-1. 查看下方餐廳列表自行選擇
-2. 使用 Google Maps 查看即時評價
-3. 稍後再試 AI 分析功能
-
-### 快速選擇指南：
-- 優先選擇評分4.5星以上的餐廳
-- 注意營業狀態（🟢營業中）
-- 查看地址確認交通便利性"""
+    async def generate(self, prompt: str, deadline: Optional[Deadline] = None, max_tokens: int = 3500,
+                       usage: Optional[Dict] = None, received: Optional[List[str]] = None) -> str:
+        """取得原始生成內容，不補充說明也不改用備用回應；錯誤直接拋出由呼叫端處理
         
-        error_code = kwargs.get('error_code')
-        if error_code:
-            return f"""## ❌ 服務暫時不可用 (錯誤碼: {error_code})
-
-暫時無法提供 AI 分析，請參考下方的餐廳列表。
-
-### 手動選擇建議：
-1. **評分排序**：從高到低查看
-2. **價格篩選**：根據預算選擇
-3. **位置考量**：選擇步行可達的餐廳
-4. **營業狀態**：優先選擇營業中的店家"""
+        傳入 received 時，每段內容到達即附加，逾時被取消後呼叫端仍可取得已生成的部分
+        """
+        full_response = ""
+        async for token in self._stream_tokens(prompt, deadline, max_tokens, usage):
+            full_response += token
+            if received is not None:
+                received.append(token)
+        return full_response
+    
+    async def call_chat_api(self, prompt: str, deadline: Optional[Deadline] = None, max_tokens: int = 3500,
+                            usage: Optional[Dict] = None, pad_short: bool = True,
+                            received: Optional[List[str]] = None) -> str:
+        """呼叫實驗室 Ollama API；上游錯誤、逾時與空回應直接拋出，由呼叫端改用快速推薦（不寫入快取）
         
-        return """## 🍽️ 餐廳推薦指南
-
-### 選擇策略
-1. **評分優先**：4.5星以上餐廳品質較穩定
-2. **評價數量**：評價數越多參考價值越高
-3. **近期評論**：查看最近一個月的評價
-4. **照片驗證**：參考其他顧客上傳的照片
-
-### 價格參考
-- 💰 (1/4)：平價，約150-250元
-- 💰💰 (2/4)：中等，約250-400元
-- 💰💰💰 (3/4)：中高價，約400-600元
-- 💰💰💰💰 (4/4)：高價，600元以上
-
-### 實用技巧
-- **最佳時段**：平日11:00-12:30或17:00-18:30
-- **預約建議**：週末或熱門餐廳建議預約
-- **交通考量**：從火車站步行10分鐘內最佳
-- **拍照時機**：上午自然光最適合拍照
-
-*註：AI分析服務暫時不可用，此為基本選擇指南。*"""
+        pad_short 為 False 時（簡短回答），內容過短也不附加補充說明；received 與 generate 相同
+        """
+        print(f"🤖 呼叫實驗室 Ollama API...")
+        
+        full_response = ""
+        async for token in self._traced(self._stream_tokens(prompt, deadline, max_tokens, usage)):
+            full_response += token
+            if received is not None:
+                received.append(token)
+        
+        print(f"回應原始長度: {len(full_response)} 字元")
+        if not full_response:
+            print("⚠️ 收到空回應")
+            raise LLMEmptyResponse()
+        
+        # 檢查回應是否足夠詳細
+        if pad_short and len(full_response) < 600:
+            print(f"⚠️ AI回應可能不夠詳細，添加補充說明")
+            full_response += "\n\n" + SHORT_RESPONSE_SUPPLEMENT
+        
+        return full_response
+    
+    async def stream_chat_api(self, prompt: str, deadline: Optional[Deadline] = None, max_tokens: int = 3500,
+                              usage: Optional[Dict] = None) -> AsyncIterator[str]:
+        """串流呼叫實驗室 Ollama API；錯誤直接拋出，已送出的內容由呼叫端以快速推薦接續"""
+        print(f"🤖 串流呼叫實驗室 Ollama API...")
+        received = False
+        async for token in self._traced(self._stream_tokens(prompt, deadline, max_tokens, usage)):
+            received = True
+            yield token
+        
+        if not received:
+            print("⚠️ 收到空回應")
+            raise LLMEmptyResponse()
     
     @staticmethod
-    def test_connection() -> bool:
-        """測試連接"""
+    async def _traced(tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+        """轉送生成內容，記錄錯誤後原樣拋出"""
+        try:
+            async for token in tokens:
+                yield token
+        except LLMStatusError as e:
+            print(f"❌ API 錯誤: {e.status_code}")
+            raise
+        except DeadlineExceeded:
+            print("⏰ 已超過請求期限，停止等待 AI 回應")
+            raise
+        except httpx.TimeoutException:
+            print("⏰ 實驗室 API 回應超時")
+            UPSTREAM_ERRORS.inc(upstream="llm", kind="timeout")
+            raise
+        except httpx.HTTPError as e:
+            print(f"❌ 連線錯誤: {e}")
+            UPSTREAM_ERRORS.inc(upstream="llm", kind=type(e).__name__)
+            raise
+    
+    async def test_connection(self) -> bool:
+        """測試連接（結果記錄為健康探測樣本）"""
+        start = time.time()
         try:
             headers = {
                 "Authorization": f"Bearer {LAB_API_TOKEN}",
@@ -188,19 +270,24 @@ class ChatAPIHandler:
                 "model": LAB_MODEL,
                 "prompt": "簡單測試，請回應'OK'",
                 "stream": False,
-                "max_tokens": 10
+                "max_tokens": 10,
+                # Ollama 忽略 max_tokens，探測同樣以 num_predict 限制長度
+                "options": {"num_predict": 10}
             }
             
-            response = requests.post(
+            response = await self.client.post(
                 LAB_OLLAMA_API,
                 headers=headers,
                 json=test_payload,
-                timeout=10,
-                verify=False
+                timeout=TEST_TIMEOUT
             )
             
-            return response.status_code == 200
+            ok = response.status_code == 200
+            self.health.record(ok, time.time() - start, "probe", None if ok else str(response.status_code))
+            return ok
                 
-        except:
+        except httpx.HTTPError as e:
+            print(f"❌ 連線測試失敗: {type(e).__name__}")
+            self.health.record(False, time.time() - start, "probe", type(e).__name__)
             return False
 
@@ -1,67 +1,232 @@
+import asyncio
 import time
-import requests
+from typing import Dict, List, Optional, Tuple
 
-from config import GOOGLE_MAPS_API_KEY
+import httpx
+
+from config import (BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT, GOOGLE_MAPS_API_KEY, GOOGLE_MAPS_API_BASE,
+                    MAPS_PAGE_TOKEN_DELAY)
+from metrics import STAGE_SECONDS, UPSTREAM_ERRORS
+from health import UpstreamHealth
+from resilience import CircuitBreaker, Deadline, DeadlineExceeded, UpstreamUnavailable, stage_timeout
+
+GEOCODE_URL = f"{GOOGLE_MAPS_API_BASE}/geocode/json"
+NEARBY_SEARCH_URL = f"{GOOGLE_MAPS_API_BASE}/place/nearbysearch/json"
+PLACE_DETAILS_URL = f"{GOOGLE_MAPS_API_BASE}/place/details/json"
+
+# 各階段逾時上限（秒），實際逾時不超過請求剩餘時間
+GEOCODE_TIMEOUT = 5.0
+SEARCH_TIMEOUT = 10.0
+DETAILS_TIMEOUT = 5.0
+# 代表上游正常的狀態；INVALID_REQUEST、NOT_FOUND 為請求本身的問題，不計入熔斷
+MAPS_OK_STATUSES = ("OK", "ZERO_RESULTS", "INVALID_REQUEST", "NOT_FOUND")
+# Nearby Search 每頁 20 筆，最多 3 頁
+MAX_PAGES = 3
+PAGE_TOKEN_RETRIES = 2
 
 # Google Maps
 class GoogleMapsSearcher:
-    """Google Maps 搜尋"""
-    
-    @staticmethod
-    def get_coordinates(location: str):
-        """取得座標"""
+    """Google Maps 搜尋（非同步、共用連線池）"""
+
+    def __init__(self, geocode_cache=None):
+        self.geocode_cache = geocode_cache
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20)
+        )
+        self.breaker = CircuitBreaker("maps", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+        self.health = UpstreamHealth("google_maps")
+
+    async def aclose(self):
+        """關閉連線池"""
+        await self.client.aclose()
+
+    async def _get_json(self, url: str, params: dict, upstream: str, cap: float, deadline: Optional[Deadline]) -> dict:
+        """經過熔斷器送出 GET，逾時不超過請求剩餘時間；上游錯誤拋出 UpstreamUnavailable"""
+        timeout = stage_timeout(deadline, cap)
+        self.breaker.allow()
+        start = time.monotonic()
         try:
-            url = "https://maps.googleapis.com/maps/api/geocode/json"
-            params = {
-                "address": location,
-                "key": GOOGLE_MAPS_API_KEY,
-                "language": "zh-TW"
-            }
-            
-            response = requests.get(url, params=params, timeout=5)
+            response = await self.client.get(url, params=params, timeout=timeout)
             data = response.json()
-            
-            if data["status"] == "OK":
-                loc = data["results"][0]["geometry"]["location"]
-                return loc["lat"], loc["lng"]
-        except:
-            pass
+        except httpx.TimeoutException as e:
+            if timeout < cap:
+                # 被請求期限截斷，不算上游故障
+                raise DeadlineExceeded(f"{upstream} 超過請求期限") from e
+            self.breaker.record_failure()
+            self.health.record(False, time.monotonic() - start, error="timeout")
+            UPSTREAM_ERRORS.inc(upstream=upstream, kind="timeout")
+            raise UpstreamUnavailable(upstream, "timeout") from e
+        except (httpx.HTTPError, ValueError) as e:
+            self.breaker.record_failure()
+            self.health.record(False, time.monotonic() - start, error=type(e).__name__)
+            UPSTREAM_ERRORS.inc(upstream=upstream, kind=type(e).__name__)
+            raise UpstreamUnavailable(upstream, type(e).__name__) from e
+
+        status = data.get("status")
+        if status in MAPS_OK_STATUSES:
+            self.breaker.record_success()
+            self.health.record(True, time.monotonic() - start)
+            return data
+        self.breaker.record_failure()
+        self.health.record(False, time.monotonic() - start, error=status)
+        UPSTREAM_ERRORS.inc(upstream=upstream, kind=status)
+        raise UpstreamUnavailable(upstream, status)
+
+    async def probe(self) -> bool:
+        """健康探測：送出一次 Geocoding 請求（不經熔斷器，也不影響熔斷狀態）"""
+        start = time.monotonic()
+        try:
+            response = await self.client.get(
+                GEOCODE_URL, params={"address": "台北", "key": GOOGLE_MAPS_API_KEY}, timeout=GEOCODE_TIMEOUT
+            )
+            status = response.json().get("status")
+        except (httpx.HTTPError, ValueError) as e:
+            self.health.record(False, time.monotonic() - start, "probe", type(e).__name__)
+            return False
+        ok = status in MAPS_OK_STATUSES
+        self.health.record(ok, time.monotonic() - start, "probe", None if ok else status)
+        return ok
+
+    async def get_coordinates(self, location: str, deadline: Optional[Deadline] = None):
+        """取得座標（優先使用地點快取），查無地點回傳 (None, None)"""
+        if self.geocode_cache is not None:
+            cached = self.geocode_cache.get(location)
+            if cached is not None:
+                return cached
+
+        params = {
+            "address": location,
+            "key": GOOGLE_MAPS_API_KEY,
+            "language": "zh-TW"
+        }
+
+        with STAGE_SECONDS.time(stage="geocode"):
+            data = await self._get_json(GEOCODE_URL, params, "maps_geocode", GEOCODE_TIMEOUT, deadline)
+
+        if data["status"] == "OK":
+            loc = data["results"][0]["geometry"]["location"]
+            if self.geocode_cache is not None:
+                self.geocode_cache.set(location, loc["lat"], loc["lng"])
+            return loc["lat"], loc["lng"]
+
+        # 只快取確定查無結果的地點，暫時性錯誤不快取
+        if data["status"] == "ZERO_RESULTS" and self.geocode_cache is not None:
+            self.geocode_cache.set(location, None, None)
         return None, None
-    
+
+    async def _search_pages(self, lat: float, lng: float, keyword: str, radius: int, max_results: int,
+                            deadline: Optional[Deadline]) -> Tuple[List[dict], bool]:
+        """回傳 (已取得的所有餐廳, 是否已取得該範圍內的全部結果)；最後一頁超出 max_results 的部分也保留給本機索引"""
+        params = {
+            "location": f"{lat},{lng}",
+            "radius": radius,
+            "type": "restaurant",
+            "key": GOOGLE_MAPS_API_KEY,
+            "language": "zh-TW"
+        }
+
+        if keyword:
+            params["keyword"] = keyword
+
+        with STAGE_SECONDS.time(stage="nearby_search"):
+            data = await self._get_json(NEARBY_SEARCH_URL, params, "maps_search", SEARCH_TIMEOUT, deadline)
+        places = data.get("results", [])
+
+        pages = 1
+        token = data.get("next_page_token")
+        while token and len(places) < max_results and pages < MAX_PAGES:
+            # token 需等待一段時間才生效；剩餘時間不夠再取一頁就停止
+            if deadline is not None and deadline.remaining() < MAPS_PAGE_TOKEN_DELAY + 1:
+                print(f"⏱️ 搜尋時間不足，停在第 {pages} 頁 ({keyword})")
+                break
+            try:
+                data = await self._next_page(token, deadline)
+            except (UpstreamUnavailable, DeadlineExceeded) as e:
+                print(f"⚠️ 取得第 {pages + 1} 頁失敗 ({keyword}): {e}")
+                break
+            if data is None:
+                break
+            places.extend(data.get("results", []))
+            token = data.get("next_page_token")
+            pages += 1
+
+        return [self._to_restaurant(place) for place in places], token is None
+
+    async def _next_page(self, token: str, deadline: Optional[Deadline]) -> Optional[dict]:
+        """以 next_page_token 取得下一頁；token 尚未生效（INVALID_REQUEST）時稍後重試"""
+        params = {"pagetoken": token, "key": GOOGLE_MAPS_API_KEY, "language": "zh-TW"}
+        for attempt in range(PAGE_TOKEN_RETRIES + 1):
+            await asyncio.sleep(MAPS_PAGE_TOKEN_DELAY if attempt == 0 else MAPS_PAGE_TOKEN_DELAY / 2)
+            with STAGE_SECONDS.time(stage="nearby_search"):
+                data = await self._get_json(NEARBY_SEARCH_URL, params, "maps_search", SEARCH_TIMEOUT, deadline)
+            if data["status"] != "INVALID_REQUEST":
+                return data
+        return None
+
+    async def search_many(self, lat: float, lng: float, keywords: List[str], radius: int = 1000, max_results: int = 5,
+                          deadline: Optional[Deadline] = None) -> Tuple[List[dict], Dict[str, bool]]:
+        """同時搜尋多個關鍵字並以 place_id 去除重複；回傳 (餐廳, 各關鍵字是否取得全部結果)，全部失敗時拋出第一個錯誤"""
+        keywords = list(dict.fromkeys(keywords)) or ["餐廳"]
+        results = await asyncio.gather(
+            *(self._search_pages(lat, lng, keyword, radius, max_results, deadline) for keyword in keywords),
+            return_exceptions=True
+        )
+
+        merged: Dict[str, dict] = {}
+        complete: Dict[str, bool] = {}
+        errors = []
+        for keyword, result in zip(keywords, results):
+            if isinstance(result, BaseException):
+                if not isinstance(result, (UpstreamUnavailable, DeadlineExceeded)):
+                    raise result
+                print(f"⚠️ 關鍵字「{keyword}」搜尋失敗: {result}")
+                errors.append(result)
+                continue
+            result, complete[keyword] = result
+            for restaurant in result:
+                key = restaurant["place_id"] or f"{restaurant['name']}|{restaurant['address']}"
+                if key in merged:
+                    merged[key]["matched_keywords"].append(keyword)
+                else:
+                    restaurant["matched_keywords"] = [keyword]
+                    merged[key] = restaurant
+
+        if errors and len(errors) == len(keywords):
+            raise errors[0]
+        return list(merged.values()), complete
+
+    async def place_details(self, place_id: str, deadline: Optional[Deadline] = None) -> Optional[dict]:
+        """只取得會變動的欄位（營業狀態、評分），查無此店回傳 None"""
+        params = {
+            "place_id": place_id,
+            "fields": "opening_hours,rating,user_ratings_total",
+            "key": GOOGLE_MAPS_API_KEY,
+            "language": "zh-TW"
+        }
+        with STAGE_SECONDS.time(stage="place_details"):
+            data = await self._get_json(PLACE_DETAILS_URL, params, "maps_details", DETAILS_TIMEOUT, deadline)
+        if data["status"] != "OK":
+            return None
+        result = data.get("result", {})
+        return {
+            "open_now": result.get("opening_hours", {}).get("open_now"),
+            "rating": result.get("rating"),
+            "user_ratings_total": result.get("user_ratings_total")
+        }
+
     @staticmethod
-    def search_restaurants(lat: float, lng: float, keyword: str = "餐廳", radius: int = 1000, max_results: int = 5):
-        """搜尋餐廳"""
-        try:
-            url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
-            params = {
-                "location": f"{lat},{lng}",
-                "radius": radius,
-                "type": "restaurant",
-                "key": GOOGLE_MAPS_API_KEY,
-                "language": "zh-TW"
-            }
-            
-            if keyword:
-                params["keyword"] = keyword
-            
-            response = requests.get(url, params=params, timeout=10)
-            data = response.json()
-            
-            if data["status"] == "OK":
-                restaurants = []
-                for place in data.get("results", [])[:max_results]:
-                    restaurant = {
-                        "name": place.get("name", "未知"),
-                        "address": place.get("vicinity", "地址不明"),
-                        "rating": place.get("rating"),
-                        "price_level": place.get("price_level"),
-                        "types": place.get("types", []),
-                        "open_now": place.get("opening_hours", {}).get("open_now"),
-                        "source": "google_maps",
-                        "place_id": place.get("place_id", "")
-                    }
-                    restaurants.append(restaurant)
-                return restaurants
-        except:
-            pass
-        return []
\ No newline at end of file
+    def _to_restaurant(place: dict) -> dict:
+        return {
+            "name": place.get("name", "未知"),
+            "address": place.get("vicinity", "地址不明"),
+            "rating": place.get("rating"),
+            "user_ratings_total": place.get("user_ratings_total"),
+            "price_level": place.get("price_level"),
+            "types": place.get("types", []),
+            "open_now": place.get("opening_hours", {}).get("open_now"),
+            "source": "google_maps",
+            "place_id": place.get("place_id", ""),
+            "lat": place.get("geometry", {}).get("location", {}).get("lat"),
+            "lng": place.get("geometry", {}).get("location", {}).get("lng")
+        }
@@ -5,5 +5,48 @@ load_dotenv()
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
 LAB_API_TOKEN = os.getenv("LAB_API_TOKEN")
 
-LAB_OLLAMA_API = "https://api-gateway.netdb.csie.ncku.edu.tw/api/generate"
-LAB_MODEL = "gemma3:4b"
+# 上游位址可由環境變數覆寫（例如指向 bench/mock_upstreams.py）
+GOOGLE_MAPS_API_BASE = os.getenv("GOOGLE_MAPS_API_BASE", "https://maps.googleapis.com/maps/api")
+LAB_OLLAMA_API = os.getenv("LAB_OLLAMA_API", "https://api-gateway.netdb.csie.ncku.edu.tw/api/generate")
+LAB_MODEL = os.getenv("LAB_MODEL", "gemma3:4b")
+
+# LLM 閘道並行上限與等待佇列
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+# 排隊加生成的時間上限（串流為第一個 token 的時間），超過即改用快速推薦
+LLM_LATENCY_BUDGET = float(os.getenv("LLM_LATENCY_BUDGET", "60"))
+# 排隊等待上限，預設與時間預算相同（實際仍受請求的 AI 截止時間限制）
+LLM_MAX_QUEUE_WAIT = float(os.getenv("LLM_MAX_QUEUE_WAIT", str(LLM_LATENCY_BUDGET)))
+
+# 過期快取背景更新失敗後，同條件再次嘗試前等待的秒數（期間繼續回傳過期內容）
+REFRESH_RETRY_DELAY = float(os.getenv("REFRESH_RETRY_DELAY", "300"))
+
+# 單一請求的整體期限（地點、搜尋、AI 分析共用）
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "90"))
+# 上游熔斷：連續失敗次數門檻與冷卻秒數
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+# Nearby Search：分頁 token 生效前需等待的秒數，以及所有關鍵字與分頁共用的時間上限
+MAPS_PAGE_TOKEN_DELAY = float(os.getenv("MAPS_PAGE_TOKEN_DELAY", "2.0"))
+MAPS_SEARCH_BUDGET = float(os.getenv("MAPS_SEARCH_BUDGET", "8.0"))
+
+# 快取預熱：檢查間隔與提前更新的秒數、每次最多預熱的查詢數與估計 token 數、候選的熱門查詢數
+WARMUP_INTERVAL = float(os.getenv("WARMUP_INTERVAL", "1800"))
+WARMUP_LOOKAHEAD = float(os.getenv("WARMUP_LOOKAHEAD", str(6 * 3600)))
+WARMUP_MAX_QUERIES = int(os.getenv("WARMUP_MAX_QUERIES", "20"))
+WARMUP_TOKEN_BUDGET = int(os.getenv("WARMUP_TOKEN_BUDGET", "60000"))
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", "50"))
+# 允許預熱的時段（例如 "3,4,5,15,16"），未設定時依請求紀錄自動判斷離峰
+WARMUP_HOURS = {int(h) for h in os.getenv("WARMUP_HOURS", "").split(",") if h.strip()}
+
+# 啟動：元件初始化完成前，請求最多等待的秒數（超過回傳 503）
+STARTUP_READY_WAIT = float(os.getenv("STARTUP_READY_WAIT", "30"))
+# 初始化失敗（例如 cache.db 被鎖住）時的重試次數與第一次退避秒數（之後每次加倍），全部失敗則結束行程
+STARTUP_INIT_ATTEMPTS = int(os.getenv("STARTUP_INIT_ATTEMPTS", "5"))
+STARTUP_RETRY_BACKOFF = float(os.getenv("STARTUP_RETRY_BACKOFF", "1"))
+
+# 上游健康監控：探測間隔（秒）、隨機抖動比例、統計視窗（秒）
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "60"))
+HEALTH_PROBE_JITTER = float(os.getenv("HEALTH_PROBE_JITTER", "0.2"))
+HEALTH_WINDOW = float(os.getenv("HEALTH_WINDOW", "300"))
@@ -0,0 +1,134 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+BASE_DIR = Path(__file__).parent
+# 可由環境變數指定其他位置（例如測試使用暫存檔）
+CACHE_DB = Path(os.getenv("CACHE_DB", BASE_DIR / "cache.db"))
+
+# 多個 worker 共用 cache.db 時等待鎖的上限
+BUSY_TIMEOUT_MS = 5000
+# 背景寫入：每批最多筆數與最長等待時間
+WRITE_BATCH_MAX = 200
+WRITE_FLUSH_INTERVAL = 0.05
+
+_local = threading.local()
+
+
+def get_connection() -> sqlite3.Connection:
+    """取得目前執行緒專用的 SQLite 連線（WAL 模式）"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(CACHE_DB, timeout=BUSY_TIMEOUT_MS / 1000)
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        _local.conn = conn
+    return conn
+
+
+class WriteBehindQueue:
+    """背景寫入佇列：請求只負責排入，由單一執行緒將多筆寫入合併成一個交易"""
+
+    def __init__(self):
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.stats: Dict[str, Any] = {"writes": 0, "batches": 0, "max_batch": 0, "errors": 0}
+
+    def submit(self, sql: str, params: Sequence = (), many: bool = False):
+        """排入一筆寫入；many=True 時 params 為多組參數"""
+        self._ensure_started()
+        self._queue.put((sql, params, many))
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def flush(self):
+        """等待目前排入的寫入全部完成"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                if self._thread is not None:
+                    print("⚠️ 快取寫入執行緒已停止，重新啟動")
+                self._thread = threading.Thread(target=self._run, name="cache-write-behind", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + WRITE_FLUSH_INTERVAL
+            while len(batch) < WRITE_BATCH_MAX:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self._write(batch)
+            except Exception as e:
+                # 任何錯誤都不能讓寫入執行緒結束，否則之後的寫入全部遺失且 flush() 永遠等待
+                self.stats["errors"] += len(batch)
+                print(f"❌ 快取批次寫入失敗 ({len(batch)} 筆): {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        conn = get_connection()
+        try:
+            with conn:
+                for sql, params, many in batch:
+                    if many:
+                        conn.executemany(sql, params)
+                    else:
+                        conn.execute(sql, params)
+            self.stats["writes"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+        except Exception as e:
+            # 整批失敗時逐筆重試，避免單筆錯誤拖累其他寫入
+            print(f"❌ 快取批次寫入失敗 ({len(batch)} 筆): {e}")
+            for sql, params, many in batch:
+                try:
+                    with conn:
+                        if many:
+                            conn.executemany(sql, params)
+                        else:
+                            conn.execute(sql, params)
+                    self.stats["writes"] += 1
+                except Exception as item_error:
+                    self.stats["errors"] += 1
+                    print(f"❌ 快取寫入失敗: {item_error}")
+
+
+write_queue = WriteBehindQueue()
+
+
+def try_acquire_lease(name: str, owner: str, ttl: float) -> bool:
+    """在 cache.db 中取得或續約具名租約；同時只有一個 owner 持有，過期後其他行程可接手"""
+    conn = get_connection()
+    now = time.time()
+    with conn:
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+        conn.execute('''
+            INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+            WHERE leases.owner = excluded.owner OR leases.expires_at < ?
+        ''', (name, owner, now + ttl, now))
+        row = conn.execute('SELECT owner FROM leases WHERE name = ?', (name,)).fetchone()
+    return row is not None and row[0] == owner
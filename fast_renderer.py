@@ -0,0 +1,150 @@
+import math
+from typing import Dict, List, Optional
+
+# 評價數的先驗：評價數少的餐廳評分向此平均值收斂
+PRIOR_RATING = 4.0
+PRIOR_WEIGHT = 20
+HIGH_RATED_THRESHOLD = 4.5
+
+# 問題中的預算傾向
+BUDGET_WORDS = ["平價", "便宜", "銅板", "學生", "小吃", "CP值"]
+PREMIUM_WORDS = ["高級", "約會", "慶祝", "精緻", "聚餐", "紀念日"]
+
+PRICE_LABELS = {1: "平價", 2: "中等價位", 3: "中高價位", 4: "高價位"}
+
+
+def _adjusted_rating(restaurant: Dict) -> float:
+    """依評價數修正評分，避免少數評價的滿分店家排在最前"""
+    rating = restaurant.get('rating') or 0
+    count = restaurant.get('user_ratings_total')
+    if not rating:
+        return 0.0
+    if count is None:
+        return rating
+    return (rating * count + PRIOR_RATING * PRIOR_WEIGHT) / (count + PRIOR_WEIGHT)
+
+
+def _price_preference(question: str) -> Optional[str]:
+    if any(word in question for word in BUDGET_WORDS):
+        return "budget"
+    if any(word in question for word in PREMIUM_WORDS):
+        return "premium"
+    return None
+
+
+def _matches_keyword(restaurant: Dict, keyword: str) -> bool:
+    if not keyword or keyword == "餐廳":
+        return False
+    haystack = restaurant.get('name', '') + " " + " ".join(restaurant.get('types') or [])
+    return keyword in haystack
+
+
+def score_restaurant(restaurant: Dict, keyword: str, preference: Optional[str]) -> float:
+    """規則式分數：評分、營業狀態、關鍵字與價格偏好"""
+    score = _adjusted_rating(restaurant)
+
+    open_now = restaurant.get('open_now')
+    if open_now:
+        score += 0.3
+    elif open_now is False:
+        score -= 0.5
+
+    if _matches_keyword(restaurant, keyword):
+        score += 0.3
+
+    price_level = restaurant.get('price_level')
+    if price_level and preference == "budget":
+        score += 0.15 * (2 - price_level)
+    elif price_level and preference == "premium":
+        score += 0.15 * (price_level - 2)
+
+    # 評價數多的店家略為加分
+    count = restaurant.get('user_ratings_total') or 0
+    score += 0.05 * math.log10(count + 1)
+    return score
+
+
+def rank_restaurants(restaurants: List[Dict], question: str, keyword: str) -> List[Dict]:
+    """依規則分數排序，分數相同時以名稱排序確保結果固定"""
+    preference = _price_preference(question)
+    return sorted(
+        restaurants,
+        key=lambda r: (-score_restaurant(r, keyword, preference), r.get('name', ''))
+    )
+
+
+def _reasons(restaurant: Dict, keyword: str, preference: Optional[str]) -> List[str]:
+    reasons = []
+    rating = restaurant.get('rating')
+    count = restaurant.get('user_ratings_total')
+    if rating and rating >= HIGH_RATED_THRESHOLD:
+        reasons.append(f"🏆 高評價 {rating} 星" + (f"（{count} 則評價）" if count else ""))
+    elif rating and rating >= 4.0:
+        reasons.append(f"👍 好評 {rating} 星" + (f"（{count} 則評價）" if count else ""))
+    elif rating:
+        reasons.append(f"評分 {rating} 星")
+
+    if restaurant.get('open_now'):
+        reasons.append("🟢 目前營業中，可以直接前往")
+    elif restaurant.get('open_now') is False:
+        reasons.append("🔴 目前休息中，建議先確認營業時間")
+
+    if _matches_keyword(restaurant, keyword):
+        reasons.append(f"符合「{keyword}」需求")
+
+    price_level = restaurant.get('price_level')
+    if price_level:
+        label = PRICE_LABELS.get(price_level, "")
+        if preference == "budget" and price_level <= 2:
+            reasons.append(f"💰 {label}，符合預算")
+        elif preference == "premium" and price_level >= 3:
+            reasons.append(f"{'💰' * price_level} {label}，適合特別場合")
+        else:
+            reasons.append(f"{'💰' * price_level} {label}")
+    return reasons
+
+
+def render_recommendation(question: str, location: str, restaurants: List[Dict], keyword: str) -> str:
+    """不經 LLM，直接以餐廳資料產生排序後的推薦內容"""
+    preference = _price_preference(question)
+    ranked = rank_restaurants(restaurants, question, keyword)
+    high_rated = [r for r in ranked if (r.get('rating') or 0) >= HIGH_RATED_THRESHOLD]
+    open_now = [r for r in ranked if r.get('open_now')]
+
+    lines = [
+        f"## ⚡ 快速推薦：{location} 附近的{keyword}",
+        "",
+        f"針對「{question}」，依評分、評價數、營業狀態與需求關鍵字整理出以下排名。",
+        "",
+        "### 1. 推薦排名",
+    ]
+    medals = ["🥇", "🥈", "🥉"]
+    for i, r in enumerate(ranked[:3]):
+        lines.append(f"{medals[i]} **{r.get('name', '未知名稱')}**")
+        lines.append(f"   - 地址：{r.get('address', '地址不明')}")
+        for reason in _reasons(r, keyword, preference):
+            lines.append(f"   - {reason}")
+
+    if len(ranked) > 3:
+        lines.append("")
+        lines.append("### 2. 其他選擇")
+        for r in ranked[3:]:
+            rating = r.get('rating')
+            status = "🟢" if r.get('open_now') else ("🔴" if r.get('open_now') is False else "")
+            lines.append(f"- **{r.get('name', '未知名稱')}**" + (f"（{rating} 星）" if rating else "") + f" {status}".rstrip())
+
+    lines.append("")
+    lines.append("### 3. 重點整理")
+    lines.append(f"- 共找到 {len(ranked)} 家餐廳，其中高評價（4.5星以上）{len(high_rated)} 家、營業中 {len(open_now)} 家")
+    if high_rated:
+        lines.append(f"- 最高評價：**{high_rated[0].get('name')}**（{high_rated[0].get('rating')} 星）")
+    if open_now:
+        lines.append(f"- 現在就想吃：**{open_now[0].get('name')}** 目前營業中")
+    if preference == "budget":
+        lines.append("- 預算考量：已優先排序平價店家")
+    elif preference == "premium":
+        lines.append("- 特別場合：已優先排序環境與價位較高的店家")
+
+    lines.append("")
+    lines.append("*註：此為依餐廳資料產生的快速推薦，未經 AI 詳細分析。*")
+    return "\n".join(lines)
@@ -0,0 +1,196 @@
+import re
+import sqlite3
+import time
+from datetime import timedelta
+from typing import Dict, Iterable, List, Tuple
+
+from db import get_connection, write_queue
+
+# 片段只依據店名、類型、價位與評分產生，評分變動緩慢，有效期限可比整份推薦長
+FRAGMENT_TTL = timedelta(days=3)
+FRAGMENT_MEMORY_MAX = 5000
+# 每段片段的字數範圍（寫在提示詞中）
+FRAGMENT_MIN_CHARS = 80
+FRAGMENT_MAX_CHARS = 150
+# 單次生成的片段數上限，避免單一請求的輸出過長
+FRAGMENT_BATCH_MAX = 10
+# 生成上限：每段片段與總結的 token 數
+FRAGMENT_TOKENS = 400
+SUMMARY_TOKENS = 800
+
+_MARKER = re.compile(r"【(\d+)】")
+
+
+def build_fragment_prompt(keyword: str, restaurants: List[Dict]) -> str:
+    """為多家餐廳產生分析片段的提示詞；不含使用者問題與營業狀態，片段才能跨查詢共用"""
+    lines = []
+    for i, r in enumerate(restaurants, 1):
+        info = f"【{i}】{r.get('name', '未知名稱')}"
+        if r.get('rating'):
+            info += f"｜評分 {r['rating']}"
+            if r.get('user_ratings_total'):
+                info += f"（{r['user_ratings_total']} 則評價）"
+        if r.get('price_level'):
+            info += f"｜價格 {'💰' * r['price_level']}"
+        info += f"｜{r.get('address', '地址不明')}"
+        lines.append(info)
+
+    return f"""你是一個專業的台灣美食推薦專家。以下是幾家「{keyword}」相關餐廳：
+
+{chr(10).join(lines)}
+
+請為每家餐廳各寫一段 {FRAGMENT_MIN_CHARS}-{FRAGMENT_MAX_CHARS} 字的分析：特色、可能的招牌菜色、適合的對象與用餐建議。
+- 每段以該餐廳的【編號】開頭，依編號順序輸出
+- 不要加入標題、比較或總結
+- 使用繁體中文"""
+
+
+class FragmentParseError(Exception):
+    """AI 回應中沒有任何可解析的餐廳片段"""
+
+
+def parse_fragments(text: str, count: int) -> Dict[int, str]:
+    """依【編號】切出各餐廳的片段，回傳 {編號(1 起算): 內容}，缺少或過短的編號不回傳"""
+    parts = _MARKER.split(text)
+    fragments = {}
+    # split 結果：[前言, 編號, 內容, 編號, 內容, ...]
+    for number, body in zip(parts[1::2], parts[2::2]):
+        index = int(number)
+        body = body.strip()
+        # 模型常會重複店名資訊行，只保留分析內容
+        first_line, _, rest = body.partition("\n")
+        if rest and "｜" in first_line:
+            body = rest.strip()
+        if 1 <= index <= count and index not in fragments and len(body) >= FRAGMENT_MIN_CHARS // 2:
+            fragments[index] = body
+    return fragments
+
+
+def build_summary_prompt(question: str, location: str, restaurants: List[Dict], fragments: Dict[str, str]) -> str:
+    """以各餐廳片段產生簡短比較與排名的提示詞"""
+    lines = []
+    for i, r in enumerate(restaurants, 1):
+        info = f"{i}. {r.get('name', '未知名稱')}"
+        if r.get('rating'):
+            info += f"（{r['rating']} 星）"
+        if r.get('open_now') is not None:
+            info += " 🟢 營業中" if r['open_now'] else " 🔴 休息中"
+        fragment = fragments.get(r.get('place_id'))
+        if fragment:
+            info += f"\n   {fragment}"
+        lines.append(info)
+
+    return f"""你是一個專業的台灣美食推薦專家。使用者在「{location}」附近詢問：「{question}」。
+以下是附近餐廳與各自的分析：
+
+{chr(10).join(lines)}
+
+請用 300 字以內完成：
+1. 最符合需求的前 3 名與一句話理由
+2. 不同情境（趕時間、預算有限、聚餐）的選擇建議
+使用繁體中文，不要重複每家餐廳的完整介紹。"""
+
+
+def compose_recommendation(summary: str, restaurants: List[Dict], fragments: Dict[str, str]) -> str:
+    """合併總結與各餐廳片段為完整推薦內容"""
+    sections = [summary.strip(), ""] if summary.strip() else []
+    sections.append("## 🏪 各餐廳分析")
+    for i, r in enumerate(restaurants, 1):
+        fragment = fragments.get(r.get('place_id'))
+        if not fragment:
+            continue
+        title = f"### {i}. **{r.get('name', '未知名稱')}**"
+        if r.get('rating'):
+            title += f"（{r['rating']} 星）"
+        sections.append(title)
+        sections.append(fragment)
+        sections.append("")
+    return "\n".join(sections).rstrip()
+
+
+class FragmentCache:
+    """以 (place_id, 關鍵字) 保存的單一餐廳分析片段（記憶體 + SQLite）"""
+
+    def __init__(self):
+        self._memory: Dict[Tuple[str, str], Tuple[str, float]] = {}
+        self.stats = {"hits": 0, "misses": 0, "stored": 0}
+        self._init_db()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """目前執行緒的 SQLite 連線"""
+        return get_connection()
+
+    def _init_db(self):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fragments (
+                place_id TEXT NOT NULL,
+                keyword TEXT NOT NULL,
+                fragment TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (place_id, keyword)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_fragments_created ON fragments(created_at)')
+        self.conn.commit()
+
+    def get_many(self, keyword: str, place_ids: Iterable[str]) -> Dict[str, str]:
+        """取得仍有效的片段，先查記憶體再查資料庫"""
+        cutoff = time.time() - FRAGMENT_TTL.total_seconds()
+        place_ids = [p for p in dict.fromkeys(place_ids) if p]
+        found = {}
+        missing = []
+        for place_id in place_ids:
+            entry = self._memory.get((place_id, keyword))
+            if entry is not None and entry[1] > cutoff:
+                found[place_id] = entry[0]
+            else:
+                missing.append(place_id)
+
+        if missing:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                f'SELECT place_id, fragment, created_at FROM fragments '
+                f'WHERE keyword = ? AND created_at > ? AND place_id IN ({",".join("?" * len(missing))})',
+                [keyword, cutoff, *missing]
+            )
+            for place_id, fragment, created_at in cursor.fetchall():
+                self._remember(place_id, keyword, fragment, created_at)
+                found[place_id] = fragment
+
+        self.stats["hits"] += len(found)
+        self.stats["misses"] += len(place_ids) - len(found)
+        return found
+
+    def put_many(self, keyword: str, fragments: Dict[str, str]):
+        """寫入新產生的片段（經由背景寫入佇列）"""
+        now = time.time()
+        rows = []
+        for place_id, fragment in fragments.items():
+            self._remember(place_id, keyword, fragment, now)
+            rows.append((place_id, keyword, fragment, now))
+        if rows:
+            self.stats["stored"] += len(rows)
+            write_queue.submit(
+                'INSERT OR REPLACE INTO fragments (place_id, keyword, fragment, created_at) VALUES (?, ?, ?, ?)',
+                rows, many=True
+            )
+
+    def purge_expired(self) -> int:
+        cutoff = time.time() - FRAGMENT_TTL.total_seconds()
+        cursor = self.conn.cursor()
+        cursor.execute('DELETE FROM fragments WHERE created_at <= ?', (cutoff,))
+        self.conn.commit()
+        return cursor.rowcount
+
+    def count(self) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM fragments').fetchone()[0]
+
+    def _remember(self, place_id: str, keyword: str, fragment: str, created_at: float):
+        key = (place_id, keyword)
+        self._memory.pop(key, None)
+        self._memory[key] = (fragment, created_at)
+        if len(self._memory) > FRAGMENT_MEMORY_MAX:
+            # 移除最早放入的項目
+            del self._memory[next(iter(self._memory))]
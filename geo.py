@@ -0,0 +1,92 @@
+import math
+from typing import List, Tuple
+
+EARTH_RADIUS_M = 6371000
+METERS_PER_DEGREE = 111320
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# 快取用的半徑分級（公尺），請求半徑會往上取到最近的級距
+RADIUS_BUCKETS = [300, 500, 1000, 1500, 2000, 3000, 5000, 10000, 20000, 50000]
+
+
+def haversine(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """兩點間的大圓距離（公尺）"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def geohash_encode(lat: float, lng: float, precision: int) -> str:
+    """將座標編碼為 geohash"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, bit_count, even = 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def geohash_cell_size(lat: float, precision: int) -> Tuple[float, float]:
+    """geohash 格子在該緯度的 (高, 寬)，單位公尺"""
+    lat_bits = (5 * precision) // 2
+    lng_bits = 5 * precision - lat_bits
+    height = 180 / (2 ** lat_bits) * METERS_PER_DEGREE
+    width = 360 / (2 ** lng_bits) * METERS_PER_DEGREE * math.cos(math.radians(lat))
+    return height, width
+
+
+def geohash_neighbors(lat: float, lng: float, precision: int) -> List[str]:
+    """座標所在格子與周圍 8 格的 geohash（所在格子排第一）"""
+    height, width = geohash_cell_size(lat, precision)
+    dlat = height / METERS_PER_DEGREE
+    dlng = width / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+
+    cells = [geohash_encode(lat, lng, precision)]
+    for i in (-1, 0, 1):
+        for j in (-1, 0, 1):
+            cell = geohash_encode(
+                max(min(lat + i * dlat, 90.0), -90.0),
+                (lng + j * dlng + 180) % 360 - 180,
+                precision
+            )
+            if cell not in cells:
+                cells.append(cell)
+    return cells
+
+
+def precision_for_distance(lat: float, distance: float) -> int:
+    """最細的 geohash 精度，使格子的短邊仍不小於 distance"""
+    for precision in range(9, 0, -1):
+        if min(geohash_cell_size(lat, precision)) >= distance:
+            return precision
+    return 1
+
+
+def snap_point(lat: float, lng: float, step: float) -> Tuple[int, int]:
+    """將座標對齊到邊長約 step 公尺的方格，回傳方格索引"""
+    dlat = step / METERS_PER_DEGREE
+    dlng = step / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+    return round(lat / dlat), round(lng / dlng)
+
+
+def radius_bucket(radius: int) -> int:
+    """將半徑往上取到快取級距"""
+    for bucket in RADIUS_BUCKETS:
+        if radius <= bucket:
+            return bucket
+    return RADIUS_BUCKETS[-1]
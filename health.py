@@ -0,0 +1,116 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from config import HEALTH_PROBE_INTERVAL, HEALTH_PROBE_JITTER, HEALTH_WINDOW
+from metrics import HEALTH_PROBES
+
+# 視窗內成功率門檻
+HEALTHY_SUCCESS_RATE = 0.9
+DEGRADED_SUCCESS_RATE = 0.5
+WINDOW_MAX_SAMPLES = 500
+
+
+class UpstreamHealth:
+    """單一上游的滾動視窗統計，樣本來自實際請求與背景探測"""
+
+    def __init__(self, name: str, window: float = HEALTH_WINDOW):
+        self.name = name
+        self.window = window
+        # (時間, 是否成功, 延遲秒數, 來源)
+        self._samples: Deque[Tuple[float, bool, float, str]] = deque(maxlen=WINDOW_MAX_SAMPLES)
+        self.last_success_at: Optional[float] = None
+        self.last_failure_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def record(self, ok: bool, latency: float, source: str = "request", error: Optional[str] = None):
+        now = time.time()
+        self._samples.append((now, ok, latency, source))
+        if ok:
+            self.last_success_at = now
+        else:
+            self.last_failure_at = now
+            self.last_error = error
+
+    def last_sample_at(self, source: Optional[str] = None) -> Optional[float]:
+        for sample in reversed(self._samples):
+            if source is None or sample[3] == source:
+                return sample[0]
+        return None
+
+    def _recent(self):
+        cutoff = time.time() - self.window
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        return self._samples
+
+    def status(self) -> str:
+        samples = self._recent()
+        if not samples:
+            return "unknown"
+        success_rate = sum(1 for s in samples if s[1]) / len(samples)
+        if success_rate >= HEALTHY_SUCCESS_RATE:
+            return "healthy"
+        if success_rate >= DEGRADED_SUCCESS_RATE:
+            return "degraded"
+        return "unhealthy"
+
+    def snapshot(self) -> Dict:
+        samples = self._recent()
+        latencies = sorted(s[2] for s in samples if s[1])
+        return {
+            "status": self.status(),
+            "samples": len(samples),
+            "probe_samples": sum(1 for s in samples if s[3] == "probe"),
+            "success_rate": round(sum(1 for s in samples if s[1]) / len(samples), 3) if samples else None,
+            "latency_p50": round(latencies[len(latencies) // 2], 3) if latencies else None,
+            "latency_p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3) if latencies else None,
+            "last_success_at": self.last_success_at,
+            "last_failure_at": self.last_failure_at,
+            "last_error": self.last_error,
+        }
+
+
+class HealthMonitor:
+    """依排程（加入隨機抖動）探測上游；近期已有實際請求結果的上游不另外探測"""
+
+    def __init__(self, upstreams: Dict[str, Tuple[UpstreamHealth, Callable[[], Awaitable[bool]]]],
+                 interval: float = HEALTH_PROBE_INTERVAL, jitter: float = HEALTH_PROBE_JITTER):
+        self.upstreams = upstreams
+        self.interval = interval
+        self.jitter = jitter
+
+    def _next_delay(self) -> float:
+        return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def probe(self, name: str) -> bool:
+        """立即探測一次（探測函式自行記錄結果）"""
+        health, probe = self.upstreams[name]
+        try:
+            ok = await probe()
+        except Exception as e:
+            health.record(False, 0.0, "probe", type(e).__name__)
+            ok = False
+        HEALTH_PROBES.inc(upstream=name, result="ok" if ok else "failed")
+        return ok
+
+    async def _watch(self, name: str):
+        health, _ = self.upstreams[name]
+        # 各上游錯開第一次探測，避免多個 worker 同時啟動時一起打上游
+        await asyncio.sleep(random.uniform(0, self.interval * self.jitter))
+        while True:
+            last_request = health.last_sample_at("request")
+            if last_request is not None and time.time() - last_request < self.interval:
+                # 實際請求已提供近期狀態，省下探測的配額
+                HEALTH_PROBES.inc(upstream=name, result="skipped")
+            else:
+                await self.probe(name)
+            await asyncio.sleep(self._next_delay())
+
+    async def run(self):
+        await asyncio.gather(*(self._watch(name) for name in self.upstreams))
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {name: health.snapshot() for name, (health, _) in self.upstreams.items()}
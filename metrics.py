@@ -0,0 +1,162 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+# 秒數分布的預設區間（涵蓋快取命中到 180 秒的 LLM 生成）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 180)
+THROUGHPUT_BUCKETS = (1, 2, 5, 10, 20, 40, 80, 160, 320)
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """累加計數器"""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """固定區間的分布統計"""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [各區間計數..., 總和, 次數]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, counts in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    labels = _format_labels(self.labels, key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labels, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {counts[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {counts[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus 文字格式"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# 各階段耗時：geocode、nearby_search、prompt_build、llm_ttft、llm_total、cache_get、cache_set
+STAGE_SECONDS = registry.histogram(
+    "nearby_eats_stage_seconds", "Latency of each pipeline stage", ["stage"]
+)
+STARTUP_SECONDS = registry.histogram(
+    "nearby_eats_startup_seconds", "Time from module import until the worker accepts connections / is ready", ["phase"]
+)
+REQUEST_SECONDS = registry.histogram(
+    "nearby_eats_request_seconds", "End-to-end request latency including streamed bodies", ["endpoint", "status"]
+)
+LLM_TOKENS_PER_SECOND = registry.histogram(
+    "nearby_eats_llm_tokens_per_second", "LLM generation throughput", buckets=THROUGHPUT_BUCKETS
+)
+CACHE_REQUESTS = registry.counter(
+    "nearby_eats_cache_requests_total", "Recommendation cache lookups by result tier", ["tier"]
+)
+GEOCODE_CACHE_REQUESTS = registry.counter(
+    "nearby_eats_geocode_cache_requests_total", "Geocode cache lookups", ["result"]
+)
+UPSTREAM_ERRORS = registry.counter(
+    "nearby_eats_upstream_errors_total", "Errors returned by or raised while calling upstreams", ["upstream", "kind"]
+)
+FAST_RESPONSES = registry.counter(
+    "nearby_eats_fast_responses_total", "Recommendations rendered by the rule-based fast mode", ["reason"]
+)
+CIRCUIT_TRANSITIONS = registry.counter(
+    "nearby_eats_circuit_transitions_total", "Circuit breaker state changes per upstream", ["upstream", "state"]
+)
+ADMISSION_REJECTED = registry.counter(
+    "nearby_eats_admission_rejected_total", "LLM requests rejected by admission control", ["reason", "priority"]
+)
+FRAGMENT_REQUESTS = registry.counter(
+    "nearby_eats_fragment_requests_total", "Per-restaurant analysis fragment lookups", ["result"]
+)
+WARMUP_QUERIES = registry.counter(
+    "nearby_eats_warmup_queries_total", "Hot queries processed by the cache warmup", ["result"]
+)
+HEALTH_PROBES = registry.counter(
+    "nearby_eats_health_probes_total", "Background upstream health probes", ["upstream", "result"]
+)
+PAYLOAD_CACHE_REQUESTS = registry.counter(
+    "nearby_eats_payload_cache_requests_total", "Pre-serialized cache-hit response bodies", ["result"]
+)
+SPATIAL_INDEX_REQUESTS = registry.counter(
+    "nearby_eats_spatial_index_requests_total", "Keyword searches answered by the local spatial index", ["result"]
+)
+LLM_TOKENS = registry.counter(
+    "nearby_eats_llm_tokens_total", "Prompt and generated tokens per detail level (fragments mode as its own label)", ["kind", "detail"]
+)
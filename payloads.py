@@ -0,0 +1,86 @@
+import gzip
+import json
+from datetime import timedelta
+from typing import Callable, Dict, NamedTuple, Optional
+
+from fastapi.responses import Response
+
+from cache import MemoryLRU
+from metrics import PAYLOAD_CACHE_REQUESTS
+
+PAYLOAD_CACHE_MAX_ENTRIES = 512
+PAYLOAD_CACHE_MAX_BYTES = 32 * 1024 * 1024
+PAYLOAD_CACHE_TTL = timedelta(minutes=30)
+# 小於此大小的回應壓縮效益有限，不產生 gzip 版本
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+
+
+class Payload(NamedTuple):
+    """可直接送出的回應內容：原始 JSON 與 gzip 版本"""
+    body: bytes
+    gzipped: Optional[bytes]
+
+
+def encode_json(content: Dict) -> bytes:
+    """與 FastAPI JSONResponse 相同的編碼方式"""
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def content_fingerprint(data: Dict) -> Optional[int]:
+    """快取內容的指紋：產生時間加上還原後的餐廳欄位（營業狀態、評分更新時會改變）"""
+    try:
+        return hash((data.get("timestamp"), tuple(tuple(r.items()) for r in data.get("restaurants", ()))))
+    except TypeError:
+        return None
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+class PayloadCache:
+    """快取命中時的回應位元組（含預先壓縮版本），避免每次重新編碼與壓縮"""
+
+    def __init__(self):
+        self.memory = MemoryLRU(PAYLOAD_CACHE_MAX_ENTRIES, PAYLOAD_CACHE_MAX_BYTES, PAYLOAD_CACHE_TTL)
+        self.stats = {"hits": 0, "misses": 0, "gzip_responses": 0, "bytes_saved": 0}
+
+    def get(self, key: Optional[str], build: Callable[[], Dict]) -> Payload:
+        """取得 key 對應的回應內容；key 為 None 時不快取"""
+        payload = self.memory.get(key) if key is not None else None
+        if payload is not None:
+            self.stats["hits"] += 1
+            PAYLOAD_CACHE_REQUESTS.inc(result="hit")
+            return payload
+
+        self.stats["misses"] += 1
+        PAYLOAD_CACHE_REQUESTS.inc(result="miss")
+        body = encode_json(build())
+        gzipped = gzip.compress(body, GZIP_LEVEL, mtime=0) if len(body) >= GZIP_MIN_BYTES else None
+        payload = Payload(body, gzipped)
+        if key is not None:
+            self.memory.put(key, payload, len(body) + len(gzipped or b""))
+        return payload
+
+    def respond(self, key: Optional[str], build: Callable[[], Dict], accept_encoding: str) -> Response:
+        """以快取的位元組回應，用戶端接受 gzip 時送出壓縮版本"""
+        payload = self.get(key, build)
+        headers = {"Vary": "Accept-Encoding"}
+        if payload.gzipped is not None and accepts_gzip(accept_encoding):
+            self.stats["gzip_responses"] += 1
+            self.stats["bytes_saved"] += len(payload.body) - len(payload.gzipped)
+            headers["Content-Encoding"] = "gzip"
+            return Response(payload.gzipped, media_type="application/json", headers=headers)
+        return Response(payload.body, media_type="application/json", headers=headers)
+
+    @staticmethod
+    def key(endpoint: str, query_hash: str, stale: bool, data: Dict) -> Optional[str]:
+        fingerprint = content_fingerprint(data)
+        if fingerprint is None:
+            return None
+        return f"{endpoint}|{query_hash}|{int(stale)}|{fingerprint}"
@@ -0,0 +1,215 @@
+import json
+import sqlite3
+import time
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from db import get_connection, write_queue
+
+# 欄位層級的有效期限：店名、地址等幾乎不變，營業狀態隨時間變動
+PLACE_STABLE_TTL = timedelta(days=30)
+PLACE_RATING_TTL = timedelta(hours=24)
+PLACE_OPEN_TTL = timedelta(minutes=30)
+PLACE_MEMORY_MAX = 20000
+
+HIGH_RATED_THRESHOLD = 4.5
+
+PLACE_COLUMNS = (
+    "place_id", "name", "address", "types", "price_level", "lat", "lng", "stable_updated_at",
+    "rating", "user_ratings_total", "rating_updated_at", "open_now", "open_updated_at"
+)
+
+
+def format_restaurant(r: Dict) -> Dict:
+    """整理回應中的餐廳欄位"""
+    return {
+        "place_id": r.get('place_id'),
+        "name": r.get('name'),
+        "address": r.get('address'),
+        "rating": r.get('rating'),
+        "price_level": r.get('price_level'),
+        "open_now": r.get('open_now'),
+        "source": r.get('source'),
+        "is_high_rated": (r.get('rating') or 0) >= HIGH_RATED_THRESHOLD
+    }
+
+
+class PlaceStore:
+    """以 place_id 正規化的餐廳資料（記憶體 + SQLite），快取結果只保存 place_id 參照"""
+
+    def __init__(self):
+        self._memory: Dict[str, Dict] = {}
+        self.stats = {"hits": 0, "misses": 0, "upserts": 0, "volatile_updates": 0}
+        self._init_db()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """目前執行緒的 SQLite 連線"""
+        return get_connection()
+
+    def _init_db(self):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS places (
+                place_id TEXT PRIMARY KEY,
+                name TEXT,
+                address TEXT,
+                types TEXT,
+                price_level INTEGER,
+                lat REAL,
+                lng REAL,
+                stable_updated_at REAL,
+                rating REAL,
+                user_ratings_total INTEGER,
+                rating_updated_at REAL,
+                open_now INTEGER,
+                open_updated_at REAL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_places_stable ON places(stable_updated_at)')
+        self.conn.commit()
+
+    def upsert(self, restaurants: Iterable[Dict]):
+        """寫入搜尋取得的完整餐廳資料，所有欄位的更新時間都重設"""
+        now = time.time()
+        rows = []
+        for r in restaurants:
+            if not r.get("place_id"):
+                continue
+            place = {
+                "place_id": r["place_id"],
+                "name": r.get("name"),
+                "address": r.get("address"),
+                "types": r.get("types") or [],
+                "price_level": r.get("price_level"),
+                "lat": r.get("lat"),
+                "lng": r.get("lng"),
+                "stable_updated_at": now,
+                "rating": r.get("rating"),
+                "user_ratings_total": r.get("user_ratings_total"),
+                "rating_updated_at": now,
+                "open_now": r.get("open_now"),
+                "open_updated_at": now,
+            }
+            self._remember(place)
+            rows.append(tuple(
+                json.dumps(place[c], ensure_ascii=False) if c == "types" else place[c]
+                for c in PLACE_COLUMNS
+            ))
+
+        if rows:
+            self.stats["upserts"] += len(rows)
+            write_queue.submit(
+                f'INSERT OR REPLACE INTO places ({", ".join(PLACE_COLUMNS)}) VALUES ({", ".join("?" * len(PLACE_COLUMNS))})',
+                rows, many=True
+            )
+
+    def update_volatile(self, place_id: str, open_now: Optional[bool], rating: Optional[float], user_ratings_total: Optional[int]):
+        """只更新營業狀態與評分（來自 Place Details），不影響穩定欄位"""
+        now = time.time()
+        place = self._memory.get(place_id)
+        if place is not None:
+            place.update(open_now=open_now, open_updated_at=now)
+            if rating is not None:
+                place.update(rating=rating, user_ratings_total=user_ratings_total, rating_updated_at=now)
+        self.stats["volatile_updates"] += 1
+        write_queue.submit('''
+            UPDATE places SET open_now = ?, open_updated_at = ?,
+                rating = COALESCE(?, rating), user_ratings_total = COALESCE(?, user_ratings_total),
+                rating_updated_at = CASE WHEN ? IS NULL THEN rating_updated_at ELSE ? END
+            WHERE place_id = ?
+        ''', (open_now, now, rating, user_ratings_total, rating, now, place_id))
+
+    def get_many(self, place_ids: List[str]) -> Dict[str, Dict]:
+        """依 place_id 取得餐廳資料，先查記憶體再查資料庫"""
+        found = {}
+        missing = []
+        for place_id in place_ids:
+            place = self._memory.get(place_id)
+            if place is None:
+                missing.append(place_id)
+            else:
+                found[place_id] = place
+
+        if missing:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                f'SELECT {", ".join(PLACE_COLUMNS)} FROM places WHERE place_id IN ({",".join("?" * len(missing))})',
+                missing
+            )
+            for row in cursor.fetchall():
+                place = dict(zip(PLACE_COLUMNS, row))
+                place["types"] = json.loads(place["types"] or "[]")
+                if place["open_now"] is not None:
+                    place["open_now"] = bool(place["open_now"])
+                self._remember(place)
+                found[place["place_id"]] = place
+
+        self.stats["hits"] += len(found)
+        self.stats["misses"] += len(place_ids) - len(found)
+        return found
+
+    @staticmethod
+    def dehydrate(response: Dict) -> Dict:
+        """將回應中的餐廳改為 place_id 參照（保留店名以防資料遺失）"""
+        restaurants = [
+            {"place_ref": r["place_id"], "name": r.get("name")} if r.get("place_id") else r
+            for r in response.get("restaurants", [])
+        ]
+        return {**response, "restaurants": restaurants}
+
+    def hydrate(self, response: Dict) -> Tuple[Dict, Tuple[str, ...]]:
+        """以目前的餐廳資料還原參照；回傳 (回應, 營業狀態或評分已過期的 place_id)"""
+        refs = [r["place_ref"] for r in response.get("restaurants", []) if "place_ref" in r]
+        if not refs:
+            return response, ()
+
+        places = self.get_many(refs)
+        now = time.time()
+
+        restaurants = []
+        stale = []
+        for r in response["restaurants"]:
+            if "place_ref" not in r:
+                restaurants.append(r)
+                continue
+            place = places.get(r["place_ref"])
+            if place is None:
+                restaurants.append(format_restaurant({"place_id": r["place_ref"], "name": r.get("name")}))
+                continue
+
+            place, is_stale = self.view(place, now)
+            if is_stale:
+                stale.append(place["place_id"])
+            restaurants.append(format_restaurant(place))
+
+        return {**response, "restaurants": restaurants}, tuple(stale)
+
+    @staticmethod
+    def view(place: Dict, now: float, source: str = "google_maps") -> Tuple[Dict, bool]:
+        """套用欄位有效期限後的餐廳資料；回傳 (資料, 營業狀態或評分是否過期)"""
+        place = {**place, "source": source}
+        open_expired = now - (place["open_updated_at"] or 0) > PLACE_OPEN_TTL.total_seconds()
+        if open_expired:
+            # 營業狀態過期視為未知，避免顯示錯誤的狀態
+            place["open_now"] = None
+        rating_expired = now - (place["rating_updated_at"] or 0) > PLACE_RATING_TTL.total_seconds()
+        return place, open_expired or rating_expired
+
+    def purge_expired(self) -> int:
+        """刪除穩定欄位也已過期的餐廳（快取結果的 hard TTL 遠短於此）"""
+        cutoff = time.time() - PLACE_STABLE_TTL.total_seconds()
+        cursor = self.conn.cursor()
+        cursor.execute('DELETE FROM places WHERE stable_updated_at <= ?', (cutoff,))
+        self.conn.commit()
+        return cursor.rowcount
+
+    def count(self) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM places').fetchone()[0]
+
+    def _remember(self, place: Dict):
+        self._memory.pop(place["place_id"], None)
+        self._memory[place["place_id"]] = place
+        if len(self._memory) > PLACE_MEMORY_MAX:
+            # 移除最早放入的項目
+            del self._memory[next(iter(self._memory))]
@@ -0,0 +1,69 @@
+import argparse
+import asyncio
+from pathlib import Path
+from typing import List
+
+from fastapi import HTTPException
+
+from config import WARMUP_TOKEN_BUDGET, WARMUP_TOP_N
+from db import write_queue
+from recommender import Recommender
+from warmup import HotQuery, QueryLog, Warmup
+
+DEFAULT_KEYWORDS = ["餐廳"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="預先產生指定地點或熱門查詢的推薦快取")
+    parser.add_argument("locations", nargs="*", help="要預熱的地點")
+    parser.add_argument("--file", type=Path, help="地點清單檔案（每行一個地點）")
+    parser.add_argument("--keywords", nargs="+", default=DEFAULT_KEYWORDS, help="每個地點要預熱的關鍵字")
+    parser.add_argument("--radius", type=int, default=1000)
+    parser.add_argument("--max-results", type=int, default=5)
+    parser.add_argument("--top", type=int, nargs="?", const=WARMUP_TOP_N,
+                        help="改為預熱請求紀錄中最熱門的 N 筆查詢")
+    parser.add_argument("--max-queries", type=int, help="最多產生幾筆（預設不限）")
+    parser.add_argument("--token-budget", type=int, default=WARMUP_TOKEN_BUDGET, help="估計 token 數上限")
+    return parser.parse_args()
+
+
+async def build_queries(recommender: Recommender, locations: List[str], keywords: List[str],
+                        radius: int, max_results: int) -> List[HotQuery]:
+    queries = []
+    for location in locations:
+        try:
+            lat, lng = await recommender.locate(location)
+        except HTTPException as e:
+            print(f"❌ 略過 {location}: {e.detail}")
+            continue
+        for keyword in keywords:
+            queries.append(HotQuery("", keyword, location, keyword, lat, lng, radius, max_results, 0))
+    return queries
+
+
+async def main():
+    args = parse_args()
+    locations = list(args.locations)
+    if args.file:
+        locations += [line.strip() for line in args.file.read_text(encoding="utf-8").splitlines() if line.strip()]
+    if not locations and not args.top:
+        print("⚠️ 請指定地點、--file 或 --top")
+        return
+
+    recommender = Recommender()
+    query_log = QueryLog()
+    warmup = Warmup(recommender, query_log)
+    try:
+        if args.top:
+            queries = query_log.top(args.top)
+        else:
+            queries = await build_queries(recommender, locations, args.keywords, args.radius, args.max_results)
+        print(f"🔥 準備預熱 {len(queries)} 筆查詢")
+        await warmup.run(queries, args.max_queries or len(queries), args.token_budget)
+    finally:
+        write_queue.flush()
+        await recommender.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,70 @@
+from typing import Dict, List, NamedTuple, Optional
+
+
+class DetailLevel(NamedTuple):
+    """回應詳細程度：列入提示詞的餐廳數與生成 token 預算"""
+    # 列入提示詞的餐廳數上限（None 為全部）
+    max_listed: Optional[int]
+    base_tokens: int
+    tokens_per_restaurant: int
+    max_tokens: int
+    # 內容過短時是否附加補充說明（只有完整分析要求最低字數）
+    pad_short: bool
+
+
+# brief / standard 使用精簡提示詞；full 為原本的六段完整分析
+DETAIL_LEVELS: Dict[str, DetailLevel] = {
+    "brief": DetailLevel(5, 120, 40, 400, False),
+    "standard": DetailLevel(10, 300, 100, 1200, False),
+    "full": DetailLevel(None, 1200, 300, 3500, True),
+}
+
+
+def listed_restaurants(detail: str, restaurants: List[Dict]) -> List[Dict]:
+    """列入提示詞的餐廳（搜尋結果已依評分排序）"""
+    max_listed = DETAIL_LEVELS[detail].max_listed
+    return restaurants if max_listed is None else restaurants[:max_listed]
+
+
+def token_budget(detail: str, restaurant_count: int) -> int:
+    """依詳細程度與餐廳數決定生成上限，輸出越短生成越快"""
+    level = DETAIL_LEVELS[detail]
+    if level.max_listed is not None:
+        restaurant_count = min(restaurant_count, level.max_listed)
+    return min(level.max_tokens, level.base_tokens + level.tokens_per_restaurant * restaurant_count)
+
+
+def compact_restaurant_lines(restaurants: List[Dict]) -> str:
+    """每家餐廳一行，不加裝飾符號，減少提示詞 token 數"""
+    lines = []
+    for i, r in enumerate(restaurants, 1):
+        info = f"{i}. {r.get('name', '未知名稱')}"
+        if r.get('rating'):
+            info += f"｜{r['rating']} 星"
+            if r.get('user_ratings_total'):
+                info += f"（{r['user_ratings_total']} 則）"
+        if r.get('price_level'):
+            info += f"｜價位 {r['price_level']}/4"
+        if r.get('open_now') is not None:
+            info += "｜營業中" if r['open_now'] else "｜休息中"
+        info += f"｜{r.get('address', '地址不明')}"
+        lines.append(info)
+    return "\n".join(lines)
+
+
+def build_compact_prompt(detail: str, question: str, location: str, restaurants: List[Dict]) -> str:
+    """brief / standard 的精簡提示詞"""
+    header = f"""你是台灣美食推薦專家。使用者在「{location}」附近詢問：「{question}」。
+附近餐廳：
+{compact_restaurant_lines(listed_restaurants(detail, restaurants))}
+"""
+    if detail == "brief":
+        return header + """
+請用 150 字以內推薦最符合需求的 1-2 家，各附一句理由。使用繁體中文，不要標題與開場白。"""
+
+    return header + """
+請用 400 字以內回答：
+1. 推薦前 3 名，各 1-2 句理由
+2. 不同情境（趕時間、預算有限、聚餐）的選擇
+3. 一句注意事項
+使用繁體中文，以簡短條列呈現，不要開場白。"""
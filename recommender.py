@@ -1,35 +1,65 @@
+import asyncio
 import time
 from datetime import datetime
-from typing import List, Dict
+from typing import AsyncIterator, Awaitable, Callable, Iterable, List, Dict, Optional, Set, Tuple
+import httpx
 from fastapi import HTTPException
 
-from cache import QueryCache
-from clients.llmClient import ChatAPIHandler
+from admission import AdmissionController, AdmissionRejected, PRIORITY_NORMAL
+from cache import QueryCache, GeocodeCache, normalize_location
+from clients.llmClient import ChatAPIHandler, LLMEmptyResponse, LLMStatusError
 from clients.mapsClient import GoogleMapsSearcher
-from config import LAB_MODEL
+from fast_renderer import render_recommendation
+from health import HealthMonitor
+from fragments import (FRAGMENT_BATCH_MAX, FRAGMENT_TOKENS, SUMMARY_TOKENS, FragmentParseError, build_fragment_prompt,
+                       build_summary_prompt, compose_recommendation, parse_fragments)
+from places import format_restaurant
+from prompts import DETAIL_LEVELS, build_compact_prompt, token_budget
+from resilience import CircuitOpenError, Deadline, DeadlineExceeded, UpstreamUnavailable
+from semantic_cache import mentions_positively
+from singleflight import SingleFlight
+from spatial_index import SpatialIndex
+from config import (LAB_MODEL, LLM_LATENCY_BUDGET, LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_MAX_QUEUE_WAIT,
+                    MAPS_SEARCH_BUDGET, REQUEST_DEADLINE)
+from metrics import FAST_RESPONSES, FRAGMENT_REQUESTS, LLM_TOKENS, STAGE_SECONDS
+
+# 單次背景更新營業狀態的餐廳數上限
+PLACE_REFRESH_MAX = 20
 
 
 class Recommender:
     def __init__(self):
         self.cache = QueryCache()
-        self.maps_searcher = GoogleMapsSearcher()
+        self.geocode_cache = GeocodeCache()
+        self.maps_searcher = GoogleMapsSearcher(self.geocode_cache)
         self.chat_handler = ChatAPIHandler()
-        
-        if self.chat_handler.test_connection():
-            print("✅ 實驗室 Ollama API 連接成功")
-        else:
-            print("⚠️  實驗室 Ollama API 連接失敗")
+        self.inflight = SingleFlight()
+        self.admission = AdmissionController(LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_MAX_QUEUE_WAIT)
+        self.spatial_index = SpatialIndex(self.cache.places)
+        self.health_monitor = HealthMonitor({
+            "google_maps": (self.maps_searcher.health, self.maps_searcher.probe),
+            "ai_api": (self.chat_handler.health, self.chat_handler.test_connection),
+        })
+        # 正在更新營業狀態的 place_id，避免重複呼叫 Place Details
+        self._refreshing_places: Set[str] = set()
     
-    def build_analysis_prompt(self, question: str, location: str, restaurants: List[Dict]) -> str:
-        """構建分析提示詞 - 加強內容要求"""
+    async def aclose(self):
+        """關閉上游連線池"""
+        await self.maps_searcher.aclose()
+        await self.chat_handler.aclose()
+    
+    def build_analysis_prompt(self, question: str, location: str, restaurants: List[Dict], detail: str = "full") -> str:
+        """構建分析提示詞 - 加強內容要求（brief / standard 使用精簡提示詞）"""
+        if detail != "full":
+            return build_compact_prompt(detail, question, location, restaurants)
         
-        high_rated_restaurants = [r for r in restaurants if r.get('rating', 0) >= 4.5]
+        high_rated_restaurants = [r for r in restaurants if (r.get('rating') or 0) >= 4.5]
         
         restaurant_info = []
         for i, r in enumerate(restaurants, 1):
             info = f"{i}. **{r.get('name', '未知名稱')}**"
             
-            rating = r.get('rating', 0)
+            rating = r.get('rating') or 0
             if rating >= 4.5:
                 info += " 🏆 **高評價推薦**"
             elif rating >= 4.0:
@@ -121,8 +151,25 @@ class Recommender:
         
         return prompt
     
-    async def get_recommendation(self, question: str, location: str, radius: int, max_results: int) -> Dict:
-        """取得推薦"""
+    async def locate(self, location: str, deadline: Optional[Deadline] = None) -> Tuple[float, float]:
+        """取得地點座標，找不到時回傳 400，地圖服務無法使用時回傳 503"""
+        try:
+            # 同一地點的並行查詢（寫法不同但正規化後相同）只呼叫一次 Geocoding
+            (lat, lng), _ = await self.inflight.do(
+                ("geocode", normalize_location(location)),
+                lambda: self.maps_searcher.get_coordinates(location, deadline)
+            )
+        except UpstreamUnavailable as e:
+            raise HTTPException(status_code=503, detail=f"地圖服務暫時無法使用 ({e.reason})")
+        except DeadlineExceeded:
+            raise HTTPException(status_code=504, detail="查詢地點逾時")
+        if not lat or not lng:
+            raise HTTPException(status_code=400, detail=f"無法找到地點: {location}")
+        return lat, lng
+    
+    async def search(self, question: str, location: str, radius: int, max_results: int,
+                     deadline: Optional[Deadline] = None, keywords: Optional[List[str]] = None) -> Dict:
+        """搜尋 Google Maps（多個關鍵字同時搜尋），回傳排序後的餐廳與搜尋資訊"""
         start_time = time.time()
         
         print(f"\n" + "="*60)
@@ -130,82 +177,272 @@ class Recommender:
         print(f"📍 位置: {location}")
         print(f"📏 範圍: {radius}m, 數量: {max_results}")
         
-        # 1. 搜尋 Google Maps
-        lat, lng = self.maps_searcher.get_coordinates(location)
-        if not lat or not lng:
-            raise HTTPException(status_code=400, detail=f"無法找到地點: {location}")
+        deadline = deadline or Deadline(REQUEST_DEADLINE)
+        lat, lng = await self.locate(location, deadline)
         
-        keywords = self._extract_keywords(question)
+        keywords = keywords or self._extract_keywords(question)
         search_keyword = keywords[0] if keywords else "餐廳"
         
-        print(f"📍 座標: {lat}, {lng}, 關鍵字: {search_keyword}")
+        print(f"📍 座標: {lat}, {lng}, 關鍵字: {', '.join(keywords) or search_keyword}")
         
-        restaurants = self.maps_searcher.search_restaurants(
-            lat, lng, search_keyword, radius, max_results
-        )
+        # 已搜尋過的範圍由本機索引回答，只有未涵蓋的關鍵字才呼叫 Google Maps
+        merged: Dict[str, Dict] = {}
+        missing = []
+        with STAGE_SECONDS.time(stage="local_search"):
+            for keyword in keywords or [search_keyword]:
+                local = self.spatial_index.query(keyword, lat, lng, radius, max_results)
+                if local is None:
+                    missing.append(keyword)
+                    continue
+                for r in local:
+                    merged.setdefault(r["place_id"], r)
         
+        if missing:
+            # 不同問句（或批次中的多個項目）同時搜尋相同條件時只呼叫一次
+            try:
+                found, _ = await self.inflight.do(
+                    ("search", tuple(missing), lat, lng, radius, max_results),
+                    lambda: self._search_live(lat, lng, missing, radius, max_results, deadline)
+                )
+            except UpstreamUnavailable as e:
+                raise HTTPException(status_code=503, detail=f"地圖服務暫時無法使用 ({e.reason})")
+            except DeadlineExceeded:
+                raise HTTPException(status_code=504, detail="搜尋餐廳逾時")
+            
+            for r in found:
+                merged[r["place_id"] or f"{r['name']}|{r['address']}"] = r
+        else:
+            print("🗺️ 由本機索引取得餐廳，未呼叫 Google Maps")
+        
+        restaurants = list(merged.values())
         if not restaurants:
             raise HTTPException(status_code=404, detail="找不到符合條件的餐廳")
         
-        restaurants.sort(key=lambda x: x.get('rating', 0), reverse=True)
+        restaurants.sort(key=lambda x: x.get('rating') or 0, reverse=True)
+        restaurants = restaurants[:max_results]
         
         search_time = time.time() - start_time
         print(f"✅ 找到 {len(restaurants)} 家餐廳 (搜尋時間: {search_time:.1f}秒)")
         
         # 統計高評分餐廳
-        high_rated = len([r for r in restaurants if r.get('rating', 0) >= 4.5])
+        high_rated = len([r for r in restaurants if (r.get('rating') or 0) >= 4.5])
         print(f"⭐ 高評價餐廳（4.5星以上）: {high_rated} 家")
         
-        # 2. 構建分析提示詞
-        prompt = self.build_analysis_prompt(question, location, restaurants)
-        print(f"📝 提示詞長度: {len(prompt)} 字元")
-        
-        # 3. 呼叫實驗室 Ollama API 進行分析
-        print("🤖 呼叫實驗室 Ollama API 進行分析...")
-        analysis_start = time.time()
-        llm_response = self.chat_handler.call_chat_api(prompt)
-        analysis_time = time.time() - analysis_start
-        
-        print(f"📊 AI 分析完成 (時間: {analysis_time:.1f}秒)")
-        print(f"📝 AI回應長度: {len(llm_response)} 字元")
+        return {
+            "lat": lat,
+            "lng": lng,
+            "start_time": start_time,
+            "search_time": search_time,
+            "search_keyword": search_keyword,
+            "restaurants": restaurants,
+            "high_rated": high_rated
+        }
+    
+    async def _search_live(self, lat: float, lng: float, keywords: List[str], radius: int, max_results: int,
+                           deadline: Deadline) -> List[Dict]:
+        """呼叫 Google Maps 搜尋，並將結果寫入 place store 與本機索引"""
+        # 所有關鍵字與分頁共用同一個時間上限，結果數變多時延遲不會等比例增加
+        with STAGE_SECONDS.time(stage="search_fanout"):
+            found, complete = await self.maps_searcher.search_many(
+                lat, lng, keywords, radius, max_results,
+                deadline=deadline.child(MAPS_SEARCH_BUDGET)
+            )
         
-        # 檢查回應是否足夠詳細
-        if len(llm_response) < 600:
-            print(f"⚠️ AI回應可能不夠詳細 ({len(llm_response)} 字)")
+        # 所有搜尋到的餐廳都寫入 place store，供其他關鍵字與位置的快取共用
+        self.cache.places.upsert(found)
+        for keyword, is_complete in complete.items():
+            self.spatial_index.add(
+                keyword, lat, lng, radius,
+                [r for r in found if keyword in r["matched_keywords"]], is_complete
+            )
+        return found
+    
+    def build_result(self, question: str, location: str, context: Dict, llm_response: str, analysis_time: float,
+                     mode: str = "llm", degraded: Optional[str] = None, detail: str = "full",
+                     max_tokens: Optional[int] = None, usage: Optional[Dict] = None) -> Dict:
+        """組合回應 - 確保 recommendation 欄位有完整內容"""
+        restaurants = context["restaurants"]
+        is_fast = mode == "fast"
+        usage = usage or {}
         
-        # 4. 準備回應 - 確保 recommendation 欄位有完整內容
-        result = {
+        return {
             "question": question,
             "location": location,
             "restaurants_count": len(restaurants),
-            "high_rated_count": high_rated,
+            "high_rated_count": context["high_rated"],
             "recommendation": llm_response,
-            "restaurants": [
-                {
-                    "name": r.get('name'),
-                    "address": r.get('address'),
-                    "rating": r.get('rating'),
-                    "price_level": r.get('price_level'),
-                    "open_now": r.get('open_now'),
-                    "source": r.get('source'),
-                    "is_high_rated": r.get('rating', 0) >= 4.5
-                }
-                for r in restaurants
-            ],
+            "restaurants": self.format_restaurants(restaurants),
             "metadata": {
-                "search_time": round(search_time, 2),
+                "search_time": round(context["search_time"], 2),
                 "analysis_time": round(analysis_time, 2),
-                "total_time": round(time.time() - start_time, 2),
-                "search_keyword": search_keyword,
+                "total_time": round(time.time() - context["start_time"], 2),
+                "search_keyword": context["search_keyword"],
                 "high_rated_threshold": 4.5,
-                "ai_model": LAB_MODEL,
-                "ai_source": "實驗室 Ollama",
+                "ai_model": "rule-based" if is_fast else LAB_MODEL,
+                "ai_source": "規則式快速推薦" if is_fast else "實驗室 Ollama",
                 "has_recommendation": True,
                 "recommendation_length": len(llm_response),
-                "is_detailed": len(llm_response) >= 600  # 標記是否詳細
+                "is_detailed": len(llm_response) >= 600,  # 標記是否詳細
+                "mode": mode,
+                "degraded": degraded,  # 改用快速推薦的原因（佇列已滿、超過時間預算等）
+                "detail": detail if mode == "llm" else None,
+                "max_tokens": max_tokens if mode == "llm" else None,
+                "prompt_tokens": usage.get("prompt_tokens"),
+                "output_tokens": usage.get("output_tokens"),
+                "tokens_estimated": usage.get("estimated", False)
             },
             "timestamp": datetime.now().isoformat()
         }
+    
+    @staticmethod
+    def format_restaurants(restaurants: List[Dict]) -> List[Dict]:
+        """整理回應中的餐廳欄位"""
+        return [format_restaurant(r) for r in restaurants]
+    
+    @staticmethod
+    def cacheable(result: Dict) -> bool:
+        """只有 AI 產生的結果寫入快取（簡短回答依詳細程度分開保存）；快速推薦與降級結果不寫入"""
+        metadata = result["metadata"]
+        if metadata.get("degraded"):
+            return False
+        return metadata.get("mode") in ("llm", "fragments")
+    
+    @staticmethod
+    def _record_tokens(detail: str, usage: Dict):
+        if usage:
+            LLM_TOKENS.inc(usage["prompt_tokens"], kind="prompt", detail=detail)
+            LLM_TOKENS.inc(usage["output_tokens"], kind="output", detail=detail)
+    
+    def render_fast(self, question: str, location: str, context: Dict, reason: str) -> str:
+        """以規則產生推薦內容，reason 為 explicit 或降級原因"""
+        FAST_RESPONSES.inc(reason=reason)
+        with STAGE_SECONDS.time(stage="fast_render"):
+            return render_recommendation(question, location, context["restaurants"], context["search_keyword"])
+    
+    def _llm_deadline(self, deadline: Deadline) -> float:
+        """AI 分析的截止時間：時間預算與請求期限取較早者"""
+        return min(time.monotonic() + LLM_LATENCY_BUDGET, deadline.at)
+    
+    async def _run_llm(self, generate: Callable[[List[str]], Awaitable[str]], priority: int,
+                       deadline: Deadline) -> Tuple[str, Optional[str]]:
+        """在排隊名額與時間預算內執行 AI 分析，回傳 (內容, 降級原因)
+        
+        generate 將生成的內容逐段附加到傳入的 list；降級時回傳已生成的部分內容
+        """
+        llm_deadline = self._llm_deadline(deadline)
+        received: List[str] = []
+        try:
+            if self.chat_handler.breaker.is_open():
+                raise CircuitOpenError("llm")
+            async with self.admission.slot(priority, llm_deadline):
+                return await asyncio.wait_for(generate(received), llm_deadline - time.monotonic()), None
+        except AdmissionRejected as e:
+            return "", e.reason
+        except CircuitOpenError:
+            return "", "circuit_open"
+        except asyncio.TimeoutError:
+            # 只有遲遲沒有第一個 token 才計入熔斷；已開始輸出代表閘道正常，只是生成較慢
+            if not received:
+                self.chat_handler.breaker.record_failure()
+            return "".join(received), "budget"
+        except DeadlineExceeded:
+            return "".join(received), "budget"
+        except (LLMStatusError, LLMEmptyResponse, FragmentParseError, httpx.HTTPError) as e:
+            print(f"❌ AI 分析失敗: {e}")
+            return "".join(received), "upstream_error"
+    
+    async def generate_from_fragments(self, question: str, location: str, context: Dict,
+                                      deadline: Optional[Deadline] = None, usage: Optional[Dict] = None,
+                                      received: Optional[List[str]] = None) -> str:
+        """片段模式：只為缺少分析片段的餐廳呼叫 AI，再以所有片段產生簡短總結"""
+        keyword = context["search_keyword"]
+        restaurants = context["restaurants"]
+        fragments = self.cache.fragments.get_many(keyword, [r.get('place_id') for r in restaurants])
+        missing = [r for r in restaurants if r.get('place_id') and r['place_id'] not in fragments]
+        FRAGMENT_REQUESTS.inc(len(fragments), result="hit")
+        FRAGMENT_REQUESTS.inc(len(missing), result="miss")
+        print(f"🧩 分析片段: 沿用 {len(fragments)} 家，需產生 {len(missing)} 家")
+        
+        for start in range(0, len(missing), FRAGMENT_BATCH_MAX):
+            batch = missing[start:start + FRAGMENT_BATCH_MAX]
+            with STAGE_SECONDS.time(stage="fragment_generate"):
+                text = await self.chat_handler.generate(
+                    build_fragment_prompt(keyword, batch), deadline, max_tokens=FRAGMENT_TOKENS * len(batch),
+                    usage=usage, received=received
+                )
+            generated = {batch[i - 1]['place_id']: body for i, body in parse_fragments(text, len(batch)).items()}
+            if len(generated) < len(batch):
+                print(f"⚠️ 有 {len(batch) - len(generated)} 家餐廳的片段無法解析，不寫入快取")
+            self.cache.fragments.put_many(keyword, generated)
+            fragments.update(generated)
+        
+        # 只有總結沒有任何餐廳分析時視為生成失敗，改用快速推薦且不寫入快取
+        if not fragments:
+            raise FragmentParseError("沒有可用的餐廳分析片段")
+        
+        with STAGE_SECONDS.time(stage="fragment_summary"):
+            summary = await self.chat_handler.generate(
+                build_summary_prompt(question, location, restaurants, fragments), deadline, max_tokens=SUMMARY_TOKENS,
+                usage=usage, received=received
+            )
+        return compose_recommendation(summary, restaurants, fragments)
+    
+    async def get_recommendation(self, question: str, location: str, radius: int, max_results: int,
+                                 priority: int = PRIORITY_NORMAL, mode: str = "llm",
+                                 deadline: Optional[Deadline] = None, keywords: Optional[List[str]] = None,
+                                 detail: str = "full") -> Dict:
+        """取得推薦"""
+        deadline = deadline or Deadline(REQUEST_DEADLINE)
+        
+        # 1. 搜尋 Google Maps
+        context = await self.search(question, location, radius, max_results, deadline, keywords)
+        restaurants = context["restaurants"]
+        
+        analysis_start = time.time()
+        degraded = None
+        max_tokens = None
+        usage = {}
+        if mode == "fast":
+            llm_response = self.render_fast(question, location, context, "explicit")
+        else:
+            if mode == "fragments":
+                generate = lambda received: self.generate_from_fragments(
+                    question, location, context, deadline, usage, received
+                )
+            else:
+                # 2. 構建分析提示詞，生成上限依詳細程度與餐廳數決定
+                with STAGE_SECONDS.time(stage="prompt_build"):
+                    prompt = self.build_analysis_prompt(question, location, restaurants, detail)
+                max_tokens = token_budget(detail, len(restaurants))
+                print(f"📝 提示詞長度: {len(prompt)} 字元 (詳細程度: {detail}, 生成上限: {max_tokens} tokens)")
+                generate = lambda received: self.chat_handler.call_chat_api(
+                    prompt, deadline, max_tokens, usage, pad_short=DETAIL_LEVELS[detail].pad_short, received=received
+                )
+            
+            # 3. 呼叫實驗室 Ollama API 進行分析，排隊與生成共用同一個時間預算
+            print("🤖 呼叫實驗室 Ollama API 進行分析...")
+            llm_response, degraded = await self._run_llm(generate, priority, deadline)
+            
+            if degraded:
+                print(f"⚡ AI 分析無法使用或逾時 ({degraded})，改用快速推薦")
+                # 已生成的分析保留在前，以快速推薦接續；片段模式的部分內容是原始片段，不直接呈現
+                partial = llm_response if mode == "llm" else ""
+                mode = "fast"
+                fast = self.render_fast(question, location, context, degraded)
+                llm_response = f"{partial}\n\n{fast}" if partial else fast
+        analysis_time = time.time() - analysis_start
+        
+        print(f"📊 AI 分析完成 (時間: {analysis_time:.1f}秒)")
+        print(f"📝 AI回應長度: {len(llm_response)} 字元")
+        
+        # 檢查回應是否足夠詳細（簡短回答本來就短）
+        if detail == "full" and len(llm_response) < 600:
+            print(f"⚠️ AI回應可能不夠詳細 ({len(llm_response)} 字)")
+        
+        # 4. 準備回應
+        self._record_tokens(detail if mode == "llm" else mode, usage)
+        result = self.build_result(question, location, context, llm_response, analysis_time, mode, degraded,
+                                   detail, max_tokens, usage)
         
         # 打印詳細檢查信息
         print(f"\n" + "="*60)
@@ -220,6 +457,142 @@ class Recommender:
         
         return result
     
+    async def stream_recommendation(self, question: str, location: str, radius: int, max_results: int,
+                                    priority: int = PRIORITY_NORMAL, mode: str = "llm",
+                                    deadline: Optional[Deadline] = None,
+                                    keywords: Optional[List[str]] = None,
+                                    detail: str = "full") -> AsyncIterator[Dict]:
+        """串流取得推薦：先送出餐廳列表，再逐段轉送 AI 生成內容，最後送出完整結果"""
+        deadline = deadline or Deadline(REQUEST_DEADLINE)
+        context = await self.search(question, location, radius, max_results, deadline, keywords)
+        restaurants = context["restaurants"]
+        
+        yield {
+            "type": "restaurants",
+            "question": question,
+            "location": location,
+            "restaurants_count": len(restaurants),
+            "high_rated_count": context["high_rated"],
+            "restaurants": self.format_restaurants(restaurants),
+            "search_time": round(context["search_time"], 2)
+        }
+        
+        analysis_start = time.time()
+        llm_response = ""
+        degraded = None
+        max_tokens = None
+        usage = {}
+        if mode == "llm":
+            with STAGE_SECONDS.time(stage="prompt_build"):
+                prompt = self.build_analysis_prompt(question, location, restaurants, detail)
+            max_tokens = token_budget(detail, len(restaurants))
+            print(f"📝 提示詞長度: {len(prompt)} 字元 (詳細程度: {detail}, 生成上限: {max_tokens} tokens)")
+            
+            # 時間預算涵蓋排隊與第一個 token，開始輸出後只受請求期限限制
+            llm_deadline = self._llm_deadline(deadline)
+            try:
+                if self.chat_handler.breaker.is_open():
+                    raise CircuitOpenError("llm")
+                async with self.admission.slot(priority, llm_deadline):
+                    tokens = self.chat_handler.stream_chat_api(prompt, deadline, max_tokens, usage)
+                    try:
+                        first_token = await asyncio.wait_for(tokens.__anext__(), llm_deadline - time.monotonic())
+                    except asyncio.TimeoutError:
+                        await tokens.aclose()
+                        self.chat_handler.breaker.record_failure()
+                        raise
+                    llm_response = first_token
+                    yield {"type": "token", "text": first_token}
+                    async for token in tokens:
+                        llm_response += token
+                        yield {"type": "token", "text": token}
+            except AdmissionRejected as e:
+                degraded = e.reason
+            except CircuitOpenError:
+                degraded = "circuit_open"
+            except (asyncio.TimeoutError, DeadlineExceeded):
+                degraded = "budget"
+            except (LLMStatusError, LLMEmptyResponse, httpx.HTTPError) as e:
+                print(f"❌ AI 分析失敗: {e}")
+                degraded = "upstream_error"
+            
+            if degraded:
+                print(f"⚡ AI 分析無法使用或未及時開始 ({degraded})，改用快速推薦")
+                mode = "fast"
+        elif mode == "fragments":
+            # 片段多半已有快取，整段產生後一次送出
+            llm_response, degraded = await self._run_llm(
+                lambda received: self.generate_from_fragments(question, location, context, deadline, usage, received),
+                priority, deadline
+            )
+            if degraded:
+                print(f"⚡ AI 分析無法使用或逾時 ({degraded})，改用快速推薦")
+                llm_response = ""
+                mode = "fast"
+            else:
+                yield {"type": "token", "text": llm_response}
+        
+        if mode == "fast":
+            # AI 中途失敗時已送出的內容無法收回，以快速推薦接續
+            text = ("\n\n" if llm_response else "") + self.render_fast(question, location, context, degraded or "explicit")
+            llm_response += text
+            yield {"type": "token", "text": text}
+        analysis_time = time.time() - analysis_start
+        
+        print(f"📊 分析完成 (模式: {mode}, 時間: {analysis_time:.1f}秒, 長度: {len(llm_response)} 字元)")
+        
+        self._record_tokens(detail if mode == "llm" else mode, usage)
+        yield {
+            "type": "done",
+            "result": self.build_result(question, location, context, llm_response, analysis_time, mode, degraded,
+                                        detail, max_tokens, usage)
+        }
+    
+    @staticmethod
+    def shared_key(question: str, location: str, radius: int, max_results: int, mode: str = "llm",
+                   detail: str = "full") -> Tuple:
+        """合併並行請求的鍵"""
+        if mode == "llm" and detail == "full":
+            return (question, location, radius, max_results)
+        return (question, location, radius, max_results, mode, detail)
+    
+    async def get_recommendation_shared(self, question: str, location: str, radius: int, max_results: int,
+                                        priority: int = PRIORITY_NORMAL, mode: str = "llm",
+                                        deadline: Optional[Deadline] = None,
+                                        keywords: Optional[List[str]] = None,
+                                        detail: str = "full") -> Tuple[Dict, bool]:
+        """取得推薦，相同條件的並行請求只會執行一次，回傳 (結果, 是否為共享結果)"""
+        return await self.inflight.do(
+            self.shared_key(question, location, radius, max_results, mode, detail),
+            lambda: self.get_recommendation(question, location, radius, max_results, priority, mode, deadline, keywords,
+                                            detail)
+        )
+    
+    async def refresh_places(self, place_ids: Iterable[str]):
+        """以 Place Details 更新營業狀態與評分，不需重新產生 AI 內容"""
+        place_ids = [p for p in dict.fromkeys(place_ids) if p not in self._refreshing_places][:PLACE_REFRESH_MAX]
+        if not place_ids:
+            return
+        self._refreshing_places.update(place_ids)
+        deadline = Deadline(REQUEST_DEADLINE)
+        try:
+            results = await asyncio.gather(
+                *(self.maps_searcher.place_details(place_id, deadline) for place_id in place_ids),
+                return_exceptions=True
+            )
+            updated = 0
+            for place_id, details in zip(place_ids, results):
+                if isinstance(details, (UpstreamUnavailable, DeadlineExceeded)):
+                    continue
+                if isinstance(details, BaseException):
+                    raise details
+                if details is not None:
+                    self.cache.places.update_volatile(place_id, **details)
+                    updated += 1
+            print(f"🕒 已更新 {updated}/{len(place_ids)} 家餐廳的營業狀態")
+        finally:
+            self._refreshing_places.difference_update(place_ids)
+    
     def _extract_keywords(self, question: str) -> List[str]:
         """提取搜尋關鍵字"""
         stop_words = ["我想找", "我想吃", "我想去", "推薦", "哪裡有", "哪裡可以", "的", "附近"]
@@ -232,12 +605,14 @@ class Recommender:
         
         brunch_words = ["早午餐", "早餐", "brunch","午餐","晚餐","消夜","宵夜", "咖啡", "咖啡廳", "餐廳", "輕食", "蛋料理", "吐司", "鬆餅","小吃","甜點","甜品","冰","燒烤","燒肉","速食"]
         for word in brunch_words:
-            if word in simplified:
+            # 「早午餐」與「午餐」、「咖啡」與「咖啡廳」互相包含，不重複搜尋
+            # 「不想吃甜點」不應以「甜點」搜尋，也不應共用「甜點」的快取
+            if mentions_positively(simplified, word) and not any(word in k or k in word for k in keywords):
                 keywords.append(word)
         
         requirement_words = ["拍照", "健康", "安靜", "平價", "便宜", "高級", "戶外", "座位", "看書", "約會", "聚餐"]
         for word in requirement_words:
-            if word in simplified:
+            if mentions_positively(simplified, word):
                 keywords.append(word)
         
         if not keywords and simplified.strip():
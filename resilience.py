@@ -0,0 +1,123 @@
+import time
+from typing import Dict, Optional
+
+from metrics import CIRCUIT_TRANSITIONS
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class UpstreamUnavailable(Exception):
+    """上游服務無法使用（錯誤或熔斷中）"""
+
+    def __init__(self, upstream: str, reason: str):
+        super().__init__(f"{upstream} 無法使用: {reason}")
+        self.upstream = upstream
+        self.reason = reason
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    """熔斷器開啟中，未送出請求"""
+
+    def __init__(self, upstream: str):
+        super().__init__(upstream, "circuit_open")
+
+
+class DeadlineExceeded(Exception):
+    """請求的整體時間預算已用完"""
+
+
+class Deadline:
+    """單一請求的整體期限，各階段的逾時都不超過剩餘時間"""
+
+    def __init__(self, seconds: float):
+        self.at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.at - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def child(self, seconds: float) -> "Deadline":
+        """建立不超過本期限的子期限，用於限制單一階段的總時間"""
+        child = Deadline(seconds)
+        child.at = min(child.at, self.at)
+        return child
+
+    def timeout(self, cap: float) -> float:
+        """取得本階段可用的逾時秒數，期限已過則拋出 DeadlineExceeded"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded("請求已超過期限")
+        return min(cap, remaining)
+
+
+def stage_timeout(deadline: Optional[Deadline], cap: float) -> float:
+    """單一階段的逾時：取階段上限與請求剩餘時間的較小值"""
+    return deadline.timeout(cap) if deadline is not None else cap
+
+
+class CircuitBreaker:
+    """連續失敗達門檻即熔斷，冷卻後以單一探測請求決定是否恢復"""
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started_at: Optional[float] = None
+        self.stats: Dict[str, int] = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        print(f"🔌 熔斷器 {self.name}: {self.state} → {state}")
+        self.state = state
+        CIRCUIT_TRANSITIONS.inc(upstream=self.name, state=state)
+
+    def is_open(self) -> bool:
+        """是否會拒絕下一個請求（不佔用探測名額）"""
+        now = time.monotonic()
+        if self.state == OPEN:
+            return now - self._opened_at < self.reset_timeout
+        if self.state == HALF_OPEN:
+            # 探測請求仍在進行中；探測逾時未回報則允許新的探測
+            return self._probe_started_at is not None and now - self._probe_started_at < self.reset_timeout
+        return False
+
+    def allow(self):
+        """送出請求前呼叫，熔斷中拋出 CircuitOpenError"""
+        if self.is_open():
+            self.stats["rejected"] += 1
+            raise CircuitOpenError(self.name)
+        if self.state != CLOSED:
+            self._transition(HALF_OPEN)
+            self._probe_started_at = time.monotonic()
+
+    def record_success(self):
+        self.stats["successes"] += 1
+        self._failures = 0
+        self._probe_started_at = None
+        self._transition(CLOSED)
+
+    def record_failure(self):
+        self.stats["failures"] += 1
+        self._failures += 1
+        self._probe_started_at = None
+        if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self.stats["opened"] += 1
+            self._transition(OPEN)
+
+    def snapshot(self) -> Dict:
+        return {
+            **self.stats,
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "retry_in": round(max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at)), 1)
+            if self.state == OPEN else None,
+        }
@@ -1,10 +1,26 @@
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Any, Literal
+
+# Google Places Nearby Search 的半徑上限（公尺）與最多可取得的結果數（3 頁 × 20 筆）
+MAX_RADIUS = 50000
+MAX_RESULTS = 60
+
 
 # 資料模型
 class Request(BaseModel):
     question: str
     location: str
-    radius: int = 1000
-    max_results: int = 5
-    user_preferences: Optional[Dict[str, Any]] = None
\ No newline at end of file
+    radius: int = Field(1000, gt=0, le=MAX_RADIUS)
+    max_results: int = Field(5, gt=0, le=MAX_RESULTS)
+    user_preferences: Optional[Dict[str, Any]] = None
+    # llm：由 AI 分析；fragments：組合各餐廳的分析片段（可跨查詢共用）；fast：以規則直接產生推薦，不呼叫 AI
+    mode: Literal["llm", "fragments", "fast"] = "llm"
+    # llm 模式的詳細程度：brief 一兩句推薦、standard 簡短比較、full 完整分析
+    detail: Literal["brief", "standard", "full"] = "full"
+
+# 單次批次請求的項目數上限
+BATCH_MAX_ITEMS = 20
+
+
+class BatchRequest(BaseModel):
+    items: List[Request] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
@@ -0,0 +1,214 @@
+import math
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from db import get_connection, write_queue
+from geo import haversine
+
+# 問句相似度門檻（餘弦相似度）；「午餐」與「早午餐」這類只差一字的問句約 0.78，需低於門檻
+SEMANTIC_THRESHOLD = 0.8
+VECTOR_DIM = 4096
+MAX_SCOPES = 2000
+MAX_QUESTIONS_PER_SCOPE = 50
+
+# 與需求無關的口語詞
+FILLER_WORDS = ["我想找", "我想吃", "我想去", "想找", "想吃", "想去", "推薦", "哪裡有", "哪裡可以",
+                "可以", "一間", "一家", "有沒有", "請問", "附近", "的", "嗎", "呢"]
+
+# 同義詞歸一（長詞優先）
+SYNONYMS = [
+    ("咖啡店", "咖啡廳"), ("咖啡館", "咖啡廳"), ("讀書", "看書"), ("念書", "看書"),
+    ("便宜", "平價"), ("宵夜", "消夜"), ("甜品", "甜點"), ("火車站", "車站"),
+    ("餐館", "餐廳"), ("安静", "安靜"),
+]
+
+
+# 否定語氣：「不想吃甜點」與「想吃甜點」字面相近但需求相反（排除「不錯」「不過」等常見詞）
+NEGATION_PATTERN = re.compile(r"不(?![錯過少同])|除了|以外|避開|別(?=[吃喝要去])")
+
+
+# 緊接在詞前面的否定（「不想吃」甜點、「別去」夜市）
+NEGATED_PREFIX = re.compile(r"(?:不|別|避開|除了)(?:想|要)?(?:吃|喝|去|找)?$")
+
+
+def is_negated(question: str) -> bool:
+    return bool(NEGATION_PATTERN.search(unicodedata.normalize("NFKC", question)))
+
+
+def mentions_positively(text: str, word: str) -> bool:
+    """word 是否出現在 text 中且前面沒有否定（「不想吃甜點」不算提到甜點）"""
+    start = text.find(word)
+    while start != -1:
+        if not NEGATED_PREFIX.search(text[max(0, start - 4):start]):
+            return True
+        start = text.find(word, start + 1)
+    return False
+
+
+def normalize_question(question: str) -> str:
+    """正規化問句：全形轉半形、移除口語詞與標點、同義詞歸一"""
+    text = unicodedata.normalize("NFKC", question).lower()
+    for source, target in SYNONYMS:
+        text = text.replace(source, target)
+    for word in FILLER_WORDS:
+        text = text.replace(word, "")
+    return re.sub(r"[\s\W_]+", "", text)
+
+
+class HashingVectorizer:
+    """字元 n-gram 雜湊向量化（純 CPU、無需模型，回傳 L2 正規化的稀疏向量）"""
+
+    def __init__(self, dim: int = VECTOR_DIM, ngram_weights: Tuple[float, ...] = (1.0, 0.7, 0.3)):
+        self.dim = dim
+        self.ngram_weights = ngram_weights
+
+    def transform(self, question: str) -> Dict[int, float]:
+        text = normalize_question(question)
+        vector: Dict[int, float] = {}
+        for n, weight in enumerate(self.ngram_weights, 1):
+            for i in range(len(text) - n + 1):
+                # crc32 在不同行程間穩定，適合持久化後重建
+                h = zlib.crc32(f"{n}:{text[i:i + n]}".encode("utf-8"))
+                index = h % self.dim
+                sign = 1.0 if (h >> 31) & 1 else -1.0
+                vector[index] = vector.get(index, 0.0) + sign * weight
+
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        if not norm:
+            return {}
+        return {k: v / norm for k, v in vector.items()}
+
+    @staticmethod
+    def similarity(a: Dict[int, float], b: Dict[int, float]) -> float:
+        if len(a) > len(b):
+            a, b = b, a
+        return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+
+class SemanticEntry(NamedTuple):
+    vector: Dict[int, float]
+    query_hash: str
+    lat: float
+    lng: float
+    expires: float
+    # 正規化後的搜尋關鍵字與是否為否定語氣，必須與查詢相同才可共用
+    keyword: str
+    negated: bool
+
+
+class SemanticIndex:
+    """依位置格子分區的問句向量索引，以暴力搜尋找出相似的歷史問句"""
+
+    def __init__(self):
+        self.vectorizer = HashingVectorizer()
+        self._scopes: "OrderedDict[str, List[SemanticEntry]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._init_db()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """目前執行緒的 SQLite 連線"""
+        return get_connection()
+
+    def _init_db(self):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS question_index (
+                scope TEXT,
+                question TEXT,
+                query_hash TEXT,
+                lat REAL,
+                lng REAL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                expires_at TIMESTAMP,
+                PRIMARY KEY (scope, question)
+            )
+        ''')
+        # 舊版資料表沒有 keyword 欄位；缺少關鍵字的舊問句不再參與比對
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(question_index)")}
+        if "keyword" not in columns:
+            try:
+                cursor.execute("ALTER TABLE question_index ADD COLUMN keyword TEXT")
+            except sqlite3.OperationalError as e:
+                # 其他 worker 可能已同時補上欄位
+                if "duplicate column" not in str(e):
+                    raise
+        self.conn.commit()
+
+    @staticmethod
+    def scope_key(cell: str, bucket: int, max_results: int, mode: str = "llm") -> str:
+        scope = f"{cell}|{bucket}|{max_results}"
+        return scope if mode == "llm" else f"{scope}|{mode}"
+
+    def _scope(self, scope: str) -> List[SemanticEntry]:
+        """取得分區內容，不在記憶體時從 SQLite 載入"""
+        entries = self._scopes.get(scope)
+        if entries is not None:
+            self._scopes.move_to_end(scope)
+            return entries
+
+        cursor = self.conn.cursor()
+        cursor.execute(
+            '''SELECT question, query_hash, lat, lng, expires_at, keyword FROM question_index
+               WHERE scope = ? AND expires_at > ? AND keyword IS NOT NULL ORDER BY created_at DESC LIMIT ?''',
+            (scope, datetime.now().isoformat(), MAX_QUESTIONS_PER_SCOPE)
+        )
+        entries = [
+            SemanticEntry(self.vectorizer.transform(q), h, lat, lng, datetime.fromisoformat(exp).timestamp(),
+                          normalize_question(keyword), is_negated(q))
+            for q, h, lat, lng, exp, keyword in cursor.fetchall()
+        ]
+        self._scopes[scope] = entries
+        while len(self._scopes) > MAX_SCOPES:
+            self._scopes.popitem(last=False)
+        return entries
+
+    def find(self, question: str, keyword: str, lat: float, lng: float, scopes: List[str],
+             max_distance: float) -> Optional[Tuple[str, float]]:
+        """找出關鍵字與語氣相同、最相似且距離夠近的歷史問句，回傳 (query_hash, 相似度)"""
+        vector = self.vectorizer.transform(question)
+        if not vector:
+            return None
+
+        # 「想吃拉麵」與「拉麵」視為同一關鍵字，「午餐」與「早午餐」則不同
+        keyword = normalize_question(keyword)
+        negated = is_negated(question)
+        now = time.time()
+        best = None
+        with self._lock:
+            for scope in scopes:
+                for entry in self._scope(scope):
+                    if entry.keyword != keyword or entry.negated != negated or entry.expires <= now:
+                        continue
+                    if haversine(lat, lng, entry.lat, entry.lng) > max_distance:
+                        continue
+                    score = self.vectorizer.similarity(vector, entry.vector)
+                    if score >= SEMANTIC_THRESHOLD and (best is None or score > best[1]):
+                        best = (entry.query_hash, score)
+        return best
+
+    def add(self, question: str, keyword: str, query_hash: str, lat: float, lng: float, scope: str,
+            expires_at: datetime):
+        vector = self.vectorizer.transform(question)
+        if not vector:
+            return
+
+        with self._lock:
+            entries = self._scope(scope)
+            entries[:] = [e for e in entries if e.query_hash != query_hash or e.vector != vector]
+            entries.insert(0, SemanticEntry(vector, query_hash, lat, lng, expires_at.timestamp(),
+                                            normalize_question(keyword), is_negated(question)))
+            del entries[MAX_QUESTIONS_PER_SCOPE:]
+
+        write_queue.submit('''
+            INSERT OR REPLACE INTO question_index
+            (scope, question, query_hash, lat, lng, expires_at, keyword)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (scope, question, query_hash, lat, lng, expires_at.isoformat(), keyword))
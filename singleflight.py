@@ -0,0 +1,38 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """合併同一個 key 的並行請求，只讓第一個請求真正執行"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {"leaders": 0, "followers": 0}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """執行 fn 或等待同 key 正在執行的結果，回傳 (結果, 是否為共享結果)"""
+        task = self._inflight.get(key)
+        shared = task is not None
+
+        if shared:
+            self.stats["followers"] += 1
+            print(f"🔗 合併進行中的請求: {key}")
+        else:
+            self.stats["leaders"] += 1
+            # 以獨立 Task 執行，避免領頭請求斷線時連帶取消其他等待者
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+
+        # shield: 單一等待者被取消時不影響共享的 Task
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 讀取例外，避免所有等待者都已離開時出現 "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,164 @@
+import time
+from datetime import timedelta
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from geo import geohash_encode, geohash_neighbors, haversine, precision_for_distance
+from metrics import SPATIAL_INDEX_REQUESTS
+from places import PlaceStore
+
+# 建立索引的 geohash 精度：4 約 20-39km、5 約 5km、6 約 1.2km
+INDEX_PRECISIONS = (4, 5, 6)
+# 搜尋範圍紀錄的有效期限，過期後改回即時搜尋（新開的店才會被加入）
+COVERAGE_TTL = timedelta(hours=6)
+# 查詢範圍可略超出已搜尋範圍的比例
+COVERAGE_SLACK_FRACTION = 0.1
+COVERAGE_PER_KEYWORD_MAX = 200
+INDEX_PLACES_MAX = 50000
+
+
+class Coverage(NamedTuple):
+    """某個關鍵字已向 Google Maps 搜尋過的圓形範圍"""
+    lat: float
+    lng: float
+    radius: float
+    created_at: float
+    # 範圍內的結果是否已全部取得（沒有剩餘分頁）
+    complete: bool
+    count: int
+
+
+class SpatialIndex:
+    """以 geohash 分桶的已知餐廳索引，已搜尋過的範圍直接在本機回答"""
+
+    def __init__(self, places: PlaceStore):
+        self.places = places
+        self._cells: Dict[Tuple[int, str], Set[str]] = {}
+        self._points: Dict[str, Tuple[float, float]] = {}
+        self._keywords: Dict[str, Set[str]] = {}
+        self._coverage: Dict[str, List[Coverage]] = {}
+        self.stats = {"local": 0, "uncovered": 0, "insufficient": 0, "indexed": 0}
+
+    def add(self, keyword: str, lat: float, lng: float, radius: float, restaurants: List[Dict], complete: bool):
+        """記錄一次即時搜尋的範圍與結果"""
+        for r in restaurants:
+            place_id = r.get("place_id")
+            if not place_id or r.get("lat") is None or r.get("lng") is None:
+                continue
+            self._insert(place_id, r["lat"], r["lng"])
+            self._keywords.setdefault(place_id, set()).add(keyword)
+
+        now = time.time()
+        ttl = COVERAGE_TTL.total_seconds()
+        coverage = [c for c in self._coverage.get(keyword, []) if now - c.created_at <= ttl]
+        coverage.append(Coverage(lat, lng, radius, now, complete, len(restaurants)))
+        self._coverage[keyword] = coverage[-COVERAGE_PER_KEYWORD_MAX:]
+
+    def query(self, keyword: str, lat: float, lng: float, radius: float, max_results: int) -> Optional[List[Dict]]:
+        """範圍已被搜尋過且資料足夠時回傳本機結果，否則回傳 None 改用即時搜尋"""
+        coverage = self._covering(keyword, lat, lng, radius)
+        if coverage is None:
+            self._count("uncovered")
+            return None
+
+        place_ids = []
+        for place_id in self._candidates(lat, lng, radius):
+            if keyword not in self._keywords.get(place_id, ()):
+                continue
+            point_lat, point_lng = self._points[place_id]
+            if haversine(lat, lng, point_lat, point_lng) <= radius:
+                place_ids.append(place_id)
+
+        # 原本的搜尋還有下一頁時，只有數量足夠才能確定不會漏掉結果
+        if not coverage.complete and len(place_ids) < max_results:
+            self._count("insufficient")
+            return None
+
+        places = self.places.get_many(place_ids)
+        if len(places) < len(place_ids):
+            # place store 已清除部分餐廳，無法完整回答
+            self._count("insufficient")
+            return None
+
+        now = time.time()
+        restaurants = []
+        for place_id in place_ids:
+            place, _ = self.places.view(places[place_id], now, source="local_index")
+            restaurants.append(place)
+        self._count("local")
+        return restaurants
+
+    def snapshot(self) -> Dict:
+        return {
+            **self.stats,
+            "places": len(self._points),
+            "cells": len(self._cells),
+            "coverage_records": sum(len(c) for c in self._coverage.values()),
+            "keywords": len(self._coverage),
+        }
+
+    def _count(self, result: str):
+        self.stats[result] += 1
+        SPATIAL_INDEX_REQUESTS.inc(result=result)
+
+    def _covering(self, keyword: str, lat: float, lng: float, radius: float) -> Optional[Coverage]:
+        """找出完整包含查詢範圍且仍有效的搜尋紀錄，優先使用已取得全部結果的紀錄"""
+        now = time.time()
+        ttl = COVERAGE_TTL.total_seconds()
+        best = None
+        for c in self._coverage.get(keyword, ()):
+            if now - c.created_at > ttl:
+                continue
+            if haversine(lat, lng, c.lat, c.lng) + radius > c.radius * (1 + COVERAGE_SLACK_FRACTION):
+                continue
+            if best is None or (c.complete, c.created_at) > (best.complete, best.created_at):
+                best = c
+        return best
+
+    def _candidates(self, lat: float, lng: float, radius: float) -> Set[str]:
+        """查詢範圍附近 3x3 格子內的 place_id"""
+        precision = min(precision_for_distance(lat, radius), INDEX_PRECISIONS[-1])
+        if precision < INDEX_PRECISIONS[0]:
+            # 範圍比最粗的格子還大，直接逐一比對
+            return set(self._points)
+        candidates: Set[str] = set()
+        for cell in geohash_neighbors(lat, lng, precision):
+            candidates.update(self._cells.get((precision, cell), ()))
+        return candidates
+
+    def _insert(self, place_id: str, lat: float, lng: float):
+        if place_id in self._points:
+            if self._points[place_id] == (lat, lng):
+                return
+            keywords = self._keywords.get(place_id)
+            self._remove(place_id)
+            if keywords:
+                self._keywords[place_id] = keywords
+        elif len(self._points) >= INDEX_PLACES_MAX:
+            # 移除最早加入的餐廳，包含它的搜尋範圍也不再完整
+            evicted = next(iter(self._points))
+            self._drop_coverage(*self._points[evicted])
+            self._remove(evicted)
+
+        self._points[place_id] = (lat, lng)
+        for precision in INDEX_PRECISIONS:
+            self._cells.setdefault((precision, geohash_encode(lat, lng, precision)), set()).add(place_id)
+        self.stats["indexed"] += 1
+
+    def _drop_coverage(self, lat: float, lng: float):
+        for keyword, coverage in list(self._coverage.items()):
+            kept = [c for c in coverage if haversine(lat, lng, c.lat, c.lng) > c.radius]
+            if kept:
+                self._coverage[keyword] = kept
+            else:
+                del self._coverage[keyword]
+
+    def _remove(self, place_id: str):
+        lat, lng = self._points.pop(place_id)
+        self._keywords.pop(place_id, None)
+        for precision in INDEX_PRECISIONS:
+            key = (precision, geohash_encode(lat, lng, precision))
+            cell = self._cells.get(key)
+            if cell is not None:
+                cell.discard(place_id)
+                if not cell:
+                    del self._cells[key]
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# 測試使用暫存的快取資料庫，不動到專案目錄下的 cache.db（需在匯入 db 之前設定）
+os.environ.setdefault("CACHE_DB", str(Path(tempfile.mkdtemp()) / "cache.db"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from admission import (AdmissionController, AdmissionRejected, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE,
+                       PRIORITY_NORMAL)
+
+
+def test_released_slot_goes_to_highest_priority():
+    async def scenario():
+        gate = AdmissionController(max_concurrency=1, max_queue=5, max_wait=5)
+        order = []
+
+        async def request(name, priority):
+            async with gate.slot(priority):
+                order.append(name)
+
+        await gate.acquire()
+        tasks = [asyncio.create_task(request("background", PRIORITY_BACKGROUND)),
+                 asyncio.create_task(request("normal", PRIORITY_NORMAL)),
+                 asyncio.create_task(request("interactive", PRIORITY_INTERACTIVE))]
+        await asyncio.sleep(0)
+        assert gate.snapshot()["waiting"] == 3
+        gate.release()
+        await asyncio.gather(*tasks)
+        return order, gate.snapshot()
+
+    order, snapshot = asyncio.run(scenario())
+    assert order == ["interactive", "normal", "background"]
+    assert snapshot["active"] == 0 and snapshot["waiting"] == 0
+
+
+def test_full_queue_preempts_lower_priority():
+    async def scenario():
+        gate = AdmissionController(max_concurrency=1, max_queue=1, max_wait=5)
+        await gate.acquire()
+        background = asyncio.create_task(gate.acquire(PRIORITY_BACKGROUND))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(gate.acquire(PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as e:
+            await background
+        assert e.value.reason == "preempted"
+
+        # 佇列已滿且沒有更低優先權的等待者：拒絕自己
+        with pytest.raises(AdmissionRejected) as e:
+            await gate.acquire(PRIORITY_BACKGROUND)
+        assert e.value.reason == "queue_full"
+
+        gate.release()
+        await interactive
+        gate.release()
+        return gate.snapshot()
+
+    snapshot = asyncio.run(scenario())
+    assert snapshot["rejected"] == 2 and snapshot["active"] == 0
+
+
+def test_wait_past_deadline_is_rejected():
+    async def scenario():
+        gate = AdmissionController(max_concurrency=1, max_queue=5, max_wait=0.05)
+        await gate.acquire()
+        with pytest.raises(AdmissionRejected) as e:
+            await gate.acquire(PRIORITY_NORMAL)
+        assert e.value.reason == "deadline"
+        # 逾時退出佇列後名額仍可正常歸還
+        gate.release()
+        await gate.acquire()
+        gate.release()
+        return gate.snapshot()
+
+    snapshot = asyncio.run(scenario())
+    assert snapshot["waiting"] == 0 and snapshot["active"] == 0
+
+
+def test_estimated_wait_rejects_immediately():
+    async def scenario():
+        gate = AdmissionController(max_concurrency=1, max_queue=5, max_wait=1)
+        async with gate.slot():
+            pass
+        gate._avg_service_time = 10
+        await gate.acquire()
+        with pytest.raises(AdmissionRejected) as e:
+            await gate.acquire(PRIORITY_NORMAL)
+        assert e.value.reason == "deadline"
+        return gate.snapshot()
+
+    assert asyncio.run(scenario())["waiting"] == 0
+
+
+def test_queues_when_running_slot_is_almost_done():
+    async def scenario():
+        gate = AdmissionController(max_concurrency=1, max_queue=5, max_wait=5)
+        gate._avg_service_time = 30
+        release = asyncio.Event()
+
+        async def running():
+            async with gate.slot():
+                await release.wait()
+
+        task = asyncio.create_task(running())
+        await asyncio.sleep(0)
+        # 執行中的請求已跑了 28 秒，預估 2 秒後空出，不應直接拒絕
+        token = next(iter(gate._running))
+        gate._running[token] -= 28
+        assert gate.estimated_wait(0) < 5
+        assert gate.estimated_wait(1) > 5
+
+        waiter = asyncio.create_task(gate.acquire(PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0)
+        assert gate.snapshot()["waiting"] == 1
+        release.set()
+        await asyncio.gather(task, waiter)
+        gate.release()
+        return gate.snapshot()
+
+    snapshot = asyncio.run(scenario())
+    assert snapshot["rejected"] == 0 and snapshot["active"] == 0
@@ -0,0 +1,45 @@
+from geo import (geohash_cell_size, geohash_encode, geohash_neighbors, haversine, precision_for_distance,
+                 radius_bucket, snap_point)
+
+# 台北車站
+LAT, LNG = 25.0478, 121.5170
+
+
+def test_geohash_encode_known_value():
+    assert geohash_encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert geohash_encode(LAT, LNG, 7).startswith(geohash_encode(LAT, LNG, 5))
+
+
+def test_neighbors_surround_cell():
+    cells = geohash_neighbors(LAT, LNG, 6)
+    assert cells[0] == geohash_encode(LAT, LNG, 6)
+    assert len(cells) == 9 and len(set(cells)) == 9
+    # 相鄰格子中的點也在鄰居清單內
+    height, width = geohash_cell_size(LAT, 6)
+    assert geohash_encode(LAT + height / 111320, LNG, 6) in cells
+
+
+def test_precision_for_distance():
+    for distance in (100, 500, 2000, 10000):
+        precision = precision_for_distance(LAT, distance)
+        assert min(geohash_cell_size(LAT, precision)) >= distance
+        if precision < 9:
+            assert min(geohash_cell_size(LAT, precision + 1)) < distance
+    assert precision_for_distance(LAT, 10 ** 8) == 1
+
+
+def test_snap_point():
+    assert snap_point(LAT, LNG, 200) == snap_point(LAT + 0.0001, LNG + 0.0001, 200)
+    assert snap_point(LAT, LNG, 200) != snap_point(LAT + 0.01, LNG, 200)
+
+
+def test_radius_bucket():
+    assert radius_bucket(300) == 300
+    assert radius_bucket(301) == 500
+    assert radius_bucket(1200) == 1500
+    assert radius_bucket(10 ** 6) == 50000
+
+
+def test_haversine():
+    assert haversine(LAT, LNG, LAT, LNG) == 0
+    assert 1100 < haversine(LAT, LNG, LAT + 0.01, LNG) < 1120
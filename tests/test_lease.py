@@ -0,0 +1,14 @@
+from db import try_acquire_lease
+
+
+def test_single_holder():
+    assert try_acquire_lease("test-single", "a", 60)
+    assert not try_acquire_lease("test-single", "b", 60)
+    # 持有者可續約
+    assert try_acquire_lease("test-single", "a", 60)
+
+
+def test_expired_lease_is_taken_over():
+    assert try_acquire_lease("test-expired", "a", -1)
+    assert try_acquire_lease("test-expired", "b", 60)
+    assert not try_acquire_lease("test-expired", "a", 60)
@@ -0,0 +1,148 @@
+import pytest
+
+from cache import CACHE_REUSE_FRACTION, QueryCache, cache_partition
+from db import write_queue
+from geo import METERS_PER_DEGREE, haversine
+
+LAT, LNG = 22.9971, 120.2127
+RADIUS = 1000
+MAX_DISTANCE = 1000 * CACHE_REUSE_FRACTION
+
+
+@pytest.fixture
+def cache():
+    return QueryCache()
+
+
+def _response(name: str):
+    return {"recommendation": name, "restaurants": [], "metadata": {"mode": "llm"}, "timestamp": name}
+
+
+def _same_cell_point(cache, keyword, min_distance):
+    """同一個 geohash 格子內、距離 (LAT, LNG) 至少 min_distance 的點"""
+    _, cells, _ = cache.cache_key(keyword, LAT, LNG, RADIUS, 5)
+    for step in range(1, 200):
+        for dlat, dlng in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            lat = LAT + dlat * step * 10 / METERS_PER_DEGREE
+            lng = LNG + dlng * step * 10 / METERS_PER_DEGREE
+            if haversine(LAT, LNG, lat, lng) > min_distance and cache.cache_key(keyword, lat, lng, RADIUS, 5)[1][0] == cells[0]:
+                return lat, lng
+    pytest.skip("找不到同格子的測試點")
+
+
+def test_nearby_point_reuses_entry(cache):
+    cache.set("拉麵", "A", LAT, LNG, RADIUS, 5, _response("A"))
+    write_queue.flush()
+    lat = LAT + 100 / METERS_PER_DEGREE
+    hit = cache.lookup("拉麵", lat, LNG, RADIUS, 5)
+    assert hit is not None and hit.data["recommendation"] == "A"
+
+
+def test_far_point_in_same_cell_misses_memory_and_disk(cache):
+    cache.set("火鍋", "A", LAT, LNG, RADIUS, 5, _response("A"))
+    lat, lng = _same_cell_point(cache, "火鍋", MAX_DISTANCE * 1.5)
+    assert cache.lookup("火鍋", lat, lng, RADIUS, 5) is None
+
+    write_queue.flush()
+    cache.memory.clear()
+    assert cache.lookup("火鍋", lat, lng, RADIUS, 5) is None
+
+
+def test_points_in_same_cell_do_not_overwrite(cache):
+    lat, lng = _same_cell_point(cache, "咖哩", MAX_DISTANCE * 1.5)
+    cache.set("咖哩", "A", LAT, LNG, RADIUS, 5, _response("A"))
+    cache.set("咖哩", "B", lat, lng, RADIUS, 5, _response("B"))
+    write_queue.flush()
+    cache.memory.clear()
+    assert cache.lookup("咖哩", LAT, LNG, RADIUS, 5).data["recommendation"] == "A"
+    assert cache.lookup("咖哩", lat, lng, RADIUS, 5).data["recommendation"] == "B"
+
+
+def test_different_max_results_misses(cache):
+    cache.set("壽司", "A", LAT, LNG, RADIUS, 5, _response("A"))
+    assert cache.lookup("壽司", LAT, LNG, RADIUS, 10) is None
+
+
+def _clear(cache):
+    write_queue.flush()
+    cache.conn.execute("DELETE FROM cache")
+    cache.conn.commit()
+
+
+def _evict_one(cache):
+    rows = cache.conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+    cache.evict(max_rows=rows - 1)
+    return {row[0] for row in cache.conn.execute("SELECT keyword FROM cache")}
+
+
+def test_evicts_least_recently_used(cache):
+    _clear(cache)
+    for keyword in ("舊", "中", "新"):
+        cache.set(keyword, "A", LAT, LNG, RADIUS, 5, _response(keyword))
+    write_queue.flush()
+    # 最早寫入的項目剛被讀取過，應保留
+    cache.memory.clear()
+    assert cache.lookup("舊", LAT, LNG, RADIUS, 5) is not None
+    cache.flush_access()
+    write_queue.flush()
+    assert _evict_one(cache) == {"舊", "新"}
+
+
+def test_refresh_keeps_access_record(cache):
+    cache.set("更新", "A", LAT, LNG, RADIUS, 5, _response("1"))
+    write_queue.flush()
+    cache.lookup("更新", LAT, LNG, RADIUS, 5)
+    cache.flush_access()
+    cache.set("更新", "A", LAT, LNG, RADIUS, 5, _response("2"))
+    write_queue.flush()
+    hit_count, accessed_at = cache.conn.execute(
+        "SELECT hit_count, last_accessed_at FROM cache WHERE keyword = ?", ("更新",)
+    ).fetchone()
+    assert hit_count == 1 and accessed_at is not None
+
+
+def test_nearby_hit_records_access_on_served_row(cache):
+    cache.set("餃子", "A", LAT, LNG, RADIUS, 5, _response("A"))
+    write_queue.flush()
+    lat = LAT + 150 / METERS_PER_DEGREE
+    for _ in range(2):
+        hit = cache.lookup("餃子", lat, LNG, RADIUS, 5)
+        assert hit.query_hash == cache.cache_key("餃子", LAT, LNG, RADIUS, 5)[0]
+    cache.flush_access()
+    write_queue.flush()
+    hit_count, accessed_at = cache.conn.execute(
+        "SELECT hit_count, last_accessed_at FROM cache WHERE keyword = ?", ("餃子",)
+    ).fetchone()
+    assert hit_count == 2 and accessed_at is not None
+
+
+def test_legacy_created_at_is_normalized(cache):
+    _clear(cache)
+    cache.set("新", "A", LAT, LNG, RADIUS, 5, _response("新"))
+    write_queue.flush()
+    # 舊版資料：UTC、空白分隔，字串比較時會被排在同一天的本地 ISO 時間之前
+    cache.conn.execute(
+        "INSERT INTO cache (query_hash, keyword, response, created_at, expires_at) "
+        "VALUES ('legacy', '舊版', '{}', datetime('now', '+1 hour'), '9999-12-31T00:00:00')"
+    )
+    cache.conn.commit()
+    assert _evict_one(cache) == {"舊版"}
+
+
+def test_fragments_cached_separately(cache):
+    fragments = {**_response("片段"), "metadata": {"mode": "fragments"}}
+    cache.set("早午餐", "A", LAT, LNG, RADIUS, 5, fragments, question="想吃早午餐")
+    write_queue.flush()
+    assert cache.lookup("早午餐", LAT, LNG, RADIUS, 5, question="想吃早午餐") is None
+    hit = cache.lookup("早午餐", LAT, LNG, RADIUS, 5, question="想吃早午餐", mode="fragments")
+    assert hit is not None and hit.data["recommendation"] == "片段"
+
+
+def test_brief_answers_cached_by_detail(cache):
+    brief = {**_response("簡短"), "metadata": {"mode": "llm", "detail": "brief"}}
+    cache.set("牛排", "A", LAT, LNG, RADIUS, 5, brief)
+    write_queue.flush()
+    assert cache.lookup("牛排", LAT, LNG, RADIUS, 5) is None
+    assert cache.lookup("牛排", LAT, LNG, RADIUS, 5, mode=cache_partition("llm", "standard")) is None
+    hit = cache.lookup("牛排", LAT, LNG, RADIUS, 5, mode=cache_partition("llm", "brief"))
+    assert hit is not None and hit.data["recommendation"] == "簡短"
@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from resilience import (CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, Deadline, DeadlineExceeded,
+                        stage_timeout)
+
+
+def _tripped(reset_timeout: float = 60) -> CircuitBreaker:
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=reset_timeout)
+    breaker.allow()
+    breaker.record_failure()
+    breaker.allow()
+    breaker.record_failure()
+    return breaker
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.allow()
+        breaker.record_failure()
+    # 成功會重設連續失敗次數
+    breaker.record_success()
+    for _ in range(2):
+        breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN and breaker.is_open()
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    assert breaker.stats["rejected"] == 1
+
+
+def test_half_open_probe_closes_on_success():
+    breaker = _tripped(reset_timeout=0.05)
+    time.sleep(0.06)
+    assert not breaker.is_open()
+    breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # 探測進行中，其他請求仍被拒絕
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.allow()
+
+
+def test_half_open_probe_failure_reopens():
+    breaker = _tripped(reset_timeout=0.05)
+    time.sleep(0.06)
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN and breaker.is_open()
+    assert breaker.stats["opened"] == 2
+
+
+def test_deadline_limits_stage_timeout():
+    deadline = Deadline(0.5)
+    assert stage_timeout(None, 10) == 10
+    assert stage_timeout(deadline, 10) <= 0.5
+    assert deadline.child(30).at == deadline.at
+    with pytest.raises(DeadlineExceeded):
+        Deadline(-1).timeout(10)
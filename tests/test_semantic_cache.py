@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from semantic_cache import SEMANTIC_THRESHOLD, HashingVectorizer, SemanticIndex, is_negated, mentions_positively
+
+LAT, LNG = 22.9971, 120.2127
+
+
+@pytest.fixture
+def index():
+    return SemanticIndex()
+
+
+def _add(index, scope, question, keyword, query_hash="cached"):
+    index.add(question, keyword, query_hash, LAT, LNG, scope, datetime.now() + timedelta(hours=1))
+
+
+def _score(a, b):
+    vectorizer = HashingVectorizer()
+    return vectorizer.similarity(vectorizer.transform(a), vectorizer.transform(b))
+
+
+@pytest.mark.parametrize("cached, question, keyword", [
+    ("想吃便宜的拉麵", "想吃平價拉麵", "拉麵"),
+    ("附近的咖啡店", "咖啡廳推薦", "咖啡"),
+    ("安靜的咖啡廳", "安靜咖啡廳有嗎", "咖啡"),
+])
+def test_paraphrase_hits(index, cached, question, keyword):
+    _add(index, "hit", cached, keyword)
+    match = index.find(question, keyword, LAT, LNG, ["hit"], 250)
+    assert match is not None and match[0] == "cached"
+
+
+def test_different_keyword_misses(index):
+    # 「午餐」與「早午餐」只差一字，字面相似度仍有 0.78
+    _add(index, "lunch", "推薦早午餐", "早午餐")
+    assert index.find("推薦午餐", "午餐", LAT, LNG, ["lunch"], 250) is None
+
+
+def test_keyword_compared_after_normalization(index):
+    # 無法辨識的問句以整句作為關鍵字，口語詞不同仍是同一個需求
+    _add(index, "ramen", "拉麵", "拉麵")
+    assert index.find("想吃拉麵", "想吃拉麵", LAT, LNG, ["ramen"], 250) is not None
+
+
+@pytest.mark.parametrize("cached, question, keyword", [
+    ("想吃甜點", "不想吃甜點", "甜點"),
+    ("辣的火鍋", "不辣的火鍋", "火鍋"),
+])
+def test_negated_question_misses(index, cached, question, keyword):
+    _add(index, "neg", cached, keyword)
+    assert index.find(question, keyword, LAT, LNG, ["neg"], 250) is None
+
+
+def test_negation_guard_needed_above_threshold():
+    # 字面相似度已超過門檻，只能靠否定語氣判斷
+    assert _score("辣的火鍋", "不辣的火鍋") >= SEMANTIC_THRESHOLD
+
+
+def test_near_miss_below_threshold():
+    assert _score("推薦午餐", "推薦早午餐") < SEMANTIC_THRESHOLD
+    assert _score("想吃牛肉麵", "想吃牛肉飯") < SEMANTIC_THRESHOLD
+
+
+def test_negation_ignores_common_words():
+    assert is_negated("不想吃甜點")
+    assert is_negated("除了火鍋以外")
+    assert not is_negated("不錯的拉麵")
+    assert not is_negated("有沒有甜點")
+
+
+def test_too_far_misses(index):
+    _add(index, "far", "想吃拉麵", "拉麵")
+    assert index.find("想吃拉麵", "拉麵", LAT + 0.01, LNG, ["far"], 250) is None
+
+
+def test_expired_entry_misses(index):
+    index.add("想吃拉麵", "拉麵", "old", LAT, LNG, "expired", datetime.now() - timedelta(seconds=1))
+    assert index.find("想吃拉麵", "拉麵", LAT, LNG, ["expired"], 250) is None
+
+
+def test_negated_word_is_not_a_keyword():
+    assert not mentions_positively("不想吃甜點", "甜點")
+    assert mentions_positively("不要甜點早午餐", "早午餐")
+    assert mentions_positively("安靜不吵咖啡廳", "咖啡")
@@ -0,0 +1,31 @@
+import threading
+
+from db import get_connection, write_queue
+
+
+def test_bad_write_does_not_stop_writer():
+    conn = get_connection()
+    with conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS write_queue_test (value INTEGER)")
+        conn.execute("DELETE FROM write_queue_test")
+    errors = write_queue.stats["errors"]
+
+    # 超出 SQLite 整數範圍時 sqlite3 拋出 OverflowError 而非 sqlite3.Error
+    write_queue.submit("INSERT INTO write_queue_test VALUES (?)", (10 ** 20,))
+    write_queue.submit("INSERT INTO write_queue_test VALUES (?)", (1,))
+    write_queue.flush()
+
+    assert write_queue.stats["errors"] == errors + 1
+    assert write_queue._thread.is_alive()
+    assert conn.execute("SELECT value FROM write_queue_test").fetchall() == [(1,)]
+
+
+def test_dead_writer_is_restarted():
+    dead = threading.Thread(target=lambda: None)
+    dead.start()
+    dead.join()
+    write_queue._thread = dead
+
+    write_queue.submit("CREATE TABLE IF NOT EXISTS write_queue_test (value INTEGER)")
+    write_queue.flush()
+    assert write_queue._thread is not dead and write_queue._thread.is_alive()
@@ -0,0 +1,210 @@
+import asyncio
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from admission import PRIORITY_BACKGROUND
+from cache import QueryCache
+from config import (WARMUP_HOURS, WARMUP_INTERVAL, WARMUP_LOOKAHEAD, WARMUP_MAX_QUERIES, WARMUP_TOKEN_BUDGET,
+                    WARMUP_TOP_N)
+from db import get_connection, try_acquire_lease, write_queue
+from metrics import WARMUP_QUERIES
+
+# 統計熱門查詢的期間
+QUERY_LOG_WINDOW = timedelta(days=14)
+# 請求量低於每小時平均的此比例時視為離峰
+QUIET_HOUR_FRACTION = 0.5
+# 多個 worker 共用 cache.db 時只由持有租約的一個執行預熱；持有者停止續約兩個週期後由其他 worker 接手
+WARMUP_LEASE = "warmup"
+WARMUP_LEASE_TTL = WARMUP_INTERVAL * 2
+
+
+class HotQuery(NamedTuple):
+    """熱門查詢：同一個快取鍵（座標格子、關鍵字、半徑級距、數量）的最近一次請求"""
+    query_hash: str
+    keyword: str
+    location: str
+    question: str
+    lat: float
+    lng: float
+    radius: int
+    max_results: int
+    hits: int
+
+
+class QueryLog:
+    """記錄使用者請求，作為預熱熱門查詢的依據"""
+
+    def __init__(self):
+        self._init_db()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """目前執行緒的 SQLite 連線"""
+        return get_connection()
+
+    def _init_db(self):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS query_log (
+                query_hash TEXT NOT NULL,
+                keyword TEXT,
+                location TEXT,
+                question TEXT,
+                lat REAL,
+                lng REAL,
+                radius INTEGER,
+                max_results INTEGER,
+                hour INTEGER,
+                requested_at REAL NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_query_log_time ON query_log(requested_at)')
+        self.conn.commit()
+
+    def record(self, keyword: str, location: str, question: str, lat: float, lng: float, radius: int, max_results: int):
+        """記錄一次請求（經由背景寫入佇列，不影響請求延遲）"""
+        query_hash, _, _ = QueryCache.cache_key(keyword, lat, lng, radius, max_results)
+        write_queue.submit(
+            'INSERT INTO query_log (query_hash, keyword, location, question, lat, lng, radius, max_results, hour, requested_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (query_hash, keyword, location, question, lat, lng, radius, max_results, datetime.now().hour, time.time())
+        )
+
+    def top(self, limit: int) -> List[HotQuery]:
+        """期間內請求次數最多的快取鍵，地點與問句取最近一次的請求"""
+        cursor = self.conn.cursor()
+        # SQLite 中與 MAX() 一起選取的欄位來自最大值所在的那一列
+        cursor.execute('''
+            SELECT query_hash, keyword, location, question, lat, lng, radius, max_results, COUNT(*), MAX(requested_at)
+            FROM query_log WHERE requested_at > ?
+            GROUP BY query_hash ORDER BY COUNT(*) DESC LIMIT ?
+        ''', (time.time() - QUERY_LOG_WINDOW.total_seconds(), limit))
+        return [HotQuery(*row[:9]) for row in cursor.fetchall()]
+
+    def hourly_counts(self) -> Dict[int, int]:
+        cursor = self.conn.cursor()
+        cursor.execute(
+            'SELECT hour, COUNT(*) FROM query_log WHERE requested_at > ? GROUP BY hour',
+            (time.time() - QUERY_LOG_WINDOW.total_seconds(),)
+        )
+        return dict(cursor.fetchall())
+
+    def is_quiet_hour(self, hour: int) -> bool:
+        """指定時段是否為離峰：有設定 WARMUP_HOURS 時以設定為準，否則依請求紀錄判斷"""
+        if WARMUP_HOURS:
+            return hour in WARMUP_HOURS
+        counts = self.hourly_counts()
+        if not counts:
+            return True
+        return counts.get(hour, 0) < sum(counts.values()) / 24 * QUIET_HOUR_FRACTION
+
+    def purge_expired(self) -> int:
+        cursor = self.conn.cursor()
+        cursor.execute('DELETE FROM query_log WHERE requested_at <= ?', (time.time() - QUERY_LOG_WINDOW.total_seconds(),))
+        self.conn.commit()
+        return cursor.rowcount
+
+
+class Warmup:
+    """以一般推薦流程預先產生熱門查詢的快取（背景優先權，受查詢數與 token 預算限制）"""
+
+    def __init__(self, recommender, query_log: QueryLog):
+        self.recommender = recommender
+        self.query_log = query_log
+        self.last_run: Dict = {}
+        self.lease_owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+
+    def needs_refresh(self, query: HotQuery) -> bool:
+        """快取不存在，或在 WARMUP_LOOKAHEAD 內就會過期"""
+        soft_expires_at = self.recommender.cache.soft_expiry(
+            query.keyword, query.lat, query.lng, query.radius, query.max_results
+        )
+        return soft_expires_at is None or soft_expires_at - time.time() < WARMUP_LOOKAHEAD
+
+    async def warm(self, question: str, location: str, radius: int, max_results: int) -> int:
+        """產生並寫入一筆快取，回傳估計使用的 token 數"""
+        keywords = self.recommender._extract_keywords(question)
+        search_keyword = keywords[0] if keywords else "餐廳"
+        result, shared = await self.recommender.get_recommendation_shared(
+            search_keyword, location, radius, max_results,
+            priority=PRIORITY_BACKGROUND, keywords=keywords
+        )
+        if not self.recommender.cacheable(result):
+            # 降級為快速推薦（LLM 忙碌或無法使用），不寫入快取也不計入預算
+            return 0
+        if not shared:
+            lat, lng = await self.recommender.locate(location)
+            await run_in_threadpool(
+                self.recommender.cache.set, search_keyword, location, lat, lng, radius, max_results, result,
+                question=question
+            )
+        # 以生成時記錄的 token 數計算；舊版結果沒有時以字數估計（繁體中文約一字一 token）
+        return result["metadata"].get("output_tokens") or len(result.get("recommendation", ""))
+
+    async def run(self, queries: List[HotQuery], max_queries: int = WARMUP_MAX_QUERIES,
+                  token_budget: int = WARMUP_TOKEN_BUDGET) -> Dict:
+        """依序預熱需要更新的查詢，用完查詢數或 token 預算即停止"""
+        start = time.time()
+        stats = {"candidates": len(queries), "warmed": 0, "skipped": 0, "failed": 0, "degraded": 0, "tokens": 0}
+        for query in queries:
+            if stats["warmed"] + stats["failed"] >= max_queries or stats["tokens"] >= token_budget:
+                break
+            if not self.needs_refresh(query):
+                stats["skipped"] += 1
+                WARMUP_QUERIES.inc(result="fresh")
+                continue
+            if self.recommender.admission.snapshot()["waiting"]:
+                # 有使用者請求在排隊，讓出 LLM
+                print("🔥 預熱暫停：LLM 佇列中有使用者請求")
+                break
+            try:
+                tokens = await self.warm(query.question, query.location, query.radius, query.max_results)
+            except HTTPException as e:
+                print(f"❌ 預熱失敗 {query.keyword} @ {query.location}: {e.detail}")
+                stats["failed"] += 1
+                WARMUP_QUERIES.inc(result="failed")
+                continue
+            if not tokens:
+                # LLM 無法使用時後續查詢也只會降級，留待下一次預熱
+                stats["degraded"] += 1
+                WARMUP_QUERIES.inc(result="degraded")
+                break
+            stats["tokens"] += tokens
+            stats["warmed"] += 1
+            WARMUP_QUERIES.inc(result="warmed")
+
+        stats["duration"] = round(time.time() - start, 1)
+        self.last_run = {"finished_at": datetime.now().isoformat(), **stats}
+        print(f"🔥 預熱完成: 更新 {stats['warmed']} 筆、略過 {stats['skipped']} 筆、失敗 {stats['failed']} 筆，約 {stats['tokens']} tokens")
+        return stats
+
+    async def run_top(self) -> Optional[Dict]:
+        """預熱請求紀錄中最熱門的查詢"""
+        queries = await run_in_threadpool(self.query_log.top, WARMUP_TOP_N)
+        if not queries:
+            return None
+        return await self.run(queries)
+
+    async def loop(self):
+        """定期在離峰時段預熱；每個 worker 都會啟動，但只有持有租約的 worker 實際執行"""
+        while True:
+            await asyncio.sleep(WARMUP_INTERVAL)
+            try:
+                self.is_leader = await run_in_threadpool(
+                    try_acquire_lease, WARMUP_LEASE, self.lease_owner, WARMUP_LEASE_TTL
+                )
+                if not self.is_leader:
+                    continue
+                if await run_in_threadpool(self.query_log.is_quiet_hour, datetime.now().hour):
+                    await self.run_top()
+            except Exception as e:
+                print(f"❌ 預熱失敗: {e}")